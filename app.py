@@ -1,10 +1,4 @@
 import streamlit as st
-from robertson.robertson_app import run as run_robertson_app
-from cognitive.cognitive_app import run as run_cognitive_app
-from mental_wealth_ambition.mental_wealth_ambition_app import (
-    run as run_mental_wealth_ambition_app,
-)
-from pcol.pcol_app import run as run_pcol_app
 
 st.set_page_config(page_title="Coding Portal")
 
@@ -12,11 +6,23 @@ tab = st.sidebar.radio(
     "Select App", ["Robertson", "Cognitive", "Mental Wealth Ambition", "PCOL"]
 )
 
+# Apps are imported only when their tab is selected, so each session pays
+# only for the models and libraries of the practice it uses
 if tab == "Robertson":
+    from robertson.robertson_app import run as run_robertson_app
+
     run_robertson_app()
 elif tab == "Cognitive":
+    from cognitive.cognitive_app import run as run_cognitive_app
+
     run_cognitive_app()
 elif tab == "Mental Wealth Ambition":
+    from mental_wealth_ambition.mental_wealth_ambition_app import (
+        run as run_mental_wealth_ambition_app,
+    )
+
     run_mental_wealth_ambition_app()
 elif tab == "PCOL":
+    from pcol.pcol_app import run as run_pcol_app
+
     run_pcol_app()
@@ -0,0 +1,245 @@
+"""
+Headless batch runner for overnight coding runs.
+
+    python batch.py robertson /path/to/pdfs --out results.xlsx --workers 4
+
+Processes every PDF in the directory with the chosen practice's pipeline and
+writes the same Excel workbook as the app, plus a JSON copy of the rows.
+Each file's status is appended to a job log next to the output
+(<out>.jobs.jsonl, see shared.job_store), so rerunning an interrupted run
+only processes the files that failed or never finished. Stage timings are
+appended to .cache/traces/spans.jsonl (TRACE_PROFILE=cprofile also profiles
+the run).
+Does not import Streamlit.
+"""
+import argparse
+import importlib
+import io
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from shared.export import dataframe_to_excel_bytes
+from shared.icd import code_set_warning
+from shared.job_queue import named_bytes
+from shared.job_store import JobStore, batch_id
+from shared.llm_cache import get_llm_cache
+from shared.llm_client import llm_metrics
+from shared.result_cache import content_hash
+from shared.tracing import file_context, span, submit, trace_batch
+
+
+def _run_robertson(files, workers, on_done):
+    from robertson.utils.data_utils import load_cpt_descriptions
+    from robertson.utils.file_utils import process_files, error_row
+
+    def done(key, res):
+        on_done(key, error_row(res) if isinstance(res, Exception) else res, res)
+
+    process_files(
+        {key: named_bytes(name, data) for key, (name, data) in files.items()},
+        load_cpt_descriptions(),
+        max_workers=workers,
+        on_done=done,
+    )
+
+
+def _run_pcol(files, workers, on_done):
+    from pcol.core.pipeline import run_batch
+    from pcol.core.utils import get_cpt_mapping
+    from pcol.core.cpt_retrieval import load_cpt_retrieval
+
+    keys = list(files)
+    load_cpt_retrieval()
+
+    def on_result(idx, record):
+        error = RuntimeError(record["error"]) if "error" in record else None
+        on_done(keys[idx], record, error or record)
+
+    run_batch(
+        [files[key] for key in keys],
+        get_cpt_mapping(),
+        concurrency=workers,
+        on_result=on_result,
+    )
+
+
+def _run_extractor(extract):
+    def run(files, workers, on_done):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                submit(executor, _in_file_context, name, extract, data): key
+                for key, (name, data) in files.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    row = future.result()
+                    on_done(key, row, row)
+                except Exception as e:
+                    # No error row for these practices; the file is reported and retried
+                    on_done(key, None, e)
+
+    return run
+
+
+def _in_file_context(name, extract, data):
+    with file_context(name):
+        return extract(data)
+
+
+def _cognitive_row(data):
+    from cognitive.utils.utils import extract_patient_info, load_pdf
+
+    with span("load"):
+        text = load_pdf(data)
+    with span("extract"):
+        return extract_patient_info(text)
+
+
+def _mwa_row(data):
+    from mental_wealth_ambition.utils.pdf_utils import load_pdf
+    from mental_wealth_ambition.utils.extract_utils import extract_session_info
+
+    with span("load"):
+        text = load_pdf(io.BytesIO(data))
+    with span("extract"):
+        return extract_session_info(text)
+
+
+def _robertson_df(rows):
+    from robertson.utils.file_utils import results_dataframe
+
+    return results_dataframe(rows)
+
+
+def _pcol_df(rows):
+    from pcol.core.pipeline import results_dataframe
+
+    return results_dataframe(rows)
+
+
+def _cognitive_df(rows):
+    from cognitive.utils.utils import get_patient_df
+
+    return get_patient_df(rows)
+
+
+def _mwa_df(rows):
+    from mental_wealth_ambition.utils.extract_utils import get_session_df
+
+    return get_session_df(rows)
+
+
+# practice -> (runner, results dataframe builder, sheet name)
+PRACTICES = {
+    "robertson": (_run_robertson, _robertson_df, "Results"),
+    "pcol": (_run_pcol, _pcol_df, "Results"),
+    "cognitive": (_run_extractor(_cognitive_row), _cognitive_df, "Cognitive Works Patients"),
+    "mental_wealth_ambition": (_run_extractor(_mwa_row), _mwa_df, "Patients"),
+}
+
+
+def pipeline_version(practice: str) -> str:
+    """The practice app's PIPELINE_VERSION; the app modules import Streamlit only in run()."""
+    return importlib.import_module(f"{practice}.{practice}_app").PIPELINE_VERSION
+
+
+def run(practice: str, input_dir: Path, out: Path, workers: int) -> int:
+    runner, to_dataframe, sheet_name = PRACTICES[practice]
+    # Same keys as the app's ResultCache, so a pipeline change starts a fresh job log
+    version = pipeline_version(practice)
+
+    pdfs = sorted(p for p in input_dir.iterdir() if p.suffix.lower() == ".pdf")
+    file_keys = []
+    files = {}
+    for path in pdfs:
+        data = path.read_bytes()
+        key = content_hash(data, version)
+        file_keys.append((path.name, key))
+        files.setdefault(key, (path.name, data))
+
+    store = JobStore(out.with_suffix(".jobs.jsonl"), batch_id(files))
+    rows_by_key = store.rows()
+    pending = {key: f for key, f in files.items() if not store.is_done(key)}
+    print(
+        f"{len(pdfs)} PDFs, {len(files) - len(pending)} already done, "
+        f"{len(pending)} to process"
+    )
+    icd_warning = code_set_warning()
+    if icd_warning:
+        print(f"WARNING {icd_warning}", file=sys.stderr)
+
+    failures = 0
+    started = time.perf_counter()
+    with trace_batch(practice) as trace, store:
+
+        def on_done(key, row, outcome):
+            nonlocal failures
+            if row is not None:
+                rows_by_key[key] = row
+            if isinstance(outcome, Exception):
+                # Logged as failed, not done, so a rerun retries the file
+                failures += 1
+                store.fail(key, outcome)
+                print(f"FAILED {files[key][0]}: {outcome}", file=sys.stderr)
+                return
+            store.finish(key, row)
+            print(f"done {files[key][0]}")
+
+        if pending:
+            for key, (name, _) in pending.items():
+                store.start(key, name)
+            runner(pending, workers, on_done)
+        store.complete()
+
+        rows = [rows_by_key[key] for _, key in file_keys if key in rows_by_key]
+        with span("export"):
+            df = to_dataframe(rows)
+            out.write_bytes(dataframe_to_excel_bytes(df, sheet_name=sheet_name))
+            with open(out.with_suffix(".json"), "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2, default=str)
+
+    print(
+        f"Wrote {len(rows)} rows to {out} in {time.perf_counter() - started:.1f}s "
+        f"({failures} failed)"
+    )
+    cache = get_llm_cache().stats()
+    if cache["lookups"]:
+        print(
+            f"LLM response cache: {cache['hits']}/{cache['lookups']} hits, "
+            f"~{cache['saved_seconds']:.1f}s saved"
+        )
+    for model, m in llm_metrics().items():
+        print(
+            f"{model}: {m['calls']} calls, {m['retries']} retries, {m['failed']} failed, "
+            f"{m['throttle_seconds']:.1f}s throttled, {m['backoff_seconds']:.1f}s backing off"
+        )
+    for stage in trace.summary():
+        print(
+            f"{stage['stage']}: {stage['count']}x, {stage['total_s']:.1f}s total, "
+            f"p95 {stage['p95_s']:.2f}s"
+        )
+    if trace.profile_path:
+        print(f"Profile saved to {trace.profile_path}")
+    return 1 if failures else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("practice", choices=sorted(PRACTICES))
+    parser.add_argument("input_dir", type=Path, help="directory of PDF notes")
+    parser.add_argument(
+        "--out", type=Path, default=None, help="output workbook (default: <practice>_results.xlsx)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="files processed in parallel")
+    args = parser.parse_args(argv)
+
+    out = args.out or Path(f"{args.practice}_results.xlsx")
+    return run(args.practice, args.input_dir, out, max(1, args.workers))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Throughput of the shared de-identification engine against the per-rule
+passes it replaced, on synthetic Robertson and PCOL notes.
+
+    python -m benchmarks.deid_benchmark [--notes 2000] [--repeat 5]
+
+Also reports how many notes the two produce different output for.
+"""
+import argparse
+import random
+import re
+import time
+
+from benchmarks.phi_benchmark import synthetic_note as robertson_note
+from robertson.utils.pdf_utils import deidentify_and_strip
+from pcol.core.utils import mask_phi
+
+
+def legacy_deidentify_and_strip(text: str) -> str:
+    cleaned_lines = []
+    for line in text.splitlines():
+        line_stripped = line.strip()
+        if not line_stripped:
+            continue
+        if re.search(r"(Patient|Clinician|Participants|Supervisor?):", line_stripped, re.IGNORECASE):
+            continue
+        if re.search(r"DOB|Date and Time:", line_stripped, re.IGNORECASE):
+            continue
+        if re.search(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}", line_stripped):
+            continue
+        if re.search(r"\d{1,2}:\d{2}\s?(AM|PM|am|pm)", line_stripped):
+            continue
+        if re.search(r"(Location|Clinic|Hospital|Center|LLC|LLP|PC)", line_stripped):
+            continue
+        if re.search(r"License|http|www|Page \d+ of \d+", line_stripped):
+            continue
+        cleaned_lines.append(line_stripped)
+    return "\n".join(cleaned_lines)
+
+
+def legacy_mask_phi(text: str) -> str:
+    text = re.sub(
+        r"^([A-Z][A-Z\s\-']+,\s*[A-Za-z][A-Za-z\s\-']+)",
+        "[PATIENT_NAME]",
+        text,
+        flags=re.MULTILINE,
+    )
+    text = re.sub(
+        r"Patient:\s*([A-Za-z ,]+?)(?:\s+Provider:|\s+DOB:)",
+        "Patient: [PATIENT_NAME]",
+        text,
+        flags=re.IGNORECASE,
+    )
+    text = re.sub(r"\bDOB:\s*\d{1,2}/\d{1,2}/\d{2,4}\b", "DOB: [DOB]", text)
+    text = re.sub(r"Age:\s*\d+\s*(?:mo|yo|y|d)", "Age: [AGE]", text, flags=re.IGNORECASE)
+    text = re.sub(r"\bAcc No\.:?\s*\d+\b", "Acc No.: [ACCOUNT_NUMBER]", text)
+    text = re.sub(r"Provider:\s*[A-Za-z ,\.]+MD", "Provider: [PROVIDER]", text)
+    text = re.sub(r"\b\d{3}-\d{3}-\d{4}\b", "[PHONE]", text)
+    text = re.sub(r"\d{1,5}\s+[A-Za-z0-9\s,.-]+, [A-Za-z\s]+, [A-Z]{2}-\d{5}", "[ADDRESS]", text)
+    text = re.sub(r"\b\d{1,2}/\d{1,2}/\d{2,4}\b", "[DATE]", text)
+    text = re.sub(r"https?://\S+", "[URL]", text)
+    return text
+
+
+_PCOL_FILLER = (
+    "Mother reports cough and congestion for three days, no fever at home. "
+    "Eating and drinking well, normal wet diapers. Lungs clear to auscultation. "
+)
+
+
+def pcol_note(rng: random.Random) -> str:
+    body = _PCOL_FILLER * rng.randint(10, 40)
+    return (
+        f"DOE{rng.randint(1, 999)}, JANE\n"
+        f"Patient: Jane Doe Provider: John Smith, MD DOB: {rng.randint(1, 12)}/"
+        f"{rng.randint(1, 28)}/20{rng.randint(10, 23)}\n"
+        f"Age: {rng.randint(1, 17)} yo Acc No.: {rng.randint(10000, 99999)}\n"
+        f"Phone: 281-{rng.randint(100, 999)}-{rng.randint(1000, 9999)}\n"
+        f"Date of service: {rng.randint(1, 12)}/{rng.randint(1, 28)}/2024\n"
+        f"Subjective\n{body}\n"
+        f"Assessment\nJ06.9 Acute upper respiratory infection\n"
+        f"Plan\nSupportive care. Return if worse. See https://example.org/uri\n"
+    )
+
+
+def measure(fn, corpus: list[str], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for note in corpus:
+            fn(note)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    cases = [
+        ("robertson", [robertson_note(rng) for _ in range(args.notes)],
+         legacy_deidentify_and_strip, deidentify_and_strip),
+        ("pcol", [pcol_note(rng) for _ in range(args.notes)], legacy_mask_phi, mask_phi),
+    ]
+    for name, corpus, legacy, current in cases:
+        megabytes = sum(len(n) for n in corpus) / 1e6
+        legacy_s = measure(legacy, corpus, args.repeat)
+        current_s = measure(current, corpus, args.repeat)
+        differing = sum(legacy(n) != current(n) for n in corpus)
+        print(
+            f"{name}: {args.notes} notes ({megabytes:.1f} MB) | per-rule passes "
+            f"{megabytes / legacy_s:.1f} MB/s | single pass {megabytes / current_s:.1f} MB/s "
+            f"({legacy_s / current_s:.1f}x) | {differing} notes differ"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Vectorized ICD extraction and validation (shared.icd) against a per-note loop.
+
+    python -m benchmarks.icd_benchmark [--notes 1000] [--repeat 5]
+
+Uses the ICD-10-CM order file when it is installed, and a synthetic code set
+otherwise.
+"""
+import argparse
+import random
+import re
+import time
+
+import pandas as pd
+
+from benchmarks.phi_benchmark import synthetic_note
+from shared.icd import ICD_PATTERN, ICDIndex, get_icd_index, icd_issues
+
+
+def synthetic_index() -> ICDIndex:
+    codes, billable = [], []
+    for letter in "ABCDEFGHIJKLMNOPQRSTVWXYZ":
+        for category in range(100):
+            codes.append(f"{letter}{category:02d}")
+            billable.append(False)
+            codes.extend(f"{letter}{category:02d}{sub}" for sub in range(10))
+            billable.extend([True] * 10)
+    return ICDIndex(codes, billable)
+
+
+def loop_issues(notes: list[str], index: ICDIndex) -> list[str]:
+    status = dict(zip(index.codes.astype(str), index.billable))
+    pattern = re.compile(ICD_PATTERN)
+    issues = []
+    for note in notes:
+        invalid, non_billable = [], []
+        for code in dict.fromkeys(pattern.findall(note)):
+            billable = status.get(code.replace(".", ""))
+            if billable is None:
+                invalid.append(code)
+            elif not billable:
+                non_billable.append(code)
+        parts = []
+        if invalid:
+            parts.append("Invalid ICD-10: " + ", ".join(invalid))
+        if non_billable:
+            parts.append("Non-billable ICD-10: " + ", ".join(non_billable))
+        issues.append(" | ".join(parts))
+    return issues
+
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    index = get_icd_index() or synthetic_index()
+    notes = [
+        synthetic_note(rng) + rng.choice(["F33\n", "F99.99 Unspecified\n", "Z71.89\n", ""])
+        for _ in range(args.notes)
+    ]
+    series = pd.Series(notes)
+
+    loop_s = measure(lambda: loop_issues(notes, index), args.repeat)
+    vector_s = measure(lambda: icd_issues(series, index), args.repeat)
+    agree = list(icd_issues(series, index)) == loop_issues(notes, index)
+    print(
+        f"{args.notes} notes: per-note loop {loop_s * 1000:.0f} ms | vectorized "
+        f"{vector_s * 1000:.0f} ms ({loop_s / vector_s:.1f}x) | same output: {agree} "
+        f"({len(index):,} codes in the index)"
+    )
+
+
+if __name__ == "__main__":
+    main()
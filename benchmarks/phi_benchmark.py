@@ -0,0 +1,62 @@
+"""
+Micro-benchmark for robertson.utils.phi_utils.get_phi over a synthetic corpus.
+
+    python -m benchmarks.phi_benchmark [--notes 2000] [--repeat 5]
+"""
+import argparse
+import random
+import time
+
+from robertson.utils.phi_utils import get_phi
+
+_FILLER = (
+    "Client reported improved sleep and fewer intrusive thoughts this week. "
+    "Discussed coping strategies and reviewed homework from the last session. "
+)
+
+
+def synthetic_note(rng: random.Random) -> str:
+    code = rng.choice(["90832", "90834", "90837", "H0004", "90791", "96130"])
+    location = rng.choice(["Office", "Telehealth - video", "Clinic Room 2"])
+    body = _FILLER * rng.randint(20, 80)
+    return (
+        f"Clinician: Jane Roe, LPC\n"
+        f"Supervisor: Sam Smith, LCSW\n"
+        f"Patient: John Doe{rng.randint(1, 999)}, DOB {rng.randint(1, 12):02d}/"
+        f"{rng.randint(1, 28):02d}/19{rng.randint(50, 99)}\n"
+        f"Date and Time: {rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2024 10:00 AM\n"
+        f"Duration: {rng.randint(15, 90)} minutes\n"
+        f"Service Code: {code}\n"
+        f"Location: {location}\n"
+        f"Interventions Used\n{body}\n"
+        f"Diagnosis\nF33.1 Major depressive disorder, recurrent, moderate\n"
+        f"F41.1 Generalized anxiety disorder\n"
+        f"Plan\nContinue weekly sessions.\n"
+    )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--notes", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    corpus = [synthetic_note(rng) for _ in range(args.notes)]
+    megabytes = sum(len(n) for n in corpus) / 1e6
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        for note in corpus:
+            get_phi(note)
+        best = min(best, time.perf_counter() - start)
+
+    print(
+        f"get_phi: {args.notes} notes ({megabytes:.1f} MB) in {best:.3f}s -> "
+        f"{args.notes / best:,.0f} notes/s, {megabytes / best:.1f} MB/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
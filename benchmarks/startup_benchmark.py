@@ -0,0 +1,68 @@
+"""
+Cold-start import time of the portal and of each practice's pipeline.
+
+    python -m benchmarks.startup_benchmark [--runs 3] [--max-seconds 5]
+
+Every module is imported in a fresh interpreter, so the numbers are what a new
+Streamlit worker pays. Exits non-zero if any module's best time exceeds
+--max-seconds, which keeps eager model loading from creeping back in.
+"""
+import argparse
+import subprocess
+import sys
+
+MODULES = [
+    "robertson.robertson_app",
+    "cognitive.cognitive_app",
+    "mental_wealth_ambition.mental_wealth_ambition_app",
+    "pcol.pcol_app",
+    "robertson.utils.file_utils",
+    "robertson.models.embeddings",
+    "pcol.core.pipeline",
+    "cognitive.utils.utils",
+    "mental_wealth_ambition.utils.extract_utils",
+]
+
+_PROBE = (
+    "import time, resource; t = time.perf_counter(); import {module}; "
+    "print(time.perf_counter() - t, "
+    "resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+)
+
+
+def measure(module: str, runs: int) -> tuple[float, int]:
+    best_time, peak_rss = float("inf"), 0
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.split()
+        best_time = min(best_time, float(out[0]))
+        peak_rss = max(peak_rss, int(out[1]))
+    return best_time, peak_rss
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+
+    slow = []
+    print(f"{'module':<52} {'import s':>9} {'max RSS MB':>11}")
+    for module in MODULES:
+        seconds, rss_kb = measure(module, args.runs)
+        print(f"{module:<52} {seconds:>9.3f} {rss_kb / 1024:>11.1f}")
+        if seconds > args.max_seconds:
+            slow.append(module)
+
+    if slow:
+        print(f"Over {args.max_seconds}s: {', '.join(slow)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,57 @@
+# Bump whenever extract_patient_info output changes so cached rows are invalidated
+PIPELINE_VERSION = "cognitive-2"
+
+
+def process_batch(job, files) -> dict:
+    """
+    Extract a batch of (name, pdf_bytes) on the background queue (see
+    shared.job_queue). Returns the session state values for the results.
+    """
+    from cognitive.utils.utils import extract_patient_info, load_pdf, get_patient_df
+    from shared.result_cache import ResultCache
+    from shared.export import dataframe_to_excel_bytes
+    from shared.job_queue import named_bytes
+    from shared.tracing import file_context, span, trace_batch
+
+    result_cache = ResultCache("cognitive", PIPELINE_VERSION)
+
+    def process(name, data):
+        with span("load"):
+            text = load_pdf(named_bytes(name, data))
+        with span("extract"):
+            return extract_patient_info(text)
+
+    patient_data = []
+    with trace_batch("cognitive") as trace:
+        for idx, (name, data) in enumerate(files, start=1):
+            job.set_message(f"📄 Processing file {idx}/{len(files)}: {name}")
+
+            with file_context(name):
+                patient_info = result_cache.get_or_compute(data, lambda: process(name, data))
+            patient_data.append(patient_info)
+            job.add_row(patient_info)
+
+        job.set_message("✅ All files processed successfully!")
+
+        with span("export"):
+            df = get_patient_df(patient_data)
+            excel = dataframe_to_excel_bytes(df, sheet_name="Cognitive Works Patients")
+    return {
+        "patient_data": patient_data,
+        "cognitive_results_df": df,
+        "cognitive_results_excel": excel,
+        "cognitive_perf_report": trace.report(),
+    }
+
+
 def run():
-    import pandas as pd
-    import io
     import streamlit as st
-    from cognitive.utils.utils import extract_patient_info, load_pdf
+    from cognitive.utils.utils import get_patient_df
+    from shared.export import dataframe_to_excel_bytes, XLSX_MIME
+    from shared.ui import batch_progress, icd_code_set_warning, performance_expander
+    from shared.job_queue import FAILED, get_job_queue
+
+    job_queue = get_job_queue()
 
     st.title("Cognitive Works")
 
@@ -14,37 +63,41 @@ def run():
     if "patient_data" not in st.session_state:
         st.session_state.patient_data = []
 
-    if uploaded_files and not st.session_state.patient_data:
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-
-        total_files = len(uploaded_files)
-
-        for idx, uploaded_file in enumerate(uploaded_files, start=1):
-            status_text.text(
-                f"📄 Processing file {idx}/{total_files}: {uploaded_file.name}"
-            )
-
-            text = load_pdf(uploaded_file)
-            patient_info = extract_patient_info(text)
-            st.session_state.patient_data.append(patient_info)
-
-            # Update progress bar after each file
-            progress = idx / total_files
-            progress_bar.progress(progress)
+    job = job_queue.get(st.session_state.get("cognitive_batch_job"))
+    if uploaded_files and not st.session_state.patient_data and job is None:
+        st.session_state.pop("cognitive_results_df", None)
+        st.session_state.pop("cognitive_perf_report", None)
+        job = job_queue.submit(
+            "cognitive",
+            process_batch,
+            [(f.name, f.getvalue()) for f in uploaded_files],
+            total=len(uploaded_files),
+        )
+        st.session_state.cognitive_batch_job = job.id
 
-        status_text.text("✅ All files processed successfully!")
+    if job is not None:
+        if job.active:
+            batch_progress(job)
+            return
+        st.session_state.pop("cognitive_batch_job")
+        if job.status == FAILED:
+            st.error(f"Batch failed: {job.error}")
+        else:
+            st.session_state.update(job.result)
 
     if st.session_state.patient_data:
         st.subheader("Results Summary")
-        df = pd.DataFrame(st.session_state.patient_data)
-        df.insert(0, "Facility Name", "Cognitive Works")
-        df = df.sort_values(by="DOS", ascending=True)
+        # Table and workbook are built once per batch, not on every rerun
+        if "cognitive_results_df" not in st.session_state:
+            df = get_patient_df(st.session_state.patient_data)
+            st.session_state.cognitive_results_df = df
+            st.session_state.cognitive_results_excel = dataframe_to_excel_bytes(
+                df, sheet_name="Cognitive Works Patients"
+            )
+        df = st.session_state.cognitive_results_df
         st.dataframe(df, width="stretch")
-
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Cognitive Works Patients")
+        icd_code_set_warning()
+        performance_expander(st.session_state.get("cognitive_perf_report"))
 
         # Ask user for filename (default provided)
         custom_filename = st.text_input(
@@ -57,7 +110,7 @@ def run():
 
         st.download_button(
             label="📥 Download Results as Excel",
-            data=buffer.getvalue(),
+            data=st.session_state.cognitive_results_excel,
             file_name=custom_filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
         )
@@ -1,37 +1,24 @@
 import re
-import pypdfium2 as pdfium
-import pytesseract
+from shared import pdf_engine
+from shared.icd import add_icd_comments
 
 from datetime import datetime
 import pandas as pd
-import PyPDF2
 
 def load_pdf(uploaded_file):
-    reader = PyPDF2.PdfReader(uploaded_file)
-    text = ""
-    for page in reader.pages:
-        text += page.extract_text() + "\n"
-    
-    if text.strip() == "":
-        # Fallback to OCR
-        text = ocr_pdf(uploaded_file)
-    return text
-
-
-def ocr_pdf(pdf_path, dpi=300, tesseract_cmd=None):
-    if tesseract_cmd:
-        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
-
-    pdf = pdfium.PdfDocument(pdf_path)
-    text_pages = []
-    scale = dpi / 72
-
-    for page in pdf:
-        bitmap = page.render(scale=scale)
-        img = bitmap.to_pil()
-        text_pages.append(pytesseract.image_to_string(img, config="--psm 6"))
-
-    return "\n".join(text_pages)
+    # Text layer where present, OCR only for scanned pages
+    return pdf_engine.extract_text(uploaded_file)
+
+
+def ocr_pdf(
+    pdf_path,
+    dpi=pdf_engine.DEFAULT_DPI,
+    tesseract_cmd=None,
+    max_workers=pdf_engine.DEFAULT_WORKERS,
+):
+    return pdf_engine.ocr_pdf(
+        pdf_path, dpi=dpi, max_workers=max_workers, tesseract_cmd=tesseract_cmd
+    )
 
 def extract_icd10_from_assessment(text: str) -> list:
     """
@@ -199,6 +186,7 @@ def extract_patient_info(text: str) -> dict:
 
 def get_patient_df(patients_data):
     phi_df = pd.DataFrame(patients_data)
-    
+    phi_df = add_icd_comments(phi_df, "ICD Codes")
+
     phi_df.insert(0, "Facility Name", "Cognitive Works")
-    return phi_df
\ No newline at end of file
+    return phi_df.sort_values(by="DOS", ascending=True)
\ No newline at end of file
@@ -1,9 +1,61 @@
+# Bump whenever extract_session_info output changes so cached rows are invalidated
+PIPELINE_VERSION = "mwa-1"
+
+
+def process_batch(job, files) -> dict:
+    """
+    Extract a batch of (name, pdf_bytes) on the background queue (see
+    shared.job_queue). Returns the session state values for the results.
+    """
+    from mental_wealth_ambition.utils.pdf_utils import load_pdf
+    from mental_wealth_ambition.utils.extract_utils import (
+        extract_session_info,
+        get_session_df,
+    )
+    from shared.result_cache import ResultCache
+    from shared.export import dataframe_to_excel_bytes
+    from shared.job_queue import named_bytes
+    from shared.tracing import file_context, span, trace_batch
+
+    result_cache = ResultCache("mental_wealth_ambition", PIPELINE_VERSION)
+
+    def process(name, data):
+        with span("load"):
+            text = load_pdf(named_bytes(name, data))
+        with span("extract"):
+            return extract_session_info(text)
+
+    patient_data = []
+    with trace_batch("mental_wealth_ambition") as trace:
+        for idx, (name, data) in enumerate(files, start=1):
+            job.set_message(f"Processing file {idx}/{len(files)}: {name}")
+
+            with file_context(name):
+                patient_info = result_cache.get_or_compute(data, lambda: process(name, data))
+            patient_data.append(patient_info)
+            job.add_row(patient_info)
+
+        job.set_message("All files processed successfully!")
+
+        with span("export"):
+            df = get_session_df(patient_data)
+            excel = dataframe_to_excel_bytes(df, sheet_name="Patients")
+    return {
+        "patient_data": patient_data,
+        "mwa_results_df": df,
+        "mwa_results_excel": excel,
+        "mwa_perf_report": trace.report(),
+    }
+
+
 def run():
     import streamlit as st
-    import pandas as pd
-    import io
-    from mental_wealth_ambition.utils.pdf_utils import load_pdf
-    from mental_wealth_ambition.utils.extract_utils import extract_session_info
+    from mental_wealth_ambition.utils.extract_utils import get_session_df
+    from shared.export import dataframe_to_excel_bytes, XLSX_MIME
+    from shared.ui import batch_progress, icd_code_set_warning, performance_expander
+    from shared.job_queue import FAILED, get_job_queue
+
+    job_queue = get_job_queue()
 
     st.title("Mental Wealth Ambition")
 
@@ -14,33 +66,41 @@ def run():
     if "patient_data" not in st.session_state:
         st.session_state.patient_data = []
 
-    if uploaded_files and not st.session_state.patient_data:
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        total_files = len(uploaded_files)
-
-        for idx, uploaded_file in enumerate(uploaded_files, start=1):
-            status_text.text(f"Processing file {idx}/{total_files}: {uploaded_file.name}")
-
-            text = load_pdf(uploaded_file)
-            patient_info = extract_session_info(text)
-            st.session_state.patient_data.append(patient_info)
-
-            progress_bar.progress(idx / total_files)
+    job = job_queue.get(st.session_state.get("mwa_batch_job"))
+    if uploaded_files and not st.session_state.patient_data and job is None:
+        st.session_state.pop("mwa_results_df", None)
+        st.session_state.pop("mwa_perf_report", None)
+        job = job_queue.submit(
+            "mental_wealth_ambition",
+            process_batch,
+            [(f.name, f.getvalue()) for f in uploaded_files],
+            total=len(uploaded_files),
+        )
+        st.session_state.mwa_batch_job = job.id
 
-        status_text.text("All files processed successfully!")
+    if job is not None:
+        if job.active:
+            batch_progress(job)
+            return
+        st.session_state.pop("mwa_batch_job")
+        if job.status == FAILED:
+            st.error(f"Batch failed: {job.error}")
+        else:
+            st.session_state.update(job.result)
 
     if st.session_state.patient_data:
         st.subheader("Results Summary")
-        df = pd.DataFrame(st.session_state.patient_data)
-        df["Date"] = pd.to_datetime(df["Date"], format="%m/%d/%Y")
-        df = df.sort_values(by="Date", ascending=False)
-        df["Date"] = df["Date"].dt.strftime("%m/%d/%y")
+        # Table and workbook are built once per batch, not on every rerun
+        if "mwa_results_df" not in st.session_state:
+            df = get_session_df(st.session_state.patient_data)
+            st.session_state.mwa_results_df = df
+            st.session_state.mwa_results_excel = dataframe_to_excel_bytes(
+                df, sheet_name="Patients"
+            )
+        df = st.session_state.mwa_results_df
         st.dataframe(df, width="stretch")
-
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Patients")
+        icd_code_set_warning()
+        performance_expander(st.session_state.get("mwa_perf_report"))
 
         filename = st.text_input(
             "Enter filename for Excel download:",
@@ -51,7 +111,7 @@ def run():
 
         st.download_button(
             label="Download Results as Excel",
-            data=buffer.getvalue(),
+            data=st.session_state.mwa_results_excel,
             file_name=filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
         )
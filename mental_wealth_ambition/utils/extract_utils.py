@@ -1,4 +1,7 @@
 import re
+import pandas as pd
+
+from shared.icd import add_icd_comments
 
 
 def extract_dos(text):
@@ -98,3 +101,14 @@ def extract_session_info(text):
         "Modifier": modifier,
         "Comments": "",
     }
+
+
+def get_session_df(sessions):
+    df = pd.DataFrame(sessions)
+    # Every ICD is in Coding, after the last "--"
+    df["_icds"] = df["Coding"].str.rsplit("--", n=1).str[-1]
+    df = add_icd_comments(df, "_icds").drop(columns="_icds")
+    df["Date"] = pd.to_datetime(df["Date"], format="%m/%d/%Y")
+    df = df.sort_values(by="Date", ascending=False)
+    df["Date"] = df["Date"].dt.strftime("%m/%d/%y")
+    return df
@@ -0,0 +1,116 @@
+import re
+from typing import Dict, List
+
+# Subcategory -> wording in a note that makes its codes plausible. A
+# subcategory without a pattern is always kept.
+SUBCATEGORY_PATTERNS = {
+    "Preventive Visits": (
+        r"well[- ]?(?:child|baby|visit|check|exam)|preventive|routine (?:physical|exam|check)"
+        r"|annual (?:physical|exam)|physical exam(?:ination)? for|check[- ]?up|\bwcc\b|\bwcv\b"
+    ),
+    "Minor Procedures and Treatments": (
+        r"sutur|cauteri|silver nitrate|irrigat|lavage|cerumen|ear wax|injection|injected"
+        r"|\bIM\b|intramuscular|subcutaneous|nebuli[sz]|albuterol|duoneb|xopenex|breathing treatment"
+        r"|athletic|sports? (?:physical|eval)"
+    ),
+    "Urine Testing": r"urinalysis|\bUA\b|urine|dipstick|pregnancy test|\bhcg\b",
+    "Infectious Disease Testing": (
+        r"rapid|strep|influenza|\bflu\b|\brsv\b|covid|sars|antigen|swab"
+    ),
+    "Screening and Assessments": (
+        r"\bppd\b|\btb\b|tubercul|mantoux|developmental|\basq\b|m-?chat|screening|risk assessment"
+        r"|tobacco|smok|vap(?:e|ing)|nicotine"
+    ),
+    "Vaccine Administration": (
+        r"vaccin|immuni[sz]|\bvis\b|\bdose\b|counsel(?:ed|ing) on (?:vaccine|immuni)"
+    ),
+    "Influenza Vaccines": r"influenza|\bflu\b|flu(?:zone|arix|laval|mist|celvax|blok)",
+    "Respiratory and Pneumococcal Vaccines": (
+        r"\brsv\b|nirsevimab|beyfortus|pneumococcal|prevnar|vaxneuvance|\bpcv\s?\d*"
+    ),
+    "Routine Childhood and Adolescent Vaccines": (
+        r"vaccin|immuni[sz]|mening|hep(?:atitis)?[ -]?[ab]\b|\bhib\b|\bhpv\b|gardasil|rota"
+        r"|dtap|tdap|\bipv\b|polio|\bmmr|varicella|proquad|pediarix|pentacel|vaxelis|kinrix"
+        r"|quadracel|boostrix|adacel|engerix|recombivax|havrix|vaqta|menveo|menquadfi|bexsero|trumenba"
+    ),
+    "Nutrition Therapy": (
+        r"nutrition|dietitian|dietician|diet(?:ary)? counsel|\bmnt\b|weight management|obesity counsel"
+    ),
+    "Injectable and Oral Medications": (
+        r"ceftriaxone|rocephin|dexamethasone|decadron|promethazine|phenergan|prednisone"
+        r"|given in (?:the )?(?:office|clinic)|administered in (?:the )?(?:office|clinic)"
+    ),
+}
+
+# Large subcategories are also pruned code by code. Codes without a pattern
+# are kept whenever their subcategory is.
+CODE_PATTERNS = {
+    "90619": r"menveo|menquadfi|mening\w* (?:acwy|conjugate)|\bmcv4\b|\bmenacwy",
+    "90620": r"bexsero|men\s?b\b|mening\w* b\b",
+    "90621": r"trumenba|men\s?b\b|mening\w* b\b",
+    "90633": r"hep(?:atitis)?[ -]?a\b|havrix|vaqta",
+    "90647": r"\bhib\b|pedvaxhib|prp-?omp",
+    "90648": r"\bhib\b|acthib|hiberix|prp-?t\b",
+    "90649": r"\bhpv\b|gardasil|papilloma",
+    "90651": r"\bhpv\b|gardasil|papilloma",
+    "90680": r"rota|rotateq",
+    "90681": r"rota|rotarix",
+    "90696": r"kinrix|quadracel|dtap-?ipv",
+    "90697": r"vaxelis",
+    "90698": r"pentacel",
+    "90700": r"dtap|daptacel|infanrix",
+    "90707": r"\bmmr|m-?m-?r\b|measles",
+    "90710": r"proquad|mmrv",
+    "90713": r"\bipv\b|ipol|polio",
+    "90715": r"tdap|boostrix|adacel",
+    "90716": r"varicella|varivax|chicken\s?pox",
+    "90734": r"menveo|menquadfi|mening|\bmcv4\b",
+    "90744": r"hep(?:atitis)?[ -]?b\b|engerix|recombivax|pediarix",
+    "90746": r"hep(?:atitis)?[ -]?b\b|engerix|recombivax|heplisav",
+}
+
+_SUBCATEGORY_RES = {
+    name: re.compile(pattern, re.IGNORECASE) for name, pattern in SUBCATEGORY_PATTERNS.items()
+}
+_CODE_RES = {code: re.compile(pattern, re.IGNORECASE) for code, pattern in CODE_PATTERNS.items()}
+
+
+def _prune_codes(masked_text: str, codes: List[dict], referenced: set) -> List[dict]:
+    hits = {
+        entry.get("CPT")
+        for entry in codes
+        if entry.get("CPT") in _CODE_RES and _CODE_RES[entry.get("CPT")].search(masked_text)
+    }
+    if not hits:
+        # Nothing specific matched; let the model choose from the whole list
+        return codes
+    return [
+        entry
+        for entry in codes
+        if entry.get("CPT") in hits
+        or entry.get("CPT") in referenced
+        or entry.get("CPT") not in _CODE_RES
+    ]
+
+
+def prune_subtree(
+    masked_text: str, allowed_subtree: Dict, referenced_cpts: List[str]
+) -> Dict:
+    """
+    Drop subcategories (and codes) of the allowed subtree that nothing in the
+    note points to. A subcategory is kept if its wording appears in the note
+    or the note references one of its CPTs. A predicted category where
+    nothing matches is kept whole, since the category model already judged
+    it billable.
+    """
+    referenced = set(referenced_cpts or [])
+    pruned = {}
+    for category, subtree in allowed_subtree.items():
+        kept = {}
+        for subcategory, codes in subtree.items():
+            pattern = _SUBCATEGORY_RES.get(subcategory)
+            is_referenced = any(entry.get("CPT") in referenced for entry in codes)
+            if pattern is None or is_referenced or pattern.search(masked_text):
+                kept[subcategory] = _prune_codes(masked_text, codes, referenced)
+        pruned[category] = kept or subtree
+    return pruned
@@ -0,0 +1,90 @@
+import os
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from shared.registry import get_embedder
+from shared.vector_index import VectorIndex, load_index, rerank
+from .utils import read_cpt_mapping
+
+CPT_INDEX_DIR = Path("pcol/data/cpt_index")
+# Embedding every note is costly on top of keyword pruning, so narrowing by
+# the index is opt-in: PCOL_CPT_RETRIEVAL=1
+RETRIEVAL_ENABLED = os.getenv("PCOL_CPT_RETRIEVAL", "0") == "1"
+# CPTs kept per note when narrowing the allowed subtree
+DEFAULT_TOP_K = 15
+
+
+def flatten_cpt_tree(normalized_mapping: dict) -> List[dict]:
+    items = []
+    for category, subtree in normalized_mapping.items():
+        for subcategory, codes in subtree.items():
+            for entry in codes:
+                items.append(
+                    {
+                        "category": category,
+                        "subcategory": subcategory,
+                        "cpt": entry.get("CPT"),
+                        "text": f"{subcategory}: {entry.get('Description', '')}",
+                    }
+                )
+    return items
+
+
+def build_cpt_index(
+    normalized_mapping: dict = None, directory: Path = CPT_INDEX_DIR
+) -> VectorIndex:
+    if normalized_mapping is None:
+        normalized_mapping = read_cpt_mapping()
+    index = VectorIndex.build(flatten_cpt_tree(normalized_mapping))
+    index.save(directory)
+    return index
+
+
+def load_cpt_retrieval(directory: Path = CPT_INDEX_DIR) -> VectorIndex | None:
+    """
+    The CPT index with its embedder loaded, once per process; None when
+    retrieval is off or no index is built. Called at startup so the first
+    note doesn't pay for loading the embedding model.
+    """
+    if not RETRIEVAL_ENABLED:
+        return None
+    index = load_index(directory)
+    if index is not None:
+        get_embedder()
+    return index
+
+
+def narrow_subtree(
+    masked_text: str,
+    allowed_subtree: Dict,
+    referenced_cpts: List[str],
+    k: int = DEFAULT_TOP_K,
+    directory: Path = CPT_INDEX_DIR,
+) -> Dict:
+    """
+    Keep only the k CPTs of the allowed subtree that best match the note,
+    plus any CPT the note references itself. Returns the subtree unchanged
+    when retrieval is off (the default) or no prebuilt index exists.
+    """
+    index = load_cpt_retrieval(directory)
+    if index is None:
+        return allowed_subtree
+
+    mask = np.array([item["category"] in allowed_subtree for item in index.items])
+    hits = rerank(masked_text, index.search_text(masked_text, k=k * 2, mask=mask))[:k]
+    keep = {item["cpt"] for _, item in hits} | set(referenced_cpts or [])
+
+    narrowed = {}
+    for category, subtree in allowed_subtree.items():
+        for subcategory, codes in subtree.items():
+            kept = [entry for entry in codes if entry.get("CPT") in keep]
+            if kept:
+                narrowed.setdefault(category, {})[subcategory] = kept
+    return narrowed or allowed_subtree
+
+
+if __name__ == "__main__":
+    built = build_cpt_index()
+    print(f"Saved {len(built.items)} CPTs to {CPT_INDEX_DIR}")
@@ -1,16 +1,25 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from .em_selection import select_em_cpt, ALLOWED_EM_CODES
+import asyncio
+from shared.llm_client import estimate_tokens
+from shared.prompt_cache import compile_template, get_prompt_model, render_template
+from shared.tracing import span
+from .em_selection import select_em_cpt, aselect_em_cpt, ALLOWED_EM_CODES
 from .utils import is_holiday
 from .extractors import extract_cpt_codes
+from .cpt_retrieval import narrow_subtree
+from .cpt_pruning import prune_subtree
 from .models import TopLevelCategory, SOAPCategoryPrediction, CPTSelection
 from typing import List, Dict
-from dotenv import load_dotenv
 
-load_dotenv()
+MODEL_NAME = "gemini-2.5-flash"
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
-categories_prediction_llm = llm.with_structured_output(SOAPCategoryPrediction)
-cpt_selection_llm = llm.with_structured_output(CPTSelection)
+
+# Clients are created on first use (see shared.registry)
+def get_categories_llm():
+    return get_prompt_model(SOAPCategoryPrediction, MODEL_NAME, temperature=0)
+
+
+def get_cpt_selection_llm():
+    return get_prompt_model(CPTSelection, MODEL_NAME, temperature=0)
 
 
 CATEGORIES_PREDICTION_PROMPT = """
@@ -69,15 +78,15 @@ STRICT DEFINITIONS (follow exactly):
 - Examples: after-hours services (99051), reporting, billing modifiers.
 - Do NOT include for routine visit documentation alone.
 
-SOAP note:
-\"\"\"
-{soap_note}
-\"\"\"
-
 Return output strictly as valid JSON matching the provided schema.
 - Do NOT include explanations
 - Do NOT include extra keys
 - Do NOT include categories not in the allowed list
+
+SOAP note:
+\"\"\"
+{soap_note}
+\"\"\"
 """
 
 
@@ -92,15 +101,6 @@ Do NOT guess.
 Do NOT invent codes.
 If documentation is ambiguous or incomplete, DO NOT select the CPT.
 
-SOAP note:
-{soap_note}
-
-Allowed CPT codes:
-{allowed_cpts}
-
-CPT codes already appearing in SOAP (consider as likely candidates, include only if rules are met):
-{referenced_cpts}
-
 CRITICAL RULES (must follow):
 
 1. TEMPORAL RULES
@@ -134,22 +134,31 @@ Return JSON:
     {{ "cpt": "12345", "description": "Example Description" }}
   ]
 }}
+
+Allowed CPT codes:
+{allowed_cpts}
+
+CPT codes already appearing in SOAP (consider as likely candidates, include only if rules are met):
+{referenced_cpts}
+
+SOAP note:
+{soap_note}
 """
 
 
-def build_categories_prompt(soap_note: str) -> str:
-    from langchain_core.prompts import PromptTemplate
+ALLOWED_CATEGORIES = [c.value for c in TopLevelCategory]
 
-    allowed_categories = [c.value for c in TopLevelCategory]
+# Templates are parsed once; building a prompt is plain concatenation. All
+# per-note fields come last so the text before them can be cached.
+_CATEGORIES_TEMPLATE = compile_template(
+    CATEGORIES_PREDICTION_PROMPT,
+    allowed_categories="\n- " + "\n- ".join(ALLOWED_CATEGORIES),
+)
+_CPT_SELECTION_TEMPLATE = compile_template(CPT_SELECTION_PROMPT)
 
-    prompt_template = PromptTemplate(
-        input_variables=["soap_note", "allowed_categories"],
-        template=CATEGORIES_PREDICTION_PROMPT,
-    )
 
-    return prompt_template.format(
-        soap_note=soap_note, allowed_categories="\n- " + "\n- ".join(allowed_categories)
-    )
+def build_categories_prompt(soap_note: str) -> str:
+    return render_template(_CATEGORIES_TEMPLATE, soap_note=soap_note)
 
 
 def serialize_cpt_tree(tree: dict, indent: int = 0) -> str:
@@ -168,58 +177,152 @@ def serialize_cpt_tree(tree: dict, indent: int = 0) -> str:
     return "\n".join(result)
 
 
-def build_cpt_selection_prompt(
-    soap_note: str, allowed_subtree: Dict, referenced_cpts: List[str]
-) -> str:
-    from langchain_core.prompts import PromptTemplate
+_category_lists: dict = {}
+
 
-    allowed_subtree_str = serialize_cpt_tree(allowed_subtree)
+def serialize_categories(categories: frozenset, normalized_mapping: dict) -> str:
+    """
+    serialize_cpt_tree of the whole mapping restricted to `categories`,
+    memoized on the category set, so each selection is serialized once per
+    process however the model ordered it.
+    """
+    key = (id(normalized_mapping), categories)
+    hit = _category_lists.get(key)
+    if hit is None or hit[0] is not normalized_mapping:
+        if len(_category_lists) >= 1024:
+            _category_lists.clear()
+        text = serialize_cpt_tree(_allowed_subtree(categories, normalized_mapping))
+        hit = _category_lists[key] = (normalized_mapping, text)
+    return hit[1]
 
-    return PromptTemplate(
-        input_variables=["soap_note", "allowed_cpts", "referenced_cpts"],
-        template=CPT_SELECTION_PROMPT,
-    ).format(
+
+def build_cpt_selection_prompt(
+    soap_note: str, allowed_cpts: str, referenced_cpts: List[str]
+) -> str:
+    return render_template(
+        _CPT_SELECTION_TEMPLATE,
         soap_note=soap_note,
-        allowed_cpts=allowed_subtree_str,
+        allowed_cpts=allowed_cpts,
         referenced_cpts="\n".join(referenced_cpts or []),
     )
 
 
+def _predicted_categories(predicted_categories: list[str], normalized_mapping: dict) -> frozenset:
+    return frozenset(cat for cat in predicted_categories if cat in normalized_mapping)
+
+
+def _allowed_subtree(categories: frozenset, normalized_mapping: dict) -> dict:
+    # Mapping order, so the same categories always give the same prompt text
+    return {cat: subtree for cat, subtree in normalized_mapping.items() if cat in categories}
+
+
+def candidate_cpt_list(
+    masked_text: str,
+    categories: frozenset,
+    normalized_mapping: dict,
+    referenced_cpts: list[str],
+    stats: dict | None = None,
+) -> str:
+    """
+    The CPT list for the selection prompt: the predicted categories pruned by
+    keyword and referenced-CPT hits, then narrowed with the CPT index when
+    PCOL_CPT_RETRIEVAL=1 and one is built. When nothing was pruned the memoized category list is used.
+    `stats`, if given, receives the estimated prompt tokens of the CPT list
+    before and after.
+    """
+    allowed_subtree = _allowed_subtree(categories, normalized_mapping)
+    with span("cpt_candidates"):
+        candidates = prune_subtree(masked_text, allowed_subtree, referenced_cpts)
+        candidates = narrow_subtree(masked_text, candidates, referenced_cpts)
+        full_list = serialize_categories(categories, normalized_mapping)
+        unpruned = candidates.keys() == allowed_subtree.keys() and all(
+            candidates[cat] is allowed_subtree[cat] for cat in allowed_subtree
+        )
+        cpt_list = full_list if unpruned else serialize_cpt_tree(candidates)
+    if stats is not None:
+        stats["cpt_list_tokens"] = estimate_tokens(full_list)
+        stats["pruned_cpt_list_tokens"] = estimate_tokens(cpt_list)
+        stats["prompt_tokens_saved"] = (
+            stats["cpt_list_tokens"] - stats["pruned_cpt_list_tokens"]
+        )
+    return cpt_list
+
+
+def _add_holiday_code(selected: list[str], service_date: str) -> None:
+    try:
+        if is_holiday(service_date) and "99051" not in selected:
+            selected.append("99051")
+    except Exception as e:
+        print(f"Error checking holiday for service date {service_date!r}: {e}")
+
+
+def _needs_em_code(predicted_categories: list[str]) -> bool:
+    return TopLevelCategory.OFFICE_AND_PATIENT_VISITS.value.lower() in predicted_categories
+
+
 def select_cpts(
     masked_text: str,
     predicted_categories: list[str],
     normalized_mapping: dict,
     service_date: str,
+    stats: dict | None = None,
 ) -> list[str]:
-    # Extract allowed CPT subtree
-    extracted_tree = {
-        cat: normalized_mapping[cat]
-        for cat in predicted_categories
-        if cat in normalized_mapping
-    }
-    if not extracted_tree:
+    # Categories of the CPT mapping the note was classified into
+    categories = _predicted_categories(predicted_categories, normalized_mapping)
+    if not categories:
         return []
 
     referenced_cpts = extract_cpt_codes(masked_text)
-    selected = []
+    cpt_list = candidate_cpt_list(
+        masked_text, categories, normalized_mapping, referenced_cpts, stats
+    )
+    # LLM failures propagate (after retries in shared.llm_client) so the
+    # file is reported as failed rather than saved with missing codes
+    cpt_prompt = build_cpt_selection_prompt(masked_text, cpt_list, referenced_cpts)
+    results_obj = get_cpt_selection_llm().invoke(cpt_prompt)
+    selected = [item["cpt"] for item in results_obj.selected_cpt_codes if "cpt" in item]
 
-    try:
-        cpt_prompt = build_cpt_selection_prompt(
-            masked_text, extracted_tree, referenced_cpts
-        )
-        results_obj = cpt_selection_llm.invoke(cpt_prompt)
-        selected = [
-            item["cpt"] for item in results_obj.selected_cpt_codes if "cpt" in item
-        ]
+    if _needs_em_code(predicted_categories):
+        em_code = select_em_cpt(masked_text, ALLOWED_EM_CODES, referenced_cpts, stats)
+        if em_code:
+            selected.append(em_code)
 
-        if TopLevelCategory.OFFICE_AND_PATIENT_VISITS.value.lower() in predicted_categories:
-            em_code = select_em_cpt(masked_text, ALLOWED_EM_CODES)
-            if em_code:
-                selected.append(em_code)
+    _add_holiday_code(selected, service_date)
+    return selected
 
-        if is_holiday(service_date) and "99051" not in selected:
-            selected.append("99051")
-    except Exception as e:
-        print(f"Error during CPT selection: {e}")
 
-    return selected
\ No newline at end of file
+async def aselect_cpts(
+    masked_text: str,
+    predicted_categories: list[str],
+    normalized_mapping: dict,
+    service_date: str,
+    stats: dict | None = None,
+) -> list[str]:
+    """Async select_cpts; the E/M call runs alongside the CPT selection call."""
+    categories = _predicted_categories(predicted_categories, normalized_mapping)
+    if not categories:
+        return []
+
+    referenced_cpts = extract_cpt_codes(masked_text)
+    # Pruning (and embedding the note, when retrieval is on) is CPU work; keep it off the event loop
+    cpt_list = await asyncio.to_thread(
+        candidate_cpt_list, masked_text, categories, normalized_mapping, referenced_cpts, stats
+    )
+    cpt_prompt = build_cpt_selection_prompt(masked_text, cpt_list, referenced_cpts)
+
+    calls = [get_cpt_selection_llm().ainvoke(cpt_prompt)]
+    if _needs_em_code(predicted_categories):
+        calls.append(aselect_em_cpt(masked_text, ALLOWED_EM_CODES, referenced_cpts, stats))
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            # Fail the file rather than save it with missing codes
+            raise result
+
+    results_obj = results[0]
+    selected = [item["cpt"] for item in results_obj.selected_cpt_codes if "cpt" in item]
+    if len(results) > 1 and results[1]:
+        selected.append(results[1])
+
+    _add_holiday_code(selected, service_date)
+    return selected
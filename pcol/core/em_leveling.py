@@ -0,0 +1,326 @@
+"""
+Local E/M leveling from medical decision making (2021 office visit rules).
+
+Scores the three MDM elements from the note text:
+
+- problems: number and complexity of the problems in the Assessment
+- data: unique tests ordered/resulted, records reviewed, independent historian
+- risk: prescription drug management, OTC-only care, escalation of care
+
+The visit level is the second highest of the three (two of three elements
+must meet it). Well-child visits with minor acute complaints are always
+99213, as the E/M prompt requires. Every level comes with a confidence;
+callers send low-confidence notes to the LLM instead.
+"""
+import re
+from dataclasses import dataclass, field
+
+# MDM levels
+MINIMAL, LOW, MODERATE, HIGH = 1, 2, 3, 4
+MDM_NAMES = {MINIMAL: "straightforward", LOW: "low", MODERATE: "moderate", HIGH: "high"}
+
+NEW_PATIENT_CODES = {MINIMAL: "99202", LOW: "99203", MODERATE: "99204", HIGH: "99205"}
+ESTABLISHED_PATIENT_CODES = {MINIMAL: "99212", LOW: "99213", MODERATE: "99214", HIGH: "99215"}
+PREVENTIVE_WITH_PROBLEM_CODE = "99213"
+
+_FLAGS = re.IGNORECASE | re.MULTILINE
+
+_ASSESSMENT_RE = re.compile(
+    r"^[ \t]*(?:assessments?(?:\s*(?:and|&|/)\s*plan)?|a/p|impression|diagnos[ie]s)\s*:"
+    r"(.*?)"
+    r"(?=^[ \t]*(?:plan|treatment|procedure codes|preventive medicine|immunizations?"
+    r"|follow[ -]?up|orders|labs?|return|provider|disposition|patient education|visit codes)\s*:|\Z)",
+    _FLAGS | re.DOTALL,
+)
+_PLAN_RE = re.compile(
+    r"^[ \t]*(?:plan|treatment|medications? (?:prescribed|ordered)|orders|rx)\s*:(.*?)"
+    r"(?=^[ \t]*(?:procedure codes|preventive medicine|follow[ -]?up|provider|visit codes)\s*:|\Z)",
+    _FLAGS | re.DOTALL,
+)
+_ICD_RE = re.compile(r"\b([A-TV-Z]\d{2}(?:\.[0-9A-Z]{1,4})?)\b")
+_PROBLEM_LINE_RE = re.compile(r"^[ \t]*(?:\d+[.)]|[-*•])\s*(.+)$", re.MULTILINE)
+
+# ICD-10 prefixes that are not problems addressed (well visits, vaccines, screening, BMI)
+_NON_PROBLEM_ICD = ("Z00", "Z01", "Z02", "Z13", "Z23", "Z68", "Z71", "Z76", "Z28")
+_PREVENTIVE_RE = re.compile(
+    r"well[- ]?(?:child|baby|visit|check)|preventive (?:visit|care|exam)|\bwcc\b|\bwcv\b"
+    r"|routine (?:child|infant) health|\bZ00\.[01]",
+    re.IGNORECASE,
+)
+
+_MINOR_ICD = ("J00", "L22", "H61.2", "L20.83", "W57", "T14", "B08.1", "L21", "Z20")
+_MINOR_RE = re.compile(
+    r"common cold|diaper (?:rash|dermatitis)|insect bite|cerumen|cradle cap|mild|minor|self[- ]limit",
+    re.IGNORECASE,
+)
+_CHRONIC_ICD = (
+    "J45", "J30", "L20", "F90", "F41", "F32", "F33", "F84", "E66", "K21", "K59.0",
+    "G40", "E10", "E11", "I10", "Q", "N39.44", "R62.5",
+)
+_CHRONIC_RE = re.compile(
+    r"asthma|adhd|attention deficit|eczema|atopic derm|allergic rhinitis|obesity|anxiety"
+    r"|depress|autism|gerd|reflux|epilep|seizure disorder|diabet|hypertension|chronic",
+    re.IGNORECASE,
+)
+_EXACERBATION_RE = re.compile(
+    r"exacerbat|worsen|flare|uncontrolled|not (?:well )?controlled|poorly controlled|progress",
+    re.IGNORECASE,
+)
+_SYSTEMIC_ICD = ("J09", "J10", "J11", "U07.1", "J12", "J18", "J21", "E86", "A08", "A09", "B34.2")
+_SYSTEMIC_RE = re.compile(
+    r"influenza|\bflu\b|covid|pneumonia|bronchiolitis|dehydrat|gastroenteritis"
+    r"|body aches|myalgia|letharg",
+    re.IGNORECASE,
+)
+# Fever next to an otherwise uncomplicated illness is borderline systemic
+_FEVER_RE = re.compile(r"\bfever|febrile|\bR50", re.IGNORECASE)
+# Return precautions ("go to the ER if...") are routine and deliberately not matched
+_HIGH_RISK_RE = re.compile(
+    r"\b(?:sent|send(?:ing)?|transfer(?:red)?|direct(?:ed|ly)?)\s+(?:the\s+)?(?:pt|patient|child)?\s*to\s+(?:the\s+)?"
+    r"(?:er|ed|emergency|hospital)\b|hospitali[sz]|admi(?:t|tted|ssion) to|sepsis|respiratory distress|anaphyla",
+    re.IGNORECASE,
+)
+
+_NEW_PATIENT_RE = re.compile(r"\bnew (?:patient|pt)\b|\bnew to (?:the )?(?:practice|clinic)", re.IGNORECASE)
+_ESTABLISHED_RE = re.compile(r"\bestablished (?:patient|pt)\b", re.IGNORECASE)
+_WELL_VISIT_ICD = ("Z00.0", "Z00.1")
+_PREVENTIVE_CPT_RE = re.compile(r"^993(?:8[1-7]|9[1-7])$")
+
+_HISTORIAN_RE = re.compile(
+    r"\b(?:per|by|from|with|accompanied by|reports? by|according to)\s+(?:the\s+|his\s+|her\s+)?"
+    r"(?:mother|mom|father|dad|parents?|guardian|grand(?:mother|father|ma|pa)|caregiver|aunt|foster)",
+    re.IGNORECASE,
+)
+_EXTERNAL_RECORDS_RE = re.compile(
+    r"(?:review(?:ed)?|obtained)\s+(?:outside|external|prior|er|ed|hospital|specialist)\s+(?:records?|notes?|reports?)",
+    re.IGNORECASE,
+)
+# Unique in-office or ordered tests, by name
+_TEST_RES = {
+    "strep": re.compile(r"rapid strep|strep (?:test|screen|a)|throat culture", re.IGNORECASE),
+    "flu": re.compile(r"(?:rapid )?flu (?:test|a|b|swab)|influenza (?:test|a|b)", re.IGNORECASE),
+    "covid": re.compile(r"covid(?:-19)? (?:test|swab|pcr|antigen|positive|negative)", re.IGNORECASE),
+    "rsv": re.compile(r"\brsv (?:test|swab|positive|negative)", re.IGNORECASE),
+    "urinalysis": re.compile(r"urinalysis|\bUA\b|urine dip", re.IGNORECASE),
+    "urine culture": re.compile(r"urine culture", re.IGNORECASE),
+    "pregnancy": re.compile(r"pregnancy test|urine hcg", re.IGNORECASE),
+    "cbc": re.compile(r"\bcbc\b|complete blood count", re.IGNORECASE),
+    "metabolic panel": re.compile(r"\b[bc]mp\b|metabolic panel", re.IGNORECASE),
+    "lead": re.compile(r"\blead (?:level|screen|test)", re.IGNORECASE),
+    "hemoglobin": re.compile(r"\bh(?:gb|emoglobin)\b", re.IGNORECASE),
+    "x-ray": re.compile(r"x-?ray|\bcxr\b|radiograph", re.IGNORECASE),
+    "ultrasound": re.compile(r"ultrasound|\bus of\b", re.IGNORECASE),
+}
+_LAB_CPTS = {"87880": "strep", "87804": "flu", "87428": "covid", "87807": "rsv",
+             "81002": "urinalysis", "81003": "urinalysis", "81025": "pregnancy"}
+
+_NEW_RX_RE = re.compile(
+    r"^[ \t]*(?:start(?:ed)?|begin|prescribed?|rx|new rx|e-?prescribed|sent to pharmacy)\b"
+    r"|\b(?:start(?:ed)?|prescribed?|e-?prescribed|rx sent)\b\s+(?:on\s+)?[A-Za-z]",
+    _FLAGS,
+)
+_RX_CHANGE_RE = re.compile(
+    r"\b(?:increas|decreas|adjust|titrat|switch|chang|discontinu|stopp?)\w*\s+(?:the\s+|her\s+|his\s+)?"
+    r"(?:dose|dosage|medications?|meds?|to|from)\b",
+    re.IGNORECASE,
+)
+_REFILL_RE = re.compile(r"\b(?:continue|refill|refilled|renew)\b", re.IGNORECASE)
+_OTC_RE = re.compile(
+    r"\b(?:tylenol|acetaminophen|motrin|ibuprofen|advil|saline|honey|humidifier|zyrtec|cetirizine"
+    r"|claritin|loratadine|benadryl|diphenhydramine|hydrocortisone cream|vaseline|aquaphor|fluids|rest)\b",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class Problem:
+    text: str
+    icd: str | None
+    kind: str  # minor, acute, systemic, stable_chronic, chronic_exacerbation, preventive
+
+
+@dataclass
+class EMLevel:
+    code: str | None
+    confidence: float
+    new_patient: bool
+    mdm: str
+    problem_level: int
+    data_level: int
+    risk_level: int
+    problems: list[Problem] = field(default_factory=list)
+    reasons: list[str] = field(default_factory=list)
+
+
+def _section(pattern: re.Pattern, text: str) -> str | None:
+    match = pattern.search(text)
+    return match.group(1) if match else None
+
+
+def _starts_with(code: str | None, prefixes) -> bool:
+    return bool(code) and code.startswith(tuple(prefixes))
+
+
+def classify_problem(line: str) -> Problem:
+    icd_match = _ICD_RE.search(line)
+    icd = icd_match.group(1) if icd_match else None
+
+    if _starts_with(icd, _NON_PROBLEM_ICD) or (not icd and _PREVENTIVE_RE.search(line)):
+        kind = "preventive"
+    elif _starts_with(icd, _CHRONIC_ICD) or _CHRONIC_RE.search(line):
+        kind = "chronic_exacerbation" if _EXACERBATION_RE.search(line) else "stable_chronic"
+    elif _starts_with(icd, _SYSTEMIC_ICD) or _SYSTEMIC_RE.search(line):
+        kind = "systemic"
+    elif _starts_with(icd, _MINOR_ICD) or _MINOR_RE.search(line):
+        kind = "minor"
+    else:
+        kind = "acute"
+    return Problem(line.strip(), icd, kind)
+
+
+def extract_problems(assessment: str) -> list[Problem]:
+    lines = [m.group(1) for m in _PROBLEM_LINE_RE.finditer(assessment)]
+    if not lines:
+        # Unnumbered assessments: one diagnosis per line that carries a code
+        lines = [line for line in assessment.splitlines() if _ICD_RE.search(line)]
+
+    problems, seen = [], set()
+    for line in lines:
+        problem = classify_problem(line)
+        key = problem.icd or problem.text.lower()
+        if key not in seen:
+            seen.add(key)
+            problems.append(problem)
+    return problems
+
+
+def problem_level(problems: list[Problem]) -> int:
+    kinds = [p.kind for p in problems if p.kind != "preventive"]
+    if not kinds:
+        return MINIMAL
+    if "chronic_exacerbation" in kinds or "systemic" in kinds or kinds.count("stable_chronic") >= 2:
+        return MODERATE
+    if "stable_chronic" in kinds or "acute" in kinds or kinds.count("minor") >= 2:
+        return LOW
+    return MINIMAL
+
+
+def unique_tests(text: str, referenced_cpts: list[str]) -> set[str]:
+    tests = {name for name, pattern in _TEST_RES.items() if pattern.search(text)}
+    tests.update(_LAB_CPTS[c] for c in referenced_cpts if c in _LAB_CPTS)
+    return tests
+
+
+def data_level(text: str, referenced_cpts: list[str]) -> tuple[int, list[str]]:
+    tests = unique_tests(text, referenced_cpts)
+    historian = bool(_HISTORIAN_RE.search(text))
+    external = bool(_EXTERNAL_RECORDS_RE.search(text))
+
+    items = len(tests) + historian + external
+    reasons = [f"tests: {', '.join(sorted(tests))}"] if tests else []
+    if historian:
+        reasons.append("independent historian")
+    if external:
+        reasons.append("external records reviewed")
+
+    if items >= 3:
+        return MODERATE, reasons
+    if items >= 2 or historian:
+        return LOW, reasons
+    return MINIMAL, reasons
+
+
+def risk_level(plan: str) -> tuple[int, list[str]]:
+    if _HIGH_RISK_RE.search(plan):
+        return HIGH, ["escalation of care"]
+    if _NEW_RX_RE.search(plan) or _RX_CHANGE_RE.search(plan):
+        return MODERATE, ["prescription drug management"]
+    if _REFILL_RE.search(plan):
+        # The E/M rules ignore routine refills unless they clearly affect MDM
+        return LOW, ["medication refill only"]
+    if _OTC_RE.search(plan):
+        return LOW, ["OTC / supportive care"]
+    return MINIMAL, []
+
+
+def is_new_patient(text: str, referenced_cpts: list[str]) -> bool | None:
+    """True/False when the note says so, None when it doesn't."""
+    if _NEW_PATIENT_RE.search(text) or any(c.startswith("9920") for c in referenced_cpts):
+        return True
+    if _ESTABLISHED_RE.search(text) or any(c.startswith("9921") for c in referenced_cpts):
+        return False
+    return None
+
+
+def is_well_visit(problems: list[Problem], referenced_cpts: list[str]) -> bool:
+    return any(
+        _starts_with(p.icd, _WELL_VISIT_ICD) or (not p.icd and _PREVENTIVE_RE.search(p.text))
+        for p in problems
+    ) or any(_PREVENTIVE_CPT_RE.match(c) for c in referenced_cpts)
+
+
+def level_em(masked_text: str, referenced_cpts: list[str] | None = None) -> EMLevel:
+    """Score the note's MDM and pick an office E/M code with a confidence in [0, 1]."""
+    referenced_cpts = referenced_cpts or []
+    reasons = []
+    confidence = 1.0
+
+    assessment = _section(_ASSESSMENT_RE, masked_text)
+    if assessment is None:
+        reasons.append("no Assessment section")
+        confidence *= 0.3
+        assessment = ""
+    plan = _section(_PLAN_RE, masked_text) or ""
+    if not plan:
+        # Combined "Assessment and Plan" or an unstructured note
+        plan = assessment
+        confidence *= 0.85
+
+    problems = extract_problems(assessment)
+    if not problems:
+        reasons.append("no problems found in Assessment")
+        confidence *= 0.3
+
+    if any(p.kind in ("minor", "acute") and _FEVER_RE.search(p.text) for p in problems):
+        reasons.append("fever (borderline systemic symptoms)")
+        confidence *= 0.85
+
+    p_level = problem_level(problems)
+    d_level, data_reasons = data_level(masked_text, referenced_cpts)
+    r_level, risk_reasons = risk_level(plan)
+    reasons += data_reasons + risk_reasons
+
+    if r_level == HIGH or any(_HIGH_RISK_RE.search(p.text) for p in problems):
+        reasons.append("possible high-complexity visit")
+        confidence *= 0.4
+
+    # Two of three elements must meet the level
+    mdm = sorted((p_level, d_level, r_level), reverse=True)[1]
+    if max(p_level, d_level, r_level) - min(p_level, d_level, r_level) >= 2:
+        reasons.append("MDM elements disagree")
+        confidence *= 0.85
+
+    new_patient = is_new_patient(masked_text, referenced_cpts)
+    if new_patient is None:
+        new_patient = False
+        confidence *= 0.9
+
+    addressed = [p for p in problems if p.kind != "preventive"]
+    if is_well_visit(problems, referenced_cpts):
+        if addressed and all(p.kind in ("minor", "acute") for p in addressed):
+            # Minor acute complaints during a well-child visit are always 99213
+            return EMLevel(
+                PREVENTIVE_WITH_PROBLEM_CODE, min(confidence, 0.95), new_patient, "low",
+                p_level, d_level, r_level, problems,
+                reasons + ["well-child visit with minor acute complaint"],
+            )
+        # Nothing separately addressed, or a chronic/systemic problem alongside
+        # the well visit: leave it to the model
+        reasons.append("preventive visit")
+        confidence *= 0.4
+
+    codes = NEW_PATIENT_CODES if new_patient else ESTABLISHED_PATIENT_CODES
+    return EMLevel(
+        codes[mdm], round(confidence, 3), new_patient, MDM_NAMES[mdm],
+        p_level, d_level, r_level, problems, reasons,
+    )
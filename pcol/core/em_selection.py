@@ -1,9 +1,14 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
+from shared.prompt_cache import compile_template, get_prompt_model, render_template
+from shared.tracing import span
 from .utils import norm
+from .em_leveling import level_em
+from functools import lru_cache
+import os
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
 
-load_dotenv()
+MODEL_NAME = "gemini-2.5-flash"
+# Notes the local MDM engine levels with less confidence than this go to the LLM
+EM_CONFIDENCE_THRESHOLD = float(os.getenv("PCOL_EM_CONFIDENCE", 0.7))
 
 ALLOWED_EM_CODES = [
     {"cpt": "99201", "description": "Office visit for a new patient, level 1"},
@@ -23,9 +28,9 @@ class EMSelection(BaseModel):
         ..., description="Selected E/M (Evaluation & Management) code for the encounter"
     )
 
-llm = ChatGoogleGenerativeAI(model="gemini-2.5-flash", temperature=0)
-
-em_llm = llm.with_structured_output(EMSelection)
+# Client is created on first use (see shared.registry)
+def get_em_llm():
+    return get_prompt_model(EMSelection, MODEL_NAME, temperature=0)
 
 
 EM_PROMPT_TEMPLATE = """
@@ -89,23 +94,61 @@ SOAP NOTE
 \"\"\" 
 """
 
-def build_em_prompt(soap_note: str, allowed_em_codes: list[dict]) -> str:
-    from langchain_core.prompts import PromptTemplate
-
-    cpt_list = [f"{item['cpt']} - {item['description']}" for item in allowed_em_codes]
-
-    prompt_template = PromptTemplate(
-        input_variables=["soap_note", "allowed_em_cpts"],
-        template=EM_PROMPT_TEMPLATE,
+@lru_cache(maxsize=32)
+def _em_template(codes: tuple) -> tuple:
+    # The code list is part of the static prefix; only the note varies
+    return compile_template(
+        EM_PROMPT_TEMPLATE,
+        allowed_em_cpts="\n".join(f"{cpt} - {description}" for cpt, description in codes),
     )
 
-    return prompt_template.format(
-        soap_note=soap_note,
-        allowed_em_cpts="\n".join(cpt_list),
-    )
+
+def build_em_prompt(soap_note: str, allowed_em_codes: list[dict]) -> str:
+    codes = tuple((item["cpt"], item["description"]) for item in allowed_em_codes)
+    return render_template(_em_template(codes), soap_note=soap_note)
+
+
+def local_em_cpt(
+    masked_text: str,
+    allowed_em_codes: list[dict],
+    referenced_cpts: list[str] | None = None,
+    stats: dict | None = None,
+) -> str | None:
+    """The rule-based E/M code, or None when the note should go to the LLM."""
+    with span("em_leveling"):
+        level = level_em(masked_text, referenced_cpts)
+    allowed = {item["cpt"] for item in allowed_em_codes}
+    confident = level.confidence >= EM_CONFIDENCE_THRESHOLD and level.code in allowed
+    if stats is not None:
+        stats["em_source"] = "rules" if confident else "llm"
+        stats["em_confidence"] = level.confidence
+        stats["em_mdm"] = level.mdm
+    return level.code if confident else None
+
+
+def select_em_cpt(
+    masked_text: str,
+    allowed_em_codes: list[dict],
+    referenced_cpts: list[str] | None = None,
+    stats: dict | None = None,
+) -> str:
+    em_code = local_em_cpt(masked_text, allowed_em_codes, referenced_cpts, stats)
+    if em_code:
+        return em_code
+    prompt = build_em_prompt(masked_text, allowed_em_codes)
+    result = get_em_llm().invoke(prompt)
+    return result.em_code
 
 
-def select_em_cpt(masked_text: str, allowed_em_codes: list[dict]) -> str:
+async def aselect_em_cpt(
+    masked_text: str,
+    allowed_em_codes: list[dict],
+    referenced_cpts: list[str] | None = None,
+    stats: dict | None = None,
+) -> str:
+    em_code = local_em_cpt(masked_text, allowed_em_codes, referenced_cpts, stats)
+    if em_code:
+        return em_code
     prompt = build_em_prompt(masked_text, allowed_em_codes)
-    result = em_llm.invoke(prompt)
+    result = await get_em_llm().ainvoke(prompt)
     return result.em_code
@@ -0,0 +1,125 @@
+import asyncio
+import io
+from typing import Callable, Iterable, Tuple
+
+from .pdf_processing import read_pdf_text
+from .cpt_selection import (
+    build_categories_prompt,
+    get_categories_llm,
+    aselect_cpts,
+)
+from .utils import norm
+from shared.tracing import file_context
+
+DEFAULT_CONCURRENCY = 8
+
+
+def build_record(
+    filename: str,
+    demographics: dict,
+    predicted_categories: list[str],
+    final_cpts: list[str],
+) -> dict:
+    return {
+        "filename": filename,
+        "patient_name": demographics.get("patient_name"),
+        "dob": demographics.get("dob"),
+        "age": demographics.get("age"),
+        "service_date": demographics.get("service_date", ""),
+        "provider_name": demographics.get("provider_name"),
+        "account_number": demographics.get("account_number"),
+        "predicted_categories": ", ".join(predicted_categories),
+        "icd_codes": ", ".join(demographics.get("icd_codes", [])),
+        "cpt_codes_extracted": ", ".join(demographics.get("cpt_codes", [])),
+        "final_cpt_codes": ", ".join(sorted(set(final_cpts))),
+    }
+
+
+def results_dataframe(records: list[dict]):
+    """Results table with invalid or non-billable ICD codes noted in "comments"."""
+    import pandas as pd
+    from shared.icd import add_icd_comments
+
+    return add_icd_comments(pd.DataFrame(records), "icd_codes", "comments")
+
+
+async def process_note(
+    filename: str,
+    pdf_bytes: bytes,
+    normalized_mapping: dict,
+    stats: dict | None = None,
+) -> dict:
+    # PDF parsing / OCR is blocking, keep it off the event loop
+    masked_text, demographics = await asyncio.to_thread(
+        read_pdf_text, io.BytesIO(pdf_bytes)
+    )
+
+    cat_prompt = build_categories_prompt(masked_text)
+    cat_obj = await get_categories_llm().ainvoke(cat_prompt)
+    predicted_categories = [norm(c.value) for c in cat_obj.categories]
+
+    final_cpts = await aselect_cpts(
+        masked_text=masked_text,
+        predicted_categories=predicted_categories,
+        normalized_mapping=normalized_mapping,
+        service_date=demographics.get("service_date", ""),
+        stats=stats,
+    )
+    return build_record(filename, demographics, predicted_categories, final_cpts)
+
+
+async def process_batch(
+    files: Iterable[Tuple[str, bytes]],
+    normalized_mapping: dict,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_result: Callable[[int, dict], None] | None = None,
+    prompt_stats: dict | None = None,
+    on_start: Callable[[int], None] | None = None,
+) -> list[dict]:
+    """
+    Process (filename, pdf_bytes) pairs concurrently, at most `concurrency`
+    notes in flight. `on_result(index, record)` is called on the event loop
+    thread as each file finishes; a failed file yields a record with an
+    "error" field instead of aborting the batch. `prompt_stats`, if given, is
+    filled with each file's CPT prompt token savings, keyed by index.
+    `on_start(index)` is called when a file gets one of the `concurrency` slots.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_one(idx: int, filename: str, pdf_bytes: bytes) -> dict:
+        stats = {}
+        if prompt_stats is not None:
+            prompt_stats[idx] = stats
+        async with semaphore:
+            if on_start:
+                on_start(idx)
+            try:
+                # Each task runs in its own copy of the context
+                with file_context(filename):
+                    record = await process_note(
+                        filename, pdf_bytes, normalized_mapping, stats
+                    )
+            except Exception as e:
+                record = {"filename": filename, "error": str(e)}
+        if on_result:
+            on_result(idx, record)
+        return record
+
+    return await asyncio.gather(
+        *(run_one(idx, name, data) for idx, (name, data) in enumerate(files))
+    )
+
+
+def run_batch(
+    files: Iterable[Tuple[str, bytes]],
+    normalized_mapping: dict,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    on_result: Callable[[int, dict], None] | None = None,
+    prompt_stats: dict | None = None,
+    on_start: Callable[[int], None] | None = None,
+) -> list[dict]:
+    return asyncio.run(
+        process_batch(
+            files, normalized_mapping, concurrency, on_result, prompt_stats, on_start
+        )
+    )
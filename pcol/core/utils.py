@@ -1,7 +1,15 @@
 import re
+import json
 from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType
 import holidays
 
+from shared.deid import DATE, PHONE, URL, Deidentifier, MaskRule
+from shared.registry import get_resource
+
+CPT_MAPPING_PATH = Path("pcol/data/cpt_mapping.json")
+
 
 def normalize_text(text: str) -> str:
     text = text.replace("\u2013", "-")
@@ -11,50 +19,34 @@ def normalize_text(text: str) -> str:
     return text.strip()
 
 
-def mask_phi(text: str) -> str:
-    # Mask patient names (assumes "LAST, First" or "Patient: First Last")
-    text = re.sub(
-        r"^([A-Z][A-Z\s\-']+,\s*[A-Za-z][A-Za-z\s\-']+)",
-        "[PATIENT_NAME]",
-        text,
-        flags=re.MULTILINE,
-    )
-    text = re.sub(
-        r"Patient:\s*([A-Za-z ,]+?)(?:\s+Provider:|\s+DOB:)",
-        "Patient: [PATIENT_NAME]",
-        text,
-        flags=re.IGNORECASE,
-    )
-
-    # Mask DOB
-    text = re.sub(r"\bDOB:\s*\d{1,2}/\d{1,2}/\d{2,4}\b", "DOB: [DOB]", text)
-
-    # Mask age
-    text = re.sub(
-        r"Age:\s*\d+\s*(?:mo|yo|y|d)", "Age: [AGE]", text, flags=re.IGNORECASE
-    )
-
-    # Mask account numbers / MRN
-    text = re.sub(r"\bAcc No\.:?\s*\d+\b", "Acc No.: [ACCOUNT_NUMBER]", text)
-
-    # Mask provider names
-    text = re.sub(r"Provider:\s*[A-Za-z ,\.]+MD", "Provider: [PROVIDER]", text)
-
-    # Mask phone numbers
-    text = re.sub(r"\b\d{3}-\d{3}-\d{4}\b", "[PHONE]", text)
+# PHI masked before the note is sent to the LLM. Earlier rules win where two
+# could match at the same place (a DOB is [DOB], not [DATE]).
+DEID = Deidentifier(
+    mask=[
+        # Patient names ("LAST, First" at a line start, or "Patient: First Last")
+        MaskRule(r"^[A-Z][A-Z\s\-']+,\s*[A-Za-z][A-Za-z\s\-']+", "[PATIENT_NAME]"),
+        MaskRule(
+            r"(?i:Patient:\s*[A-Za-z ,]+?(?=\s+Provider:|\s+DOB:))",
+            "Patient: [PATIENT_NAME]",
+        ),
+        MaskRule(r"\bDOB:\s*\d{1,2}/\d{1,2}/\d{2,4}\b", "DOB: [DOB]"),
+        MaskRule(r"(?i:Age:\s*\d+\s*(?:mo|yo|y|d))", "Age: [AGE]"),
+        # Account numbers / MRN
+        MaskRule(r"\bAcc No\.:?\s*\d+\b", "Acc No.: [ACCOUNT_NUMBER]"),
+        MaskRule(r"Provider:\s*[A-Za-z ,\.]+MD", "Provider: [PROVIDER]"),
+        MaskRule(PHONE, "[PHONE]"),
+        MaskRule(r"\d{1,5}\s+[A-Za-z0-9\s,.-]+, [A-Za-z\s]+, [A-Z]{2}-\d{5}", "[ADDRESS]"),
+        # Service dates, visit dates, etc.
+        MaskRule(DATE, "[DATE]"),
+        MaskRule(URL, "[URL]"),
+    ],
+    flags=re.MULTILINE,
+)
 
-    # Mask addresses
-    text = re.sub(
-        r"\d{1,5}\s+[A-Za-z0-9\s,.-]+, [A-Za-z\s]+, [A-Z]{2}-\d{5}", "[ADDRESS]", text
-    )
 
-    # Mask dates (service dates, visit dates, etc.)
-    text = re.sub(r"\b\d{1,2}/\d{1,2}/\d{2,4}\b", "[DATE]", text)
-
-    # Mask URLs
-    text = re.sub(r"https?://\S+", "[URL]", text)
+def mask_phi(text: str) -> str:
+    return DEID.mask(text)
 
-    return text
 
 def normalize_excel_cpts(cpt_string: str) -> list[str]:
     if not isinstance(cpt_string, str):
@@ -76,3 +68,18 @@ def is_holiday(dos_str: str) -> bool:
 
     return dos_date in us_holidays
 
+
+def read_cpt_mapping(path: Path = CPT_MAPPING_PATH) -> dict:
+    """CPT tree keyed by normalized top-level category."""
+    if not path.exists():
+        raise FileNotFoundError(f"Missing CPT mapping: {path}")
+    with open(path, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+    return {norm(k): v for k, v in mapping.items()}
+
+
+def get_cpt_mapping(path: Path = CPT_MAPPING_PATH) -> MappingProxyType:
+    """read_cpt_mapping, loaded once per process and shared read-only by every session."""
+    return get_resource(
+        ("pcol_cpt_mapping", str(path)), lambda: MappingProxyType(read_cpt_mapping(path))
+    )
@@ -1,55 +1,140 @@
+# Bump whenever the record layout or prompts change so cached rows are invalidated
+PIPELINE_VERSION = "pcol-7"
+
+
+def process_batch(job, files, normalized_mapping, concurrency) -> dict:
+    """
+    Code a batch of (name, pdf_bytes) on the background queue (see
+    shared.job_queue). Returns the session state values for the results.
+    """
+    import pandas as pd
+    from pcol.core.pipeline import run_batch, results_dataframe
+    from shared.result_cache import ResultCache
+    from shared.export import dataframe_to_excel_bytes
+    from shared.tracing import span, trace_batch
+    from shared.llm_cache import cache_usage
+    from shared.job_store import open_batch
+
+    result_cache = ResultCache("pcol", PIPELINE_VERSION)
+    records = [None] * len(files)
+
+    def mark_done(idx, record):
+        records[idx] = record
+        job.add_row(record)
+        job.set_message(f"Processed {job.completed}/{job.total}: {record['filename']}")
+
+    # Every file's status is appended to the batch's job log as it
+    # changes; re-uploading the same files after a crash resumes the batch
+    cache_keys = [result_cache.key(data) for _, data in files]
+    job_store = open_batch("pcol", cache_keys)
+
+    # Resolve cache hits first; duplicates within the upload run only once
+    pending = {}
+    for idx, ((name, _), cache_key) in enumerate(zip(files, cache_keys)):
+        if job_store.is_done(cache_key):
+            cached_record = job_store.jobs[cache_key].row
+        else:
+            cached_record = result_cache.get(cache_key)
+            if cached_record is not None:
+                job_store.finish(cache_key, cached_record)
+        if cached_record is not None:
+            mark_done(idx, {**cached_record, "filename": name})
+        else:
+            pending.setdefault(cache_key, []).append(idx)
+
+    def on_start(job_idx):
+        cache_key, indices = pending_jobs[job_idx]
+        job_store.start(cache_key, files[indices[0]][0])
+
+    def on_result(job_idx, record):
+        cache_key, indices = pending_jobs[job_idx]
+        if "error" in record:
+            job_store.fail(cache_key, record["error"])
+        else:
+            result_cache.put(cache_key, record)
+            job_store.finish(cache_key, record)
+        for idx in indices:
+            mark_done(idx, {**record, "filename": files[idx][0]})
+
+    pending_jobs = list(pending.items())
+    prompt_stats = {}
+    with trace_batch("pcol") as trace, job_store, cache_usage() as llm_cache:
+        if pending_jobs:
+            job.set_message(
+                f"Processing {len(pending_jobs)} new file(s), {concurrency} at a time..."
+            )
+            run_batch(
+                [files[indices[0]] for _, indices in pending_jobs],
+                normalized_mapping,
+                concurrency=concurrency,
+                on_start=on_start,
+                on_result=on_result,
+                prompt_stats=prompt_stats,
+            )
+
+        # Keep upload order; the table and workbook are built once per batch
+        job.set_message("Building the results workbook...")
+        with span("export"):
+            results_df = results_dataframe([r for r in records if r is not None])
+            results_excel = dataframe_to_excel_bytes(results_df, sheet_name="Results")
+        # Failed files stay failed in the log and are retried on re-upload
+        job_store.complete()
+
+    return {
+        "pcol_results_df": results_df,
+        "pcol_results_excel": results_excel,
+        "pcol_perf_report": trace.report(),
+        "pcol_job_counts": job_store.counts(),
+        "pcol_llm_cache_stats": llm_cache.stats(),
+        "pcol_prompt_stats": pd.DataFrame(
+            [
+                {"filename": files[pending_jobs[job_idx][1][0]][0], **stats}
+                for job_idx, stats in sorted(prompt_stats.items())
+                if stats
+            ]
+        ),
+    }
+
+
 def run():
     import streamlit as st
-    import pandas as pd
-    import io
-    import json
+    import os
     from pathlib import Path
-    import time
 
-    from pcol.core.pdf_processing import read_pdf_text
-    from pcol.core.cpt_selection import (
-        build_categories_prompt,
-        categories_prediction_llm,
-        select_cpts,
+    from pcol.core.pipeline import results_dataframe, DEFAULT_CONCURRENCY
+    from pcol.core.utils import get_cpt_mapping
+    from pcol.core.cpt_retrieval import load_cpt_retrieval
+    from shared.export import dataframe_to_excel_bytes, XLSX_MIME
+    from shared.ui import (
+        batch_progress,
+        icd_code_set_warning,
+        job_status_notice,
+        llm_cache_caption,
+        performance_expander,
     )
-    from pcol.core.utils import norm
+    from shared.result_cache import content_hash
+    from shared.job_queue import FAILED, get_job_queue
+    from shared.job_store import DONE, batch_id, interrupted_jobs
 
     # =========================
     # CONFIG
     # =========================
 
     CPT_MAPPING_PATH = Path("pcol/data/cpt_mapping.json")
-    RESULTS_CURRENT_PATH = Path("pcol/data/results_current.json")  # for current batch
-    RESULTS_LAST_BATCH_PATH = Path("pcol/data/results_last_batch.json")  # optional n-1 batch
+    # Max number of notes with LLM calls in flight at once
+    LLM_CONCURRENCY = int(os.getenv("PCOL_LLM_CONCURRENCY", DEFAULT_CONCURRENCY))
 
     st.set_page_config(page_title="Pediatric of La Porte", layout="wide")
     st.title("Pediatric of La Porte")
-    st.session_state.patient_data = []
 
     # =========================
     # LOAD CPT MAPPING
     # =========================
-    @st.cache_data
-    def load_cpt_mapping():
-        if not CPT_MAPPING_PATH.exists():
-            raise FileNotFoundError(f"Missing CPT mapping: {CPT_MAPPING_PATH}")
-        with open(CPT_MAPPING_PATH, "r", encoding="utf-8") as f:
-            mapping = json.load(f)
-        return {k.strip().lower(): v for k, v in mapping.items()}
-
-    normalized_mapping = load_cpt_mapping()
-
-    # =========================
-    # LOAD CRASH-RECOVERY RESULTS (CURRENT BATCH ONLY)
-    # =========================
-    if RESULTS_CURRENT_PATH.exists():
-        try:
-            with open(RESULTS_CURRENT_PATH, "r", encoding="utf-8") as f:
-                st.session_state.patient_data = json.load(f)
-        except json.JSONDecodeError:
-            st.session_state.patient_data = []
-    else:
-        st.session_state.patient_data = []
+    # One read-only copy per process, shared by every session
+    normalized_mapping = get_cpt_mapping(CPT_MAPPING_PATH)
+    # Loads the embedder up front when CPT retrieval is switched on
+    load_cpt_retrieval()
+    job_queue = get_job_queue()
 
     # =========================
     # FILE UPLOAD
@@ -63,106 +148,90 @@ def run():
     # =========================
     # PROCESS FILES
     # =========================
-    if uploaded_files:
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        total_files = len(uploaded_files)
-
-        # Keep track of already processed files in this batch
-        processed_files = {r["filename"] for r in st.session_state.patient_data}
-
-        for idx, uploaded_file in enumerate(uploaded_files, start=1):
-            if uploaded_file.name in processed_files:
-                status_text.text(f"Skipping already processed file: {uploaded_file.name}")
-                progress_bar.progress(idx / total_files)
-                continue
-
-            status_text.text(f"Processing file {idx}/{total_files}: {uploaded_file.name}")
-
-            # Read uploaded file into BytesIO
-            pdf_bytes = io.BytesIO(uploaded_file.read())
-
-            # -------------------------
-            # Extract SOAP text + demographics
-            # -------------------------
-            masked_text, demographics = read_pdf_text(pdf_bytes)
-
-            # -------------------------
-            # Category Prediction
-            # -------------------------
-            cat_prompt = build_categories_prompt(masked_text)
-            cat_obj = categories_prediction_llm.invoke(cat_prompt)
-            predicted_categories = [norm(c.value) for c in cat_obj.categories]
-
-            # -------------------------
-            # CPT Selection (includes E/M)
-            # -------------------------
-            service_date = demographics.get("service_date", "")
-            final_cpts = select_cpts(
-                masked_text=masked_text,
-                predicted_categories=predicted_categories,
-                normalized_mapping=normalized_mapping,
-                service_date=service_date,
-            )
-
-            # -------------------------
-            # Store results
-            # -------------------------
-            record = {
-                "filename": uploaded_file.name,
-                "patient_name": demographics.get("patient_name"),
-                "dob": demographics.get("dob"),
-                "age": demographics.get("age"),
-                "service_date": service_date,
-                "provider_name": demographics.get("provider_name"),
-                "account_number": demographics.get("account_number"),
-                "predicted_categories": ", ".join(predicted_categories),
-                "icd_codes": ", ".join(demographics.get("icd_codes", [])),
-                "cpt_codes_extracted": ", ".join(demographics.get("cpt_codes", [])),
-                "final_cpt_codes": ", ".join(sorted(set(final_cpts))),
-            }
-            st.session_state.patient_data.append(record)
-
-            # -------------------------
-            # Save results immediately (crash-safe)
-            # -------------------------
-            tmp_path = RESULTS_CURRENT_PATH.with_suffix(".tmp")
-            try:
-                with open(tmp_path, "w", encoding="utf-8") as f:
-                    json.dump(st.session_state.patient_data, f, indent=2)
-                tmp_path.replace(RESULTS_CURRENT_PATH)
-            except PermissionError:
-                # Retry a few times if file is temporarily locked
-                for _ in range(3):
-                    time.sleep(0.1)
-                    try:
-                        tmp_path.replace(RESULTS_CURRENT_PATH)
-                        break
-                    except PermissionError:
-                        continue
-
-            progress_bar.progress(idx / total_files)
-
-        status_text.text("All files in this batch processed successfully!")
-
-        # -------------------------
-        # Optionally archive this batch and reset for next batch
-        # -------------------------
-        RESULTS_CURRENT_PATH.replace(RESULTS_LAST_BATCH_PATH)
-        st.session_state.patient_data = []
+    # Only new upload content starts a batch; other widget reruns poll it or
+    # reuse the results
+    upload_keys = [content_hash(f.getvalue(), PIPELINE_VERSION) for f in uploaded_files or []]
+    if uploaded_files and st.session_state.get("pcol_upload_keys") != upload_keys:
+        for key in (
+            "pcol_results_df",
+            "pcol_results_excel",
+            "pcol_perf_report",
+            "pcol_llm_cache_stats",
+            "pcol_prompt_stats",
+            "pcol_job_counts",
+            "pcol_recovered",
+        ):
+            st.session_state.pop(key, None)
+        job = job_queue.submit(
+            "pcol",
+            process_batch,
+            [(f.name, f.getvalue()) for f in uploaded_files],
+            normalized_mapping,
+            LLM_CONCURRENCY,
+            total=len(uploaded_files),
+        )
+        st.session_state.pcol_batch_job = job.id
+        # The batch's job log, for recovering this session's results if the run dies
+        st.session_state.pcol_batch_id = batch_id(upload_keys)
+        st.session_state.pcol_upload_keys = upload_keys
+
+    job = job_queue.get(st.session_state.get("pcol_batch_job"))
+    if job is not None:
+        if job.active:
+            batch_progress(job)
+            return
+        st.session_state.pop("pcol_batch_job")
+        if job.status == FAILED:
+            st.error(f"Batch failed: {job.error}")
+            # Only this session's own batch, and only if its run never completed
+            logged = interrupted_jobs("pcol", st.session_state.get("pcol_batch_id"))
+            recovered = [entry.row for entry in logged.values() if entry.status == DONE]
+            if recovered:
+                recovered_df = results_dataframe(recovered)
+                st.session_state.pcol_results_df = recovered_df
+                st.session_state.pcol_results_excel = dataframe_to_excel_bytes(
+                    recovered_df, sheet_name="Results"
+                )
+                st.session_state.pcol_recovered = True
+        else:
+            st.session_state.update(job.result)
 
     # =========================
     # DISPLAY RESULTS
     # =========================
-    if st.session_state.patient_data:
+
+    if st.session_state.get("pcol_results_df") is not None:
         st.subheader("Prediction Results")
-        df = pd.DataFrame(st.session_state.patient_data)
+        df = st.session_state.pcol_results_df
         st.dataframe(df, width=1200)
-
-        # Excel download
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
-            df.to_excel(writer, index=False, sheet_name="Results")
+        icd_code_set_warning()
+        if st.session_state.get("pcol_recovered"):
+            st.caption(
+                "Results recovered from the interrupted batch. Upload the same files "
+                "again to finish it; finished files are not reprocessed."
+            )
+        llm_cache_caption(st.session_state.get("pcol_llm_cache_stats"))
+        if job_status_notice(st.session_state.get("pcol_job_counts"), key="pcol_retry"):
+            st.session_state.pop("pcol_upload_keys", None)
+            st.rerun()
+        performance_expander(st.session_state.get("pcol_perf_report"))
+
+        prompt_stats_df = st.session_state.get("pcol_prompt_stats")
+        if prompt_stats_df is not None and not prompt_stats_df.empty:
+            with st.expander("Prompt pruning and E/M leveling"):
+                saved = int(prompt_stats_df["prompt_tokens_saved"].sum())
+                full = int(prompt_stats_df["cpt_list_tokens"].sum())
+                st.caption(
+                    f"~{saved:,} of {full:,} CPT list tokens pruned "
+                    f"({saved / max(full, 1):.0%}) across {len(prompt_stats_df)} new note(s)"
+                )
+                if "em_source" in prompt_stats_df:
+                    em_sources = prompt_stats_df["em_source"].dropna()
+                    st.caption(
+                        f"E/M leveled by rules for {int((em_sources == 'rules').sum())} "
+                        f"of {len(em_sources)} visit note(s); the rest went to the LLM"
+                    )
+                st.dataframe(prompt_stats_df, width=1200)
 
         filename = st.text_input(
             "Enter filename for Excel download:", value="pcol_results.xlsx"
@@ -172,7 +241,7 @@ def run():
 
         st.download_button(
             label="Download Results as Excel",
-            data=buffer.getvalue(),
+            data=st.session_state.pcol_results_excel,
             file_name=filename,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
         )
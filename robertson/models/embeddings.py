@@ -1,18 +1,53 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
+from pathlib import Path
 from typing import List
+from shared import vector_index
+from shared.vector_index import VectorIndex, load_index, rerank
 ## This file only contains embedding logic, ICD store builder, and rerank function.
 
-# Load MedEmbed model once (cached)
-embedder = SentenceTransformer("abhinand/MedEmbed-large-v0.1")
+# MedEmbed is loaded on first use and shared process-wide
+EMBEDDING_MODEL = "abhinand/MedEmbed-large-v0.1"
+ICD_STORE_DIR = Path("robertson/data/icd_store")
 
 def embed_texts(texts: List[str]) -> np.ndarray:
     """Return L2-normalized embeddings as numpy arrays."""
-    embs = embedder.encode(
-        texts,
-        convert_to_numpy=True,
-        batch_size=32,
-        normalize_embeddings=True,
-        show_progress_bar=False
-    )
-    return embs
+    return vector_index.embed_texts(texts, EMBEDDING_MODEL)
+
+
+def build_icd_store(mapping_df=None, directory: Path = ICD_STORE_DIR) -> VectorIndex:
+    """Embed every CPT/ICD pair of the mapping sheet and save it as an index."""
+    if mapping_df is None:
+        from robertson.utils.data_utils import read_mappings
+
+        mapping_df = read_mappings()
+
+    items = []
+    for row in mapping_df.fillna("").itertuples(index=False):
+        cpt, cpt_desc, icd, icd_desc = (str(v).strip() for v in row[:4])
+        items.append(
+            {
+                "cpt": cpt,
+                "cpt_description": cpt_desc,
+                "icd": icd,
+                "icd_description": icd_desc,
+                "text": f"{icd} {icd_desc}. {cpt_desc}",
+            }
+        )
+
+    index = VectorIndex.build(items, model=EMBEDDING_MODEL)
+    index.save(directory)
+    return index
+
+
+def search_icd_store(query: str, k: int = 10, directory: Path = ICD_STORE_DIR) -> list:
+    """Top-k [(score, item)] ICD/CPT pairs for a note, reranked. Empty if not built."""
+    index = load_index(directory)
+    if index is None:
+        return []
+    hits = index.search_text(query, k=k * 3, model=EMBEDDING_MODEL)
+    return rerank(query, hits)[:k]
+
+
+if __name__ == "__main__":
+    store = build_icd_store()
+    print(f"Saved {len(store.items)} entries to {ICD_STORE_DIR}")
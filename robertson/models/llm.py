@@ -1,17 +1,29 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel, Field
 from typing import List, Annotated
-from dotenv import load_dotenv
-import os
-load_dotenv()
+from shared.prompt_cache import get_prompt_model
 
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    google_api_key=os.getenv("GOOGLE_API_KEY"),
-)
+MODEL_NAME = "gemini-2.5-flash"
 
 # Structured output for CPT
 class CPT_Output(BaseModel):
     CPT: List[Annotated[str, Field(min_length=5, max_length=5, description="CPT code descrbing the chart note")]]
 
-structured_llm = llm.with_structured_output(CPT_Output)
+
+# Structured output for several notes packed into one request
+class CPT_NoteOutput(BaseModel):
+    note_id: str = Field(description="Id of the note exactly as given in the request")
+    CPT: List[Annotated[str, Field(min_length=5, max_length=5, description="CPT code descrbing the chart note")]]
+
+
+class CPT_BatchOutput(BaseModel):
+    results: List[CPT_NoteOutput]
+
+
+# Clients are created on first use (see shared.registry); static prompt
+# prefixes go through the context cache (see shared.prompt_cache)
+def get_structured_llm():
+    return get_prompt_model(CPT_Output, MODEL_NAME)
+
+
+def get_batch_structured_llm():
+    return get_prompt_model(CPT_BatchOutput, MODEL_NAME)
@@ -1,27 +1,104 @@
+# Bump whenever process_file output changes so cached rows are invalidated
+PIPELINE_VERSION = "robertson-4"
+
+
+def process_batch(job, files, cpt_descriptions) -> dict:
+    """
+    Code a batch of (name, pdf_bytes) on the background queue (see
+    shared.job_queue). Returns the session state values for the results.
+    """
+    from collections import Counter
+    from robertson.utils.file_utils import error_row, process_files, results_dataframe
+    from shared.result_cache import ResultCache
+    from shared.export import dataframe_to_excel_bytes
+    from shared.tracing import span, trace_batch
+    from shared.llm_cache import cache_usage
+    from shared.job_queue import named_bytes
+    from shared.job_store import open_batch
+
+    result_cache = ResultCache("robertson", PIPELINE_VERSION)
+
+    # Identical PDFs in the same upload are processed only once
+    file_keys = [result_cache.key(data) for _, data in files]
+    key_counts = Counter(file_keys)
+    # Each file's status is appended to the batch's job log, so
+    # re-uploading the same files after a crash resumes the batch
+    job_store = open_batch("robertson", file_keys)
+    rows_by_key = {}
+    pending_files = {}
+    for (name, data), key in zip(files, file_keys):
+        if key in rows_by_key or key in pending_files:
+            continue
+        if job_store.is_done(key):
+            cached_row = job_store.jobs[key].row
+        else:
+            cached_row = result_cache.get(key)
+            if cached_row is not None:
+                job_store.finish(key, cached_row)
+        if cached_row is not None:
+            rows_by_key[key] = cached_row
+            job.add_row(cached_row, key_counts[key])
+        else:
+            pending_files[key] = named_bytes(name, data)
+
+    cpt_stats = {}
+
+    def on_done(key, res):
+        if isinstance(res, Exception):
+            job_store.fail(key, res)
+            res = error_row(res)
+        else:
+            result_cache.put(key, res)
+            job_store.finish(key, res)
+        rows_by_key[key] = res
+        job.add_row(res, key_counts[key])
+
+    # PDFs are parsed on a CPU-sized pool while batched CPT requests run on
+    # an adaptive LLM pool shared by every session
+    with trace_batch("robertson") as trace, job_store, cache_usage() as llm_cache:
+        for key, f in pending_files.items():
+            job_store.start(key, f.name)
+        if pending_files:
+            process_files(
+                pending_files,
+                cpt_descriptions,
+                on_done=on_done,
+                stats=cpt_stats,
+            )
+
+        results = [rows_by_key[key] for key in file_keys]
+        # Formatted and exported once per batch, not on every rerun
+        job.set_message("Building the results workbook...")
+        with span("export"):
+            results_df = results_dataframe(results)
+            results_excel = dataframe_to_excel_bytes(results_df, sheet_name="Results")
+        # Failed files stay failed in the log and are retried on re-upload
+        job_store.complete()
+    return {
+        "results_df": results_df,
+        "results_excel": results_excel,
+        "perf_report": trace.report(),
+        "job_counts": job_store.counts(),
+        "cpt_stats": cpt_stats,
+        "llm_cache_stats": llm_cache.stats(),
+    }
+
+
 def run():
     import streamlit as st
-    import pandas as pd
-    import io
     import os
-    from robertson.utils.file_utils import process_file
-    from robertson.utils.data_utils import load_mappings
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-
-    HEADERS = [
-        "Date",
-        "Appointment Type",
-        "Client Name",
-        "DOB",
-        "Service Code",
-        "Service Description",
-        "Clinician Name",
-        "POS",
-        "Modifier",
-        "Coding",
-        "Note Status",
-        "Status",
-        "Comments",
-    ]
+    from robertson.utils.file_utils import HEADERS
+    from robertson.utils.data_utils import load_cpt_descriptions
+    from shared.export import XLSX_MIME
+    from shared.ui import (
+        batch_progress,
+        icd_code_set_warning,
+        job_status_notice,
+        llm_cache_caption,
+        performance_expander,
+    )
+    from shared.result_cache import content_hash
+    from shared.job_queue import FAILED, get_job_queue
 
     st.title("Robertson Practice")
 
@@ -29,60 +106,63 @@ def run():
         "Upload one or more SOAP notes (PDFs)", type="pdf", accept_multiple_files=True
     )
 
-    # Load CPT to ICD mapping (used only for CPT descriptions)
-    cpt_icd_mapping_df = load_mappings()  # second value is ignored
+    # CPT descriptions from the CPT to ICD mapping, shared by every session
+    cpt_descriptions = load_cpt_descriptions()
+    job_queue = get_job_queue()
 
     if uploaded_files:
-        # Clear previous session if file list changes
-        if st.session_state.get("last_files") != [f.name for f in uploaded_files]:
+        # New upload content starts a new batch; other reruns only poll it
+        upload_keys = [content_hash(f.getvalue(), PIPELINE_VERSION) for f in uploaded_files]
+        if st.session_state.get("upload_keys") != upload_keys:
             st.session_state.pop("results_df", None)
-            st.session_state.pop("last_files", None)
-
-        if "results_df" not in st.session_state:
-            results = []
-            total_files = len(uploaded_files)
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-
-            def process_file_wrapper(uploaded_file):
-                return process_file(uploaded_file, cpt_icd_mapping_df)
-
-            # Parallel processing (limit workers to avoid resource spikes)
-            max_workers = min(4, total_files)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {
-                    executor.submit(process_file_wrapper, f): f.name
-                    for f in uploaded_files
-                }
-                completed = 0
-                for future in as_completed(futures):
-                    completed += 1
-                    try:
-                        # give each task an upper-bound timeout to avoid hanging
-                        res = future.result(timeout=300)
-                    except Exception as e:
-                        # Record the error as a result row so the app doesn't crash
-                        err_row = {h: "" for h in HEADERS}
-                        err_row["Comments"] = f"Error processing file: {e}"
-                        res = err_row
-
-                    results.append(res)
-                    progress_bar.progress(completed / total_files)
-                    status_text.text(f"Processed {completed} of {total_files} files.")
-
-            st.session_state.results_df = pd.DataFrame(results, columns=HEADERS)
-            st.session_state.last_files = [f.name for f in uploaded_files]
-
+            st.session_state.pop("cpt_stats", None)
+            st.session_state.pop("results_excel", None)
+            st.session_state.pop("llm_cache_stats", None)
+            st.session_state.pop("perf_report", None)
+            st.session_state.pop("job_counts", None)
+
+            job = job_queue.submit(
+                "robertson",
+                process_batch,
+                [(f.name, f.getvalue()) for f in uploaded_files],
+                cpt_descriptions,
+                total=len(uploaded_files),
+            )
+            st.session_state.batch_job = job.id
+            st.session_state.upload_keys = upload_keys
+
+        job = job_queue.get(st.session_state.get("batch_job"))
+        if job is not None:
+            if job.active:
+                batch_progress(job, columns=HEADERS)
+                return
+            st.session_state.pop("batch_job")
+            if job.status == FAILED:
+                st.error(f"Batch failed: {job.error}")
+            else:
+                st.session_state.update(job.result)
+
+    if uploaded_files and "results_df" in st.session_state:
         # Display results
         results_df = st.session_state.results_df
-        if "Date" in results_df.columns:
-            results_df["Date"] = pd.to_datetime(
-                results_df["Date"].astype(str), dayfirst=True, errors="coerce"
-            ).dt.strftime("%m/%d/%y")
-            results_df = results_df.sort_values(by="Date", ascending=True)
 
         st.subheader("Results Summary")
         st.dataframe(results_df, use_container_width=True)
+        icd_code_set_warning()
+
+        cpt_stats = st.session_state.get("cpt_stats") or {}
+        coded = cpt_stats.get("rule_resolved", 0) + cpt_stats.get("llm_predicted", 0)
+        if coded:
+            st.caption(
+                f"{cpt_stats.get('rule_resolved', 0)} of {coded} notes "
+                f"({cpt_stats.get('rule_resolved', 0) / coded:.0%}) coded by "
+                "service code and duration rules without an LLM call."
+            )
+        llm_cache_caption(st.session_state.get("llm_cache_stats"))
+        if job_status_notice(st.session_state.get("job_counts"), key="robertson_retry"):
+            st.session_state.pop("upload_keys", None)
+            st.rerun()
+        performance_expander(st.session_state.get("perf_report"))
 
         # Custom filename for download
         default_filename = "robertson_coding_solved.xlsx"
@@ -90,19 +170,16 @@ def run():
         if not custom_name.endswith(".xlsx"):
             custom_name += ".xlsx"
 
-        buffer = io.BytesIO()
-        with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
-            results_df.to_excel(writer, index=False, sheet_name="Results")
-
         if st.download_button(
             label="Download Results as Excel",
-            data=buffer.getvalue(),
+            data=st.session_state.results_excel,
             file_name=custom_name,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            mime=XLSX_MIME,
         ):
             # Clear session state after download
             st.session_state.pop("results_df", None)
-            st.session_state.pop("last_files", None)
+            st.session_state.pop("results_excel", None)
+            st.session_state.pop("upload_keys", None)
 
             # Delete uploaded PDF files
             data_path = "data"
@@ -1,9 +1,11 @@
 import re
 import math
-from langchain_core.prompts import PromptTemplate
-from robertson.models.llm import structured_llm
+from robertson.models.llm import get_structured_llm, get_batch_structured_llm
+from shared.llm_client import estimate_tokens
+from shared.prompt_cache import compile_template, render_template
 
-cpt_prediction_prompt = """You are a medical coding assistant.
+# Instructions shared by the single-note and batched prompts
+cpt_prediction_rules = """You are a medical coding assistant.
 Assign the correct CPT code(s) from the allowed list below, based on the clinical note.
 Do not guess codes that are not in the list.
 
@@ -23,27 +25,182 @@ Note: "Patient presented for initial psychiatric diagnostic interview..." → CP
 Note: "Session lasted 60 minutes, focused on psychotherapy..." → CPT: 90837
 Note: "Behavioral therapy session lasted 15 minutes..." → CPT: H0004
 Note: "Patient in acute crisis, session lasted 45 minutes addressing suicidal ideation..." → CPT: 90839
+"""
+
+# The note goes last so everything before it is a fixed, cacheable prefix
+cpt_prediction_prompt = cpt_prediction_rules + """
 
+Return the result in this JSON format:
+{{
+  "CPT": [ "code1", "code2" ]
+}}
 
 Now classify the following clinical note and return the result in the specified JSON format:
 {soap_note}
+"""
+
+cpt_batch_prediction_prompt = cpt_prediction_rules + """
 
 Return the result in this JSON format:
 {{
-  "CPT": [ "code1", "code2" ]
+  "results": [
+    {{ "note_id": "id", "CPT": [ "code1", "code2" ] }}
+  ]
 }}
+
+Now classify EACH of the following clinical notes independently. Every note is
+wrapped in <note id="..."> tags; return exactly one result per note id.
+{soap_notes}
 """
 
+_CPT_TEMPLATE = compile_template(cpt_prediction_prompt)
+_CPT_BATCH_TEMPLATE = compile_template(cpt_batch_prediction_prompt)
+
+ALLOWED_CPTS = {"90791", "90832", "90834", "90837", "H0004", "96130", "96131", "90839", "90840"}
+
+# Rough size limits for one batched request
+BATCH_TOKEN_BUDGET = 24000
+BATCH_MAX_NOTES = 10
+
 
 def predict_cpt_code(soap_note: str):
-    prompt = PromptTemplate(
-        input_variables=["soap_note"], template=cpt_prediction_prompt
-    )
-    soap_note_prompt = prompt.format(soap_note=soap_note)
-    response = structured_llm.invoke(soap_note_prompt)
+    soap_note_prompt = render_template(_CPT_TEMPLATE, soap_note=soap_note)
+    response = get_structured_llm().invoke(soap_note_prompt)
     return response.CPT
 
 
+def split_batches(
+    notes: dict[str, str],
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_notes: int = BATCH_MAX_NOTES,
+) -> list[dict[str, str]]:
+    """Greedily pack notes into batches that fit the token budget."""
+    overhead = estimate_tokens(cpt_batch_prediction_prompt)
+    batches = []
+    current, current_tokens = {}, overhead
+    for note_id, note in notes.items():
+        note_tokens = estimate_tokens(note) + 10
+        if current and (
+            current_tokens + note_tokens > token_budget or len(current) >= max_notes
+        ):
+            batches.append(current)
+            current, current_tokens = {}, overhead
+        current[note_id] = note
+        current_tokens += note_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _valid_cpts(cpts) -> bool:
+    return bool(cpts) and all(code in ALLOWED_CPTS for code in cpts)
+
+
+def _predict_one(note: str):
+    # A failed note is returned as its exception so the rest of the batch keeps its codes
+    try:
+        return predict_cpt_code(note)
+    except Exception as e:
+        return e
+
+
+def _predict_batch(batch: dict[str, str]) -> dict[str, list[str]]:
+    if len(batch) == 1:
+        [(note_id, note)] = batch.items()
+        return {note_id: _predict_one(note)}
+
+    # The prompt numbers notes 1..n; the caller's keys are long content hashes
+    keys = {str(number): note_id for number, note_id in enumerate(batch, start=1)}
+    notes_block = "\n".join(
+        f'<note id="{number}">\n{batch[note_id]}\n</note>' for number, note_id in keys.items()
+    )
+    prompt = render_template(_CPT_BATCH_TEMPLATE, soap_notes=notes_block)
+
+    by_id = {}
+    try:
+        response = get_batch_structured_llm().invoke(prompt)
+        for item in response.results:
+            note_id = keys.get(str(item.note_id).strip())
+            if note_id in by_id:
+                # Duplicate ids make the whole mapping ambiguous
+                by_id = {}
+                break
+            if note_id is not None:
+                by_id[note_id] = list(item.CPT)
+    except Exception as e:
+        print(f"Batched CPT prediction failed, falling back to per-note calls: {e}")
+
+    # Any note the batch answer did not cover cleanly gets its own request
+    results = {}
+    for note_id, note in batch.items():
+        cpts = by_id.get(note_id)
+        results[note_id] = cpts if _valid_cpts(cpts) else _predict_one(note)
+    return results
+
+
+def predict_cpt_codes_batch(
+    notes: dict[str, str],
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_notes: int = BATCH_MAX_NOTES,
+) -> dict[str, list[str]]:
+    """
+    Predict CPT codes for many de-identified notes, keyed by note id.
+    Notes are packed into as few requests as the token budget allows. A note
+    whose prediction failed maps to the exception instead of a code list.
+    """
+    results = {}
+    for batch in split_batches(notes, token_budget, max_notes):
+        results.update(_predict_batch(batch))
+    return results
+
+
+def parse_duration_minutes(duration_str):
+    if not duration_str:
+        return None
+    match = re.search(r"(\d+)", duration_str)
+    return int(match.group(1)) if match else None
+
+
+def psychotherapy_code_for_minutes(duration_min):
+    """CMS time bands: 16-37 -> 90832, 38-52 -> 90834, 53+ -> 90837."""
+    if duration_min is None or duration_min < 16:
+        return None
+    if duration_min <= 37:
+        return "90832"
+    if duration_min <= 52:
+        return "90834"
+    return "90837"
+
+
+def resolve_cpt_by_rules(service_code, duration_str):
+    """
+    Resolve the CPT from the note's service code and duration without the LLM.
+    Returns None when the rules can't decide or the service code and duration
+    disagree, in which case the caller should fall back to predict_cpt_code.
+    Units (H0004, 90840) are added later by calculate_cpt_units.
+    """
+    duration_min = parse_duration_minutes(duration_str)
+
+    if service_code == "90791":
+        return ["90791"]
+
+    if service_code in ("90832", "90834", "90837"):
+        if psychotherapy_code_for_minutes(duration_min) == service_code:
+            return [service_code]
+        return None
+
+    if service_code == "H0004":
+        return ["H0004"] if duration_min else None
+
+    if service_code == "90839":
+        # Crisis psychotherapy needs at least 30 minutes
+        if duration_min is not None and duration_min >= 30:
+            return ["90839"]
+        return None
+
+    return None
+
+
 def calculate_cpt_units(predicted_cpts, duration_str):
     """
     Returns a list of CPTs with units where applicable.
@@ -52,11 +209,7 @@ def calculate_cpt_units(predicted_cpts, duration_str):
     cpt_with_units = []
 
     # Extract numeric duration in minutes if available
-    duration_min = None
-    if duration_str:
-        match = re.search(r"(\d+)", duration_str)
-        if match:
-            duration_min = int(match.group(1))
+    duration_min = parse_duration_minutes(duration_str)
 
     for cpt in predicted_cpts:
         # Default: just add the code
@@ -1,7 +1,24 @@
+from types import MappingProxyType
+
 import pandas as pd
-import streamlit as st
 
-@st.cache_data
-def load_mappings(file_path="robertson/data/Expanded_CPT_to_ICD_mapping.xlsx"):
-    df = pd.read_excel(file_path)
-    return df
\ No newline at end of file
+from shared.registry import get_resource
+
+MAPPING_PATH = "robertson/data/Expanded_CPT_to_ICD_mapping.xlsx"
+
+
+def read_mappings(file_path=MAPPING_PATH):
+    return pd.read_excel(file_path)
+
+
+def read_cpt_descriptions(file_path=MAPPING_PATH) -> MappingProxyType:
+    """Read-only {CPT: description}, from the first mapping row of each CPT."""
+    df = read_mappings(file_path).drop_duplicates("CPT")
+    return MappingProxyType(dict(zip(df["CPT"].astype(str), df["CPT Description"])))
+
+
+def load_cpt_descriptions(file_path=MAPPING_PATH) -> MappingProxyType:
+    # Loaded once per process and shared by every session and batch
+    return get_resource(
+        ("cpt_descriptions", str(file_path)), lambda: read_cpt_descriptions(file_path)
+    )
@@ -1,39 +1,118 @@
+import os
+
 from robertson.utils.pdf_utils import load_pdf, deidentify_and_strip
-from robertson.utils.cpt_utils import predict_cpt_code, calculate_cpt_units
+from robertson.utils.cpt_utils import (
+    BATCH_MAX_NOTES,
+    BATCH_TOKEN_BUDGET,
+    predict_cpt_code,
+    predict_cpt_codes_batch,
+    resolve_cpt_by_rules,
+    calculate_cpt_units,
+    split_batches,
+)
 from robertson.utils.validation_utils import check_note, check_biopsychosocial, check_mental_status_assessed
-from robertson.utils.phi_utils import get_phi
+from robertson.utils.phi_utils import parse_note_header
 from robertson.utils.psych_eval_utils import extract_psych_eval_data
 from robertson.utils.cpt_utils import sort_diagnosis_codes
-import tempfile
+from shared.adaptive import AdaptiveExecutor, get_adaptive_executor
+from shared.job_queue import named_bytes
+from shared.llm_client import estimate_tokens
+from shared.registry import get_resource
+from shared.tracing import file_context, record, span, trace_batch
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-# Ensure the uploaded file pointer is at the start
+# Psych evaluation CPTs
+PSYCH_CPTS = ["96130", "96131", "96138", "96139"]
 
+# pypdf parsing, header parsing and de-identification are pure-Python CPU
+# work, so they run in worker processes rather than threads sharing the GIL
+PDF_WORKERS = int(os.getenv("ROBERTSON_PDF_WORKERS", os.cpu_count() or 4))
+# Batched CPT requests in flight at most; the actual limit adapts below this
+LLM_MAX_WORKERS = int(os.getenv("ROBERTSON_LLM_WORKERS", 8))
+# Deadline for one batched request, including its retries and per-note fallbacks
+LLM_TIMEOUT = float(os.getenv("ROBERTSON_LLM_TIMEOUT", 300))
+# Slower requests than this mean the API is struggling, so concurrency backs off
+LLM_TARGET_SECONDS = float(os.getenv("ROBERTSON_LLM_TARGET_SECONDS", 60))
 
-def process_file(uploaded_file, cpt_icd_mapping_df):
-    uploaded_file.seek(0)
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-        tmp.write(uploaded_file.read())
-        tmp_path = tmp.name
+HEADERS = [
+    "Date",
+    "Appointment Type",
+    "Client Name",
+    "DOB",
+    "Service Code",
+    "Service Description",
+    "Clinician Name",
+    "POS",
+    "Modifier",
+    "Coding",
+    "Note Status",
+    "Status",
+    "Comments",
+]
 
-    text = load_pdf(tmp_path)    
-    clean = deidentify_and_strip(text)
-    phi_data = get_phi(text)
-    service_code = phi_data.get("Service Code", "")
 
-    # Psych evaluation CPTs
-    psych_cpts = ["96130", "96131", "96138", "96139"]
+def error_row(error) -> dict:
+    # Record the error as a result row so a failed file doesn't sink the batch
+    row = {h: "" for h in HEADERS}
+    row["Comments"] = f"Error processing file: {error}"
+    return row
+
+
+def results_dataframe(rows: list[dict]):
+    """Final results table: US-formatted dates, sorted by date, ICD issues in Comments."""
+    import pandas as pd
+    from shared.icd import add_icd_comments
+
+    results_df = pd.DataFrame(rows, columns=HEADERS + ["Primary Diagnosis"])
+    results_df = add_icd_comments(results_df, "Primary Diagnosis")[HEADERS]
+    results_df["Date"] = pd.to_datetime(
+        results_df["Date"].astype(str), dayfirst=True, errors="coerce"
+    ).dt.strftime("%m/%d/%y")
+    return results_df.sort_values(by="Date", ascending=True)
+
+
+def extract_note(uploaded_file) -> dict:
+    """Read the PDF and parse everything that does not need the LLM."""
+    # Parsed straight from the upload's buffer, no temp file
+    with span("load"):
+        text = load_pdf(uploaded_file)
+
+    # The header is parsed once and shared by every later stage
+    with span("phi_extract"):
+        header = parse_note_header(text)
+    with span("deidentify"):
+        clean = deidentify_and_strip(text)
+    return {
+        "filename": uploaded_file.name,
+        "text": text,
+        "clean": clean,
+        "header": header,
+        "phi_data": header.to_dict(),
+    }
+
 
-    if service_code in psych_cpts:
+def needs_cpt_prediction(note: dict) -> bool:
+    return note["phi_data"].get("Service Code", "") not in PSYCH_CPTS
+
+
+def rule_based_cpts(note: dict):
+    phi_data = note["phi_data"]
+    return resolve_cpt_by_rules(phi_data.get("Service Code", ""), phi_data.get("Duration"))
+
+
+def build_row(note: dict, cpt_descriptions, predicted_cpts=None) -> dict:
+    text, clean, phi_data = note["text"], note["clean"], note["phi_data"]
+    service_code = phi_data.get("Service Code", "")
+
+    if service_code in PSYCH_CPTS:
         # Run psych evaluation logic
-        psych_data = extract_psych_eval_data(text)
+        psych_data = extract_psych_eval_data(text, note["header"])
         units = psych_data["Follow up code Units"]
 
         # CPT description safely
         service_descriptions = []
-        service_desc_df = cpt_icd_mapping_df[cpt_icd_mapping_df["CPT"] == service_code]
-        if not service_desc_df.empty:
-            service_descriptions.append(service_desc_df["CPT Description"].iloc[0])
+        if service_code in cpt_descriptions:
+            service_descriptions.append(cpt_descriptions[service_code])
 
         # ICD codes from chart
         diagnosis_codes = sort_diagnosis_codes(phi_data.get("Diagnosis Codes", []))
@@ -47,7 +126,7 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
 
     else:
         # Normal flow for other CPTs (908x etc.)
-        predicted_cpts = predict_cpt_code(clean)
+        predicted_cpts = list(predicted_cpts)
         if "90840" in predicted_cpts and "90839" not in predicted_cpts:
             predicted_cpts.remove("90840")
 
@@ -55,7 +134,7 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
         diagnosis_codes = sort_diagnosis_codes(phi_data.get("Diagnosis Codes", []))
 
         # Note validation
-        validation_result = check_note(clean, uploaded_file.name)
+        validation_result = check_note(clean, note["filename"])
         comments_str = (
             f"Missing: {', '.join(validation_result['missing_sections'])}"
             if validation_result["missing_sections"]
@@ -63,8 +142,8 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
         )
         
         if not check_mental_status_assessed(clean):
-            note = "Current Mental Status not assessed."
-            comments_str = f"{comments_str} | {note}" if comments_str else note
+            comment = "Current Mental Status not assessed."
+            comments_str = f"{comments_str} | {comment}" if comments_str else comment
 
         clinician_name = phi_data.get("Clinician", "") or ""
         medicaid_clinicians = ["Kayla", "Kaeli", "Virginia", "Courtney"]
@@ -73,8 +152,8 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
             name.lower() in clinician_name.lower() for name in medicaid_clinicians
         )
         if service_code == "90837" and is_medicaid_clinician:
-            note = "Verify the H0004 with Medicaid guidelines."
-            comments_str = f"{comments_str} | {note}" if comments_str else note
+            comment = "Verify the H0004 with Medicaid guidelines."
+            comments_str = f"{comments_str} | {comment}" if comments_str else comment
 
         # Duration & CPT units
         duration_str = phi_data.get("Duration")
@@ -82,12 +161,8 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
         cpt_with_units = list(dict.fromkeys(cpt_with_units))
         # CPT descriptions safely
         service_descriptions = []
-        if service_code:
-            service_desc_df = cpt_icd_mapping_df[
-                cpt_icd_mapping_df["CPT"] == service_code
-            ]
-            if not service_desc_df.empty:
-                service_descriptions.append(service_desc_df["CPT Description"].iloc[0])
+        if service_code in cpt_descriptions:
+            service_descriptions.append(cpt_descriptions[service_code])
 
         # Build coding string using predicted CPT units and ICDs
         modifier = phi_data.get("Modifier", "") or ""
@@ -98,8 +173,8 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
         if service_code == "90791":
             ok, issue = check_biopsychosocial(clean)
             if not ok:
-                note = f"Section 'Biopsychosocial Assessment' {issue}."
-                comments_str = f"{comments_str} | {note}" if comments_str else note
+                comment = f"Section 'Biopsychosocial Assessment' {issue}."
+                comments_str = f"{comments_str} | {comment}" if comments_str else comment
 
     # Build row dictionary
     row = {
@@ -120,7 +195,138 @@ def process_file(uploaded_file, cpt_icd_mapping_df):
         "Status": "On Hold",
         "Comments": comments_str,
     }
-
-    import os
-    os.remove(tmp_path)
     return row
+
+
+def _extract_in_worker(name: str, data: bytes):
+    # Runs in a worker process, outside the batch's trace; the stage times
+    # travel back with the note and are recorded by the parent
+    with trace_batch(name, profile="", export=False) as trace:
+        note = extract_note(named_bytes(name, data))
+    return note, [(s.stage, s.seconds) for s in trace.spans]
+
+
+def get_pdf_pool(max_workers: int = PDF_WORKERS) -> ProcessPoolExecutor:
+    # Kept for the life of the process; worker startup is not free
+    return get_resource(
+        ("robertson_pdf_pool", max_workers), lambda: ProcessPoolExecutor(max_workers=max_workers)
+    )
+
+
+def process_file(uploaded_file, cpt_descriptions):
+    note = extract_note(uploaded_file)
+    predicted_cpts = None
+    if needs_cpt_prediction(note):
+        predicted_cpts = rule_based_cpts(note) or predict_cpt_code(note["clean"])
+    return build_row(note, cpt_descriptions, predicted_cpts)
+
+
+def get_llm_executor() -> AdaptiveExecutor:
+    # Shared by every batch in the process, so concurrent uploads share one limit
+    return get_adaptive_executor(
+        "robertson_llm",
+        max_workers=LLM_MAX_WORKERS,
+        timeout=LLM_TIMEOUT,
+        target_seconds=LLM_TARGET_SECONDS,
+    )
+
+
+def _predict_chunk(notes: dict[str, str]) -> dict:
+    predictions = predict_cpt_codes_batch(notes)
+    failures = [p for p in predictions.values() if isinstance(p, Exception)]
+    if failures and len(failures) == len(predictions):
+        # Nothing came back, so the LLM pool counts it against its concurrency
+        raise failures[0]
+    return predictions
+
+
+def process_files(
+    uploaded_files: dict, cpt_descriptions, max_workers=PDF_WORKERS, on_done=None, stats=None
+) -> dict:
+    """
+    Process {key: uploaded_file}. PDFs are parsed in `max_workers` processes;
+    CPTs are coded by rules where possible, and the other notes are sent in
+    batched LLM requests on the shared adaptive pool (get_llm_executor) as
+    soon as a batch fills up, so parsing and prediction overlap. Each row is
+    built as soon as its note's CPTs are known.
+
+    Returns {key: row or Exception}. `on_done(key, row_or_exception)` is called
+    as each file finishes or fails. If given, `stats` is filled with
+    "rule_resolved" and "llm_predicted" note counts.
+    """
+    results = {}
+    counts = {"rule_resolved": 0, "llm_predicted": 0}
+
+    def done(key, result):
+        results[key] = result
+        if on_done:
+            on_done(key, result)
+
+    def finish(key, note, predicted_cpts):
+        try:
+            with file_context(note["filename"]), span("validation"):
+                row = build_row(note, cpt_descriptions, predicted_cpts)
+        except Exception as e:
+            row = e
+        done(key, row)
+
+    llm = get_llm_executor()
+    notes, to_predict, llm_futures = {}, {}, {}
+    to_predict_tokens = 0
+
+    def flush():
+        nonlocal to_predict_tokens
+        for chunk in split_batches(to_predict):
+            llm_futures[llm.submit(_predict_chunk, chunk)] = chunk
+        to_predict.clear()
+        to_predict_tokens = 0
+
+    pool = get_pdf_pool(max(1, max_workers))
+    futures = {
+        pool.submit(_extract_in_worker, f.name, f.getvalue()): key
+        for key, f in uploaded_files.items()
+    }
+    for future in as_completed(futures):
+        key = futures[future]
+        try:
+            note, timings = future.result()
+        except Exception as e:
+            done(key, e)
+            continue
+        for stage, seconds in timings:
+            record(stage, seconds, note["filename"])
+
+        if not needs_cpt_prediction(note):
+            finish(key, note, None)
+            continue
+        rule_cpts = rule_based_cpts(note)
+        if rule_cpts:
+            counts["rule_resolved"] += 1
+            finish(key, note, rule_cpts)
+            continue
+
+        counts["llm_predicted"] += 1
+        notes[key] = note
+        to_predict[key] = note["clean"]
+        to_predict_tokens += estimate_tokens(note["clean"])
+        if len(to_predict) >= BATCH_MAX_NOTES or to_predict_tokens >= BATCH_TOKEN_BUDGET:
+            flush()
+    flush()
+
+    if stats is not None:
+        for name, count in counts.items():
+            stats[name] = stats.get(name, 0) + count
+
+    for future in as_completed(llm_futures):
+        chunk = llm_futures[future]
+        try:
+            predictions = future.result()
+        except Exception as e:
+            # Failed or past its deadline; the files are retried on the next run
+            predictions = dict.fromkeys(chunk, e)
+        for key in chunk:
+            if isinstance(predictions.get(key), Exception):
+                done(key, predictions[key])
+            else:
+                finish(key, notes[key], predictions.get(key))
+    return results
@@ -1,28 +1,33 @@
-import re
-from langchain_community.document_loaders import PyPDFLoader
+import io
+from pypdf import PdfReader
+
+from shared.deid import Deidentifier
+
+
+def load_pdf(pdf) -> str:
+    """Page texts joined by newlines, from raw bytes, a file-like upload or a path."""
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        # BytesIO shares the buffer rather than copying it
+        pdf = io.BytesIO(pdf)
+    elif hasattr(pdf, "seek"):
+        pdf.seek(0)
+    reader = PdfReader(pdf)
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+# Lines that carry PHI or letterhead are dropped whole before the note
+# reaches the LLM or the validators
+DEID = Deidentifier(
+    drop=[
+        r"(?i:(?:Patient|Clinician|Participants|Supervisor?):)",
+        r"(?i:DOB|Date and Time:)",
+        r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}",  # dates
+        r"\d{1,2}:\d{2}\s?(?:AM|PM|am|pm)",
+        r"Location|Clinic|Hospital|Center|LLC|LLP|PC",
+        r"License|http|www|Page \d+ of \d+",
+    ]
+)
 
-def load_pdf(file_path: str) -> str:
-    loader = PyPDFLoader(file_path)
-    documents = loader.load()
-    return "\n".join([doc.page_content for doc in documents])
 
 def deidentify_and_strip(text: str) -> str:
-    cleaned_lines = []
-    for line in text.splitlines():
-        line_stripped = line.strip()
-        if not line_stripped:
-            continue
-        if re.search(r"(Patient|Clinician|Participants|Supervisor?):", line_stripped, re.IGNORECASE):
-            continue
-        if re.search(r"DOB|Date and Time:", line_stripped, re.IGNORECASE):
-            continue
-        if re.search(r"\d{1,2}[/-]\d{1,2}[/-]\d{2,4}", line_stripped):  # dates
-            continue
-        if re.search(r"\d{1,2}:\d{2}\s?(AM|PM|am|pm)", line_stripped):
-            continue
-        if re.search(r"(Location|Clinic|Hospital|Center|LLC|LLP|PC)", line_stripped):
-            continue
-        if re.search(r"License|http|www|Page \d+ of \d+", line_stripped):
-            continue
-        cleaned_lines.append(line_stripped)
-    return "\n".join(cleaned_lines)
+    return DEID(text)
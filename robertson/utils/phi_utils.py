@@ -1,5 +1,7 @@
 import re
 import math
+import string
+from dataclasses import dataclass
 from datetime import datetime
 
 
@@ -29,93 +31,136 @@ def split_date_time(datetime_str: str):
         return format_date(datetime_str.strip()), ""
 
 
-def get_phi(note_text: str) -> dict:
-    details = {}
-
-    clinician_match = re.search(r"Clinician:\s*(.+)", note_text)
-    if clinician_match:
-        details["Clinician"] = clinician_match.group(1).strip()
-
-    # Supervisor
-    supervisor_match = re.search(r"Supervisor:\s*(.+)", note_text)
-    if supervisor_match:
-        details["Supervisor"] = supervisor_match.group(1).strip()
-
-    # Patient & DO
-    patient_match = re.search(r"Patient:\s*([^,]+),\s*DOB\s*([^\n]+)", note_text)
-    if patient_match:
-        details["Patient"] = patient_match.group(1).strip()
-        details["DOB"] = format_date(patient_match.group(2).strip())
-
-    # Date & Time
-    datetime_match = re.search(r"Date and Time:\s*([^\n]+)", note_text)
-    if datetime_match:
-        date_str, time_str = split_date_time(datetime_match.group(1))
-        details["Date"] = date_str
-        if time_str:
-            details["Time"] = time_str
-
-    # Duration
-    duration_match = re.search(r"Duration:\s*([^\n]+)", note_text)
-    if duration_match:
-        details["Duration"] = duration_match.group(1).strip()
-
-    # Service Code
-    service_code_match = re.search(r"Service Code:\s*([A-Z0-9]+)", note_text)
-    if service_code_match:
-        details["Service Code"] = service_code_match.group(1).strip()
-
-    # Diagnosis (ICD-10 extraction)
-    diagnosis_section = None
-
-    section_start = re.search(
-        r"(Diagnosis|Diagnoses|Dx)[:\-]?", note_text, re.IGNORECASE
-    )
-
-    if section_start:
-        diagnosis_section = note_text[section_start.start() :]
-    stop_match = re.search(
-        r"(Plan|Treatment|Intervention|Procedure|Assessment)[:\-]?",
-        diagnosis_section,
-        re.IGNORECASE,
-    )
-
-    if stop_match:
-        diagnosis_section = diagnosis_section[: stop_match.start()]
-
-    if diagnosis_section:
-        diagnosis_section = re.sub(r"([0-9])([A-Z])", r"\1 \2", diagnosis_section)
-
-        # Extract ICD-10 codes
-        icd_pattern = r"([A-TV-Z][0-9]{2}(?:\.[0-9A-Z]{1,4})?)"
-        diagnosis_codes = list(set(re.findall(icd_pattern, diagnosis_section)))
-
-        # Optional: remove trailing letters if accidentally captured
-        cleaned_codes = []
-        for code in diagnosis_codes:
-            if re.match(r".*[A-Z]$", code):
-                code = code[:-1]
-            cleaned_codes.append(code)
-        details["Diagnosis Codes"] = list(set(cleaned_codes))[::-1]
-
-    location_match = re.search(
-        r"^Location[:\-]?\s*(.*)$", note_text, re.IGNORECASE | re.MULTILINE
-    )
-
-    if location_match:
-        details["Location"] = location_match.group(1).strip()
-    else:
-        details["Location"] = ""
+# Labeled header fields, found in a single scan of the note
+_HEADER_RE = re.compile(
+    r"(Clinician|Supervisor|Patient|Date and Time|Duration|Service Code):\s*"
+)
+_HEADER_VALUE_RES = {
+    "Clinician": re.compile(r".+"),
+    "Supervisor": re.compile(r".+"),
+    "Patient": re.compile(r"([^,]+),\s*DOB\s*([^\n]+)"),
+    "Date and Time": re.compile(r"[^\n]+"),
+    "Duration": re.compile(r"[^\n]+"),
+    "Service Code": re.compile(r"[A-Z0-9]+"),
+}
+
+# Section boundaries are matched case-sensitively against an ASCII-lowercased
+# copy of the note, which is several times faster than re.IGNORECASE and keeps
+# offsets identical to the original text
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_DIAGNOSIS_START_RE = re.compile(r"diagnosis|diagnoses|dx")
+_DIAGNOSIS_STOP_RE = re.compile(r"plan|treatment|intervention|procedure|assessment")
+_DIGIT_LETTER_RE = re.compile(r"([0-9])([A-Z])")
+_ICD_RE = re.compile(r"([A-TV-Z][0-9]{2}(?:\.[0-9A-Z]{1,4})?)")
+_LOCATION_RE = re.compile(r"^Location[:\-]?\s*(.*)$", re.IGNORECASE | re.MULTILINE)
+_TELEHEALTH_RE = re.compile(r"telehealth|virtual|video", re.IGNORECASE)
+
+
+@dataclass
+class NoteHeader:
+    """Header fields parsed once from a Robertson note."""
+
+    clinician: str | None = None
+    supervisor: str | None = None
+    patient: str | None = None
+    dob: str | None = None
+    date: str | None = None
+    time: str | None = None
+    duration: str | None = None
+    service_code: str | None = None
+    diagnosis_codes: list[str] | None = None
+    location: str = ""
+    pos: str = "11"
+    modifier: str = ""
+
+    def to_dict(self) -> dict:
+        """The dict layout get_phi has always returned (missing fields omitted)."""
+        details = {}
+        for key, value in (
+            ("Clinician", self.clinician),
+            ("Supervisor", self.supervisor),
+            ("Patient", self.patient),
+            ("DOB", self.dob),
+            ("Date", self.date),
+            ("Time", self.time),
+            ("Duration", self.duration),
+            ("Service Code", self.service_code),
+            ("Diagnosis Codes", self.diagnosis_codes),
+        ):
+            if value is not None:
+                details[key] = value
+        details["Location"] = self.location
+        details["POS"] = self.pos
+        details["Modifier"] = self.modifier
+        return details
+
+
+def extract_diagnosis_codes(note_text: str) -> list[str] | None:
+    lowered = note_text.translate(_ASCII_LOWER)
+    section_start = _DIAGNOSIS_START_RE.search(lowered)
+    if not section_start:
+        return None
+
+    start = section_start.start()
+    stop_match = _DIAGNOSIS_STOP_RE.search(lowered, start)
+    diagnosis_section = note_text[start : stop_match.start() if stop_match else None]
+    if not diagnosis_section:
+        return None
+
+    diagnosis_section = _DIGIT_LETTER_RE.sub(r"\1 \2", diagnosis_section)
+
+    # Extract ICD-10 codes; drop a trailing letter if accidentally captured
+    cleaned_codes = []
+    for code in _ICD_RE.findall(diagnosis_section):
+        if "A" <= code[-1] <= "Z":
+            code = code[:-1]
+        cleaned_codes.append(code)
+    return list(dict.fromkeys(cleaned_codes))
+
+
+def parse_note_header(note_text: str) -> NoteHeader:
+    header = NoteHeader()
+    found = set()
+
+    for match in _HEADER_RE.finditer(note_text):
+        label = match.group(1)
+        if label in found:
+            continue
+        value = _HEADER_VALUE_RES[label].match(note_text, match.end())
+        if not value:
+            continue
+        found.add(label)
+
+        if label == "Clinician":
+            header.clinician = value.group(0).strip()
+        elif label == "Supervisor":
+            header.supervisor = value.group(0).strip()
+        elif label == "Patient":
+            header.patient = value.group(1).strip()
+            header.dob = format_date(value.group(2).strip())
+        elif label == "Date and Time":
+            date_str, time_str = split_date_time(value.group(0))
+            header.date = date_str
+            header.time = time_str or None
+        elif label == "Duration":
+            header.duration = value.group(0).strip()
+        elif label == "Service Code":
+            header.service_code = value.group(0)
+
+    header.diagnosis_codes = extract_diagnosis_codes(note_text)
+
+    location_match = _LOCATION_RE.search(note_text)
+    header.location = location_match.group(1).strip() if location_match else ""
 
     # Map Location to POS/Modifier
-    if re.search(r"telehealth|virtual|video", details["Location"], re.IGNORECASE):
-        details["POS"] = "10"
-        details["Modifier"] = "95"
-    else:
-        details["POS"] = "11"
-        details["Modifier"] = ""
+    if _TELEHEALTH_RE.search(header.location):
+        header.pos, header.modifier = "10", "95"
+
+    return header
 
-    return details
+
+def get_phi(note_text: str) -> dict:
+    return parse_note_header(note_text).to_dict()
 
 
 def ceilling_value(duration: str):
@@ -1,46 +1,49 @@
 # utils/psych_eval_utils.py
 import math
 import re
-from robertson.utils.phi_utils import get_phi
+from robertson.utils.phi_utils import NoteHeader, parse_note_header
+
+_TOTAL_TIME_RE = re.compile(
+    r"Total Time Spent\s*[:\-]?\s*(\d+)\s*minutes?", re.IGNORECASE
+)
+_PROCEDURES_RE = re.compile(
+    r"Procedures\s*(.*?)(?:Total Time Spent|Diagnosis|$)",
+    re.DOTALL | re.IGNORECASE,
+)
+_LETTER_DIGIT_RE = re.compile(r"([a-zA-Z])(\d+)")
+_MINUTES_RE = re.compile(r"\b\d+\s*minutes?\b", re.IGNORECASE)
+_PSYCHOMETRIST_RE = re.compile(
+    r"\b(administration by )?psychometrist\b", re.IGNORECASE
+)
 
 
 def extract_total_time(note_text: str) -> int:
-    match = re.search(
-        r"Total Time Spent\s*[:\-]?\s*(\d+)\s*minutes?", note_text, re.IGNORECASE
-    )
+    match = _TOTAL_TIME_RE.search(note_text)
     if match:
         return int(match.group(1))
     return 0
 
 
-def count_procedures(note_text: str) -> int:
-    procedures_match = re.search(
-        r"Procedures\s*(.*?)(?:Total Time Spent|Diagnosis|$)",
-        note_text,
-        re.DOTALL | re.IGNORECASE,
-    )
-    if not procedures_match:
+def _procedures_block(note_text: str) -> str | None:
+    procedures_match = _PROCEDURES_RE.search(note_text)
+    return procedures_match.group(1) if procedures_match else None
+
+
+def count_procedures(note_text: str, procedures_text: str | None = None) -> int:
+    if procedures_text is None:
+        procedures_text = _procedures_block(note_text)
+    if procedures_text is None:
         return 0
-    procedures_text = re.sub(r"([a-zA-Z])(\d+)", r"\1 \2", procedures_match.group(1))
-    matches = re.findall(r"\b\d+\s*minutes?\b", procedures_text, re.IGNORECASE)
-    return len(matches)
+    procedures_text = _LETTER_DIGIT_RE.sub(r"\1 \2", procedures_text)
+    return len(_MINUTES_RE.findall(procedures_text))
 
 
-def contains_psychometrist(note_text: str) -> bool:
-    procedures_match = re.search(
-        r"Procedures\s*(.*?)(?:Total Time Spent|Diagnosis|$)",
-        note_text,
-        re.DOTALL | re.IGNORECASE,
-    )
-    if not procedures_match:
+def contains_psychometrist(note_text: str, procedures_text: str | None = None) -> bool:
+    if procedures_text is None:
+        procedures_text = _procedures_block(note_text)
+    if procedures_text is None:
         return False
-    return bool(
-        re.search(
-            r"\b(administration by )?psychometrist\b",
-            procedures_match.group(1),
-            re.IGNORECASE,
-        )
-    )
+    return bool(_PSYCHOMETRIST_RE.search(procedures_text))
 
 
 def calculate_code_units(code, time):
@@ -57,13 +60,16 @@ def calculate_code_units(code, time):
         return 1
 
 
-def extract_psych_eval_data(text: str) -> dict:
-    phi_data = get_phi(text)
-    service_code = phi_data.get("Service Code", "")
-    diagnosis_codes = phi_data.get("Diagnosis Codes")
+def extract_psych_eval_data(text: str, header: NoteHeader | None = None) -> dict:
+    # Callers that already parsed the note pass its header to skip a re-parse
+    if header is None:
+        header = parse_note_header(text)
+    service_code = header.service_code or ""
+    diagnosis_codes = header.diagnosis_codes
     total_time = extract_total_time(text)
-    procedure_count = count_procedures(text)
-    by_psychometrist = contains_psychometrist(text)
+    procedures_text = _procedures_block(text)
+    procedure_count = count_procedures(text, procedures_text)
+    by_psychometrist = contains_psychometrist(text, procedures_text)
     code_units = calculate_code_units(service_code, total_time)
 
     return {
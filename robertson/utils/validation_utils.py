@@ -9,13 +9,21 @@ required_sections = {
 }
 
 
+# Content between 'Objectives' and the next section
+_OBJECTIVES_RE = re.compile(
+    r"Treatment\s*Plan\s*Progress.*?Objectives(.*?)(?:\n(?:Plan|Assessment|Additional\s*Notes)|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_BIOPSYCHOSOCIAL_RE = re.compile(
+    r"\bBiopsychosocial\s+Assessment\b"
+    r"(.*?)(?:\n(?:Plan|Assessment|Additional Notes)|$)",
+    re.IGNORECASE | re.DOTALL,
+)
+_MENTAL_STATUS_RE = re.compile(r"Current Mental Status\s*\n((?:.*\n){1,20})")
+
+
 def has_objectives_content(text):
-    # Extract the content between 'Objectives' and the next section
-    pattern = re.compile(
-        r"Treatment\s*Plan\s*Progress.*?Objectives(.*?)(?:\n(?:Plan|Assessment|Additional\s*Notes)|$)",
-        re.IGNORECASE | re.DOTALL,
-    )
-    match = pattern.search(text)
+    match = _OBJECTIVES_RE.search(text)
     if not match:
         return False  # No objectives section at all
 
@@ -39,12 +47,7 @@ def check_note(note_text: str, filename: str):
 
 
 def check_biopsychosocial(note_text: str, min_words: int = 200) -> tuple[bool, str]:
-    section_regex = r"\bBiopsychosocial\s+Assessment\b" 
-    match = re.search(
-        section_regex + r"(.*?)(?:\n(?:Plan|Assessment|Additional Notes)|$)",
-        note_text,
-        re.IGNORECASE | re.DOTALL,
-    )
+    match = _BIOPSYCHOSOCIAL_RE.search(note_text)
     if not match:
         return False, "missing"
     content = match.group(1).strip()
@@ -55,10 +58,7 @@ def check_biopsychosocial(note_text: str, min_words: int = 200) -> tuple[bool, s
 
 
 def check_mental_status_assessed(note_text: str) -> bool:
-    match = re.search(
-        r"Current Mental Status\s*\n((?:.*\n){1,20})",
-        note_text,
-    )
+    match = _MENTAL_STATUS_RE.search(note_text)
     if match:
         cms_section = match.group(1)
         if "Not Assessed" in cms_section:
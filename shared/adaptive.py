@@ -0,0 +1,187 @@
+"""
+Thread pool whose concurrency follows the service its tasks call.
+
+AdaptiveExecutor runs at most `limit` tasks at once and moves the limit
+AIMD-style, like TCP congestion control. A task that succeeds within
+`target_seconds` adds 1/limit (about +1 per round of tasks). A task that runs
+slower than the target halves it, and so does a failure or missed deadline
+once the recent error rate (a moving average over tasks) passes
+`error_threshold`; a single transient error leaves the limit alone. Only
+tasks started after the last decrease can trigger another, so one bad
+round halves the limit once, not once per task. A batch ramps up while the
+API keeps up and backs off as soon as it struggles. This comes on top of
+the rate limits in shared.llm_client.
+
+Each task can have a deadline, counted from when it starts running. When it
+passes, the task's future fails with TimeoutError, but the task keeps its
+slot until its call actually returns, so no more than `limit` calls are ever
+in flight. The task sees the deadline through deadline_remaining() /
+check_deadline(); LLMClient checks it before every attempt and sleep, so a
+late task stops instead of retrying. A call already on the wire is bounded
+by the client's request timeout.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from shared.registry import get_resource
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+def deadline_remaining() -> float | None:
+    """Seconds left before the current task's deadline; None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check_deadline() -> None:
+    remaining = deadline_remaining()
+    if remaining is not None and remaining <= 0:
+        raise TimeoutError("Task deadline passed")
+
+
+@dataclass
+class _Task:
+    fn: object
+    args: tuple
+    timeout: float | None
+    future: Future = field(default_factory=Future)
+    # Run in the submitter's context, so tracing spans keep their batch and file
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+    started: float = 0.0
+    finished: bool = False
+    timer: threading.Timer | None = None
+
+
+class AdaptiveExecutor:
+    def __init__(
+        self,
+        min_workers: int = 1,
+        max_workers: int = 8,
+        initial: int | None = None,
+        timeout: float | None = None,
+        target_seconds: float | None = None,
+        decrease: float = 0.5,
+        error_threshold: float = 0.15,
+        name: str = "adaptive",
+    ):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.limit = float(min(self.max_workers, max(self.min_workers, initial or 2)))
+        self.timeout = timeout
+        self.target_seconds = target_seconds
+        self.decrease = decrease
+        self.error_threshold = error_threshold
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.mean_seconds = None
+        self.error_rate = 0.0
+        # A task holds its slot until it returns, so this many threads suffice
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._queue = deque()
+        self._active = 0
+        self._last_decrease = 0.0
+
+    def submit(self, fn, *args, timeout: float | None = None) -> Future:
+        """Queue fn(*args); `timeout` overrides the executor's deadline."""
+        task = _Task(fn, args, timeout if timeout is not None else self.timeout)
+        with self._lock:
+            self._queue.append(task)
+        self._dispatch()
+        return task.future
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue or self._active >= int(self.limit):
+                    return
+                task = self._queue.popleft()
+                if not task.future.set_running_or_notify_cancel():
+                    # Cancelled while queued
+                    continue
+                self._active += 1
+            self._pool.submit(task.context.run, self._run, task)
+
+    def _run(self, task: _Task) -> None:
+        # The deadline starts now, not while the task waited for a thread
+        task.started = time.monotonic()
+        if task.timeout is not None:
+            _deadline.set(task.started + task.timeout)
+            task.timer = threading.Timer(task.timeout, self._expire, (task,))
+            task.timer.daemon = True
+            task.timer.start()
+        try:
+            result = task.fn(*task.args)
+        except Exception as e:
+            self._finish(task, error=e)
+        else:
+            self._finish(task, result=result)
+        finally:
+            # Only a returned call frees its slot, even after a timeout
+            with self._lock:
+                self._active -= 1
+            self._dispatch()
+
+    def _expire(self, task: _Task) -> None:
+        error = TimeoutError(f"No result within {task.timeout:g}s")
+        self._finish(task, error=error, timed_out=True)
+
+    def _finish(self, task: _Task, result=None, error=None, timed_out=False) -> None:
+        with self._lock:
+            if task.finished:
+                # The deadline already answered for this task
+                return
+            task.finished = True
+            self._adjust(task, time.monotonic() - task.started, error is None, timed_out)
+        if task.timer is not None:
+            task.timer.cancel()
+        if error is None:
+            task.future.set_result(result)
+        else:
+            task.future.set_exception(error)
+
+    def _adjust(self, task: _Task, seconds: float, ok: bool, timed_out: bool) -> None:
+        # Called with the lock held
+        self.completed += 1
+        self.failed += not ok
+        self.timed_out += timed_out
+        self.error_rate = 0.9 * self.error_rate + 0.1 * (not ok)
+        if ok:
+            self.mean_seconds = (
+                seconds if self.mean_seconds is None else 0.8 * self.mean_seconds + 0.2 * seconds
+            )
+
+        slow = self.target_seconds is not None and seconds > self.target_seconds
+        if ok and not slow:
+            self.limit = min(self.max_workers, self.limit + 1 / self.limit)
+            return
+        # About two failures in a row with the default weights; one is noise
+        if not ok and self.error_rate <= self.error_threshold:
+            return
+        if task.started >= self._last_decrease:
+            self.limit = max(self.min_workers, self.limit * self.decrease)
+            self._last_decrease = time.monotonic()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "limit": int(self.limit),
+                "active": self._active,
+                "queued": len(self._queue),
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "mean_seconds": self.mean_seconds,
+                "error_rate": self.error_rate,
+            }
+
+
+def get_adaptive_executor(name: str, **kwargs) -> AdaptiveExecutor:
+    """One executor per name for the whole process, so every batch shares its limit."""
+    return get_resource(("adaptive_executor", name), lambda: AdaptiveExecutor(name=name, **kwargs))
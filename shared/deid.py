@@ -0,0 +1,187 @@
+"""
+De-identification engine shared by the practices.
+
+A practice describes its PHI as rules and gets one compiled pattern back:
+
+    deid = Deidentifier(
+        mask=[MaskRule(r"\\b\\d{3}-\\d{3}-\\d{4}\\b", "[PHONE]")],
+        drop=[r"(?i:DOB)"],
+    )
+    deid(text)
+
+Mask rules are joined into a single alternation and applied in one scan;
+where two rules could match at the same position, the earlier rule wins.
+Drop rules are joined the same way and remove every line they match, so each
+line is searched once instead of once per rule. Rule patterns must not
+contain capturing groups; use (?:...) and lookarounds instead.
+
+Python's re tries every branch of an alternation at every position, which
+makes a naive combined pattern slower than the separate passes it replaces.
+So the combined pattern starts with the set of characters any rule can start
+with, which re scans for without entering the branches, and only then checks
+the rules at that position.
+"""
+import re
+from dataclasses import dataclass
+
+try:
+    from re import _constants as _sre, _parser as _sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants as _sre
+    import sre_parse as _sre_parse
+
+# Building blocks several practices use
+DATE = r"\b\d{1,2}/\d{1,2}/\d{2,4}\b"
+PHONE = r"\b\d{3}-\d{3}-\d{4}\b"
+URL = r"https?://\S+"
+
+_CATEGORIES = {
+    _sre.CATEGORY_DIGIT: r"\d",
+    _sre.CATEGORY_NOT_DIGIT: r"\D",
+    _sre.CATEGORY_SPACE: r"\s",
+    _sre.CATEGORY_NOT_SPACE: r"\S",
+    _sre.CATEGORY_WORD: r"\w",
+    _sre.CATEGORY_NOT_WORD: r"\W",
+}
+_REPEATS = {_sre.MAX_REPEAT, _sre.MIN_REPEAT} | (
+    {_sre.POSSESSIVE_REPEAT} if hasattr(_sre, "POSSESSIVE_REPEAT") else set()
+)
+
+
+@dataclass(frozen=True)
+class MaskRule:
+    pattern: str
+    replacement: str
+
+
+def _literal(code: int, ignorecase: bool) -> set[str]:
+    c = chr(code)
+    variants = {c, c.lower(), c.upper()} if ignorecase else {c}
+    return {re.escape(v) for v in variants if len(v) == 1}
+
+
+def _charset(items, ignorecase: bool) -> set[str] | None:
+    fragments = set()
+    for op, av in items:
+        if op is _sre.LITERAL:
+            fragments |= _literal(av, ignorecase)
+        elif op is _sre.CATEGORY and av in _CATEGORIES:
+            fragments.add(_CATEGORIES[av])
+        elif op is _sre.RANGE and not ignorecase:
+            fragments.add(f"{re.escape(chr(av[0]))}-{re.escape(chr(av[1]))}")
+        else:
+            return None
+    return fragments
+
+
+def _first_chars(items, flags: int) -> tuple[set[str] | None, bool]:
+    """
+    Character-class fragments a match of `items` can start with, and whether
+    it can be empty. None means unknown (e.g. `.` or a negated class).
+    """
+    ignorecase = bool(flags & re.IGNORECASE)
+    fragments = set()
+    for op, av in items:
+        if op in (_sre.AT, _sre.ASSERT, _sre.ASSERT_NOT):
+            # Anchors and lookarounds don't consume a character
+            continue
+        if op is _sre.LITERAL:
+            return fragments | _literal(av, ignorecase), False
+        if op is _sre.IN:
+            chars = _charset(av, ignorecase)
+            return (None, False) if chars is None else (fragments | chars, False)
+
+        if op is _sre.SUBPATTERN:
+            _, add_flags, del_flags, sub = av
+            found, nullable = _first_chars(sub.data, (flags | add_flags) & ~del_flags)
+        elif op is _sre.BRANCH:
+            found, nullable = set(), False
+            for alternative in av[1]:
+                alt_found, alt_nullable = _first_chars(alternative.data, flags)
+                if alt_found is None:
+                    return None, False
+                found |= alt_found
+                nullable = nullable or alt_nullable
+        elif op in _REPEATS:
+            low, _, sub = av
+            found, nullable = _first_chars(sub.data, flags)
+            nullable = nullable or low == 0
+        else:
+            return None, False
+
+        if found is None:
+            return None, False
+        fragments |= found
+        if not nullable:
+            return fragments, False
+    return fragments, True
+
+
+def _combine(patterns: list[str], flags: int) -> re.Pattern:
+    """
+    One pattern whose group i + 1 spans a match of patterns[i]. Matches are
+    one character wide when the first-character set is known; use the group
+    span, not the match span.
+    """
+    fragments = set()
+    for pattern in patterns:
+        if re.compile(pattern, flags).groups:
+            raise ValueError(f"De-identification rule has a capturing group: {pattern!r}")
+        if fragments is not None:
+            found, nullable = _first_chars(_sre_parse.parse(pattern, flags).data, flags)
+            fragments = None if found is None or nullable else fragments | found
+
+    alternation = "|".join(f"({p})" for p in patterns)
+    if not fragments:
+        return re.compile(alternation, flags)
+    if flags & re.IGNORECASE:
+        # The character set already lists both cases; a case-insensitive
+        # set would lose re's fast scan
+        alternation = f"(?i:{alternation})"
+    # Stop on a possible first character, then look back one and try the rules there
+    return re.compile(
+        f"[{''.join(sorted(fragments))}](?<=(?={alternation})[\\s\\S])",
+        flags & ~re.IGNORECASE,
+    )
+
+
+class Deidentifier:
+    def __init__(self, mask: list[MaskRule] = (), drop: list[str] = (), flags: int = 0):
+        self.mask_rules = list(mask)
+        self.drop_rules = list(drop)
+        # Group i + 1 of the combined pattern is mask rule i
+        self._replacements = [None] + [r.replacement for r in self.mask_rules]
+        self._mask_re = (
+            _combine([r.pattern for r in self.mask_rules], flags) if self.mask_rules else None
+        )
+        self._drop_re = _combine(self.drop_rules, flags) if self.drop_rules else None
+
+    def mask(self, text: str) -> str:
+        if self._mask_re is None:
+            return text
+        parts, last = [], 0
+        for match in self._mask_re.finditer(text):
+            rule = match.lastindex
+            start, end = match.span(rule)
+            if start < last:
+                # Inside text an earlier rule already replaced
+                continue
+            parts.append(text[last:start])
+            parts.append(self._replacements[rule])
+            last = end
+        parts.append(text[last:])
+        return "".join(parts)
+
+    def strip(self, text: str) -> str:
+        """Stripped non-empty lines, minus those a drop rule matches."""
+        search = self._drop_re.search if self._drop_re is not None else None
+        kept = []
+        for line in text.splitlines():
+            line = line.strip()
+            if line and not (search and search(line)):
+                kept.append(line)
+        return "\n".join(kept)
+
+    def __call__(self, text: str) -> str:
+        text = self.mask(text)
+        return self.strip(text) if self._drop_re is not None else text
@@ -0,0 +1,61 @@
+import io
+import math
+
+import xlsxwriter
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# Same look as the header pandas.DataFrame.to_excel writes
+HEADER_FORMAT = {"bold": True, "border": 1, "align": "center", "valign": "top"}
+
+
+def _cell(value):
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, (list, tuple, set)):
+        return ", ".join(str(v) for v in value)
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+class ExcelStreamWriter:
+    """
+    Write result rows to an .xlsx one at a time.
+
+    Uses xlsxwriter's constant_memory mode, so each row is flushed as soon as
+    the next one starts and memory stays flat regardless of batch size. Rows
+    must be appended in their final order.
+    """
+
+    def __init__(self, columns, sheet_name: str = "Results", output=None):
+        self.output = output if output is not None else io.BytesIO()
+        self.workbook = xlsxwriter.Workbook(self.output, {"constant_memory": True})
+        self.sheet = self.workbook.add_worksheet(sheet_name)
+        self.columns = list(columns)
+        self.sheet.write_row(
+            0, 0, self.columns, self.workbook.add_format(HEADER_FORMAT)
+        )
+        self.next_row = 1
+
+    def append_values(self, values) -> None:
+        self.sheet.write_row(self.next_row, 0, [_cell(v) for v in values])
+        self.next_row += 1
+
+    def append(self, row: dict) -> None:
+        self.append_values(row.get(c) for c in self.columns)
+
+    def close(self) -> bytes:
+        self.workbook.close()
+        if isinstance(self.output, io.BytesIO):
+            return self.output.getvalue()
+        return b""
+
+
+def dataframe_to_excel_bytes(df, sheet_name: str = "Results") -> bytes:
+    writer = ExcelStreamWriter([str(c) for c in df.columns], sheet_name)
+    for values in df.itertuples(index=False, name=None):
+        writer.append_values(values)
+    return writer.close()
@@ -0,0 +1,135 @@
+"""
+Batch ICD-10-CM validation.
+
+Codes are pulled from a whole column of texts with one str.extractall, and
+checked with one binary search against a sorted array of the code set, so a
+batch costs a handful of vectorized calls rather than a regex and a lookup
+loop per note.
+
+The code set is the CMS ICD-10-CM order file (icd10cm_order_<year>.txt from
+https://www.cms.gov/medicare/coding-billing/icd-10-codes), placed at
+ICD10CM_ORDER_FILE. It is not shipped with the repo; without it validation is
+skipped, and the apps and batch.py show code_set_warning() instead.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from shared.registry import get_resource
+
+ICD10CM_PATH = Path(os.getenv("ICD10CM_ORDER_FILE", "shared/data/icd10cm_order.txt"))
+# One capture group, as str.extractall expects; the index decides what is real
+ICD_PATTERN = r"\b([A-Z][0-9][0-9A-Z](?:\.[0-9A-Z]{1,4})?)\b"
+
+VALID = "valid"
+NON_BILLABLE = "non_billable"
+INVALID = "invalid"
+
+_ISSUE_LABELS = {INVALID: "Invalid ICD-10", NON_BILLABLE: "Non-billable ICD-10"}
+
+
+class ICDIndex:
+    """Sorted array of codes (no dot, bytes) with a billable flag per code."""
+
+    def __init__(self, codes: list[str], billable: list[bool]):
+        codes = np.char.encode(np.asarray(codes, dtype=str), "ascii")
+        order = np.argsort(codes)
+        self.codes = codes[order]
+        self.billable = np.asarray(billable, dtype=bool)[order]
+
+    @classmethod
+    def from_order_file(cls, path: Path) -> "ICDIndex":
+        # Fixed width: order number (5), code (7), billable flag (1), descriptions
+        codes, billable = [], []
+        with open(path, encoding="latin-1") as f:
+            for line in f:
+                if len(line) > 14:
+                    codes.append(line[6:13].strip())
+                    billable.append(line[14] == "1")
+        return cls(codes, billable)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def status(self, codes) -> np.ndarray:
+        """VALID, NON_BILLABLE or INVALID for each code, dotted or not."""
+        query = np.asarray(codes, dtype=str)
+        if not query.size or not len(self.codes):
+            return np.full(query.shape, INVALID, dtype=object)
+        # Non-ASCII characters become "?", which matches no code
+        query = np.char.encode(
+            np.char.replace(np.char.upper(query), ".", ""), "ascii", "replace"
+        )
+        pos = np.searchsorted(self.codes, query).clip(max=len(self.codes) - 1)
+        found = self.codes[pos] == query
+        return np.where(
+            ~found, INVALID, np.where(self.billable[pos], VALID, NON_BILLABLE)
+        ).astype(object)
+
+
+def code_set_warning(path: Path = ICD10CM_PATH) -> str | None:
+    """Why ICD codes are not being validated; None when the code set is installed."""
+    if Path(path).exists():
+        return None
+    return (
+        f"ICD-10-CM code set not found at {path}, so ICD codes are not validated. "
+        "Download icd10cm_order_<year>.txt from CMS and place it there "
+        "(or set ICD10CM_ORDER_FILE)."
+    )
+
+
+def get_icd_index(path: Path = ICD10CM_PATH) -> ICDIndex | None:
+    if not Path(path).exists():
+        return None
+    return get_resource(("icd_index", str(path)), lambda: ICDIndex.from_order_file(path))
+
+
+def extract_codes(texts: pd.Series, pattern: str = ICD_PATTERN) -> pd.Series:
+    """Every code match in every text: one row per match, indexed (position, match)."""
+    texts = texts.reset_index(drop=True).fillna("").astype(str)
+    return texts.str.extractall(pattern)[0]
+
+
+def icd_issues(texts: pd.Series, index: ICDIndex | None = None) -> pd.Series:
+    """
+    Per text, e.g. "Invalid ICD-10: F99.99 | Non-billable ICD-10: F33", or ""
+    when every code is billable (or no code set is installed).
+    """
+    index = index if index is not None else get_icd_index()
+    issues = pd.Series("", index=range(len(texts)), dtype=object)
+    if index is not None:
+        codes = extract_codes(texts)
+        status = pd.Series(index.status(codes.to_numpy()), index=codes.index)
+        for label, name in _ISSUE_LABELS.items():
+            flagged = codes[status == label]
+            if flagged.empty:
+                continue
+            joined = flagged.groupby(level=0).agg(lambda s: ", ".join(dict.fromkeys(s)))
+            current = issues.loc[joined.index]
+            issues.loc[joined.index] = np.where(
+                current == "", name + ": " + joined, current + " | " + name + ": " + joined
+            )
+    issues.index = texts.index
+    return issues
+
+
+def add_icd_comments(
+    df: pd.DataFrame, codes_column: str, comments_column: str = "Comments"
+) -> pd.DataFrame:
+    """Append icd_issues for `codes_column` to each row's comments."""
+    if df.empty or codes_column not in df:
+        return df
+    issues = icd_issues(df[codes_column])
+    if not (issues != "").any():
+        return df
+    comments = (
+        df[comments_column].fillna("").astype(str)
+        if comments_column in df
+        else pd.Series("", index=df.index)
+    )
+    df[comments_column] = np.where(
+        comments == "", issues, np.where(issues == "", comments, comments + " | " + issues)
+    )
+    return df
@@ -0,0 +1,126 @@
+"""
+Background queue that runs batches outside the Streamlit script.
+
+A batch submitted here runs on one of a few worker threads shared by every
+session in the process, so widget interactions and reruns don't block or
+restart it, and batches from different coders run side by side instead of
+waiting on each other's script runs. The script only submits and polls:
+
+    job = get_job_queue().submit("pcol", process_batch, files, mapping)
+    st.session_state.pcol_batch_job = job.id
+    ...
+    job = get_job_queue().get(st.session_state.pcol_batch_job)
+    job.completed, job.total, job.rows, job.result
+
+The batch function is called as fn(job, *args) and reports progress through
+job.add_row / job.set_message; its return value becomes job.result. It must
+not touch Streamlit, whose session state belongs to the script thread.
+"""
+import io
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from shared.registry import get_resource
+
+# Batches run at once; each one parallelizes its own files
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "2"))
+# Finished batches are forgotten after this long
+KEEP_SECONDS = 6 * 3600
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class BatchJob:
+    id: str
+    practice: str
+    total: int
+    status: str = QUEUED
+    completed: int = 0
+    message: str = ""
+    rows: list = field(default_factory=list)
+    result: object = None
+    error: str | None = None
+    submitted: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+
+    def add_row(self, row: dict, files: int = 1) -> None:
+        """A finished row; `files` is how many uploads it stands for."""
+        self.rows.append(row)
+        self.completed += files
+
+    def set_message(self, message: str) -> None:
+        self.message = message
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def progress(self) -> float:
+        return min(self.completed / self.total, 1.0) if self.total else 1.0
+
+
+def named_bytes(name: str, data: bytes) -> io.BytesIO:
+    # Stand-in for Streamlit's UploadedFile, which belongs to the script run
+    f = io.BytesIO(data)
+    f.name = name
+    return f
+
+
+class JobQueue:
+    def __init__(self, workers: int = BATCH_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, practice: str, fn, *args, total: int = 0) -> BatchJob:
+        job = BatchJob(uuid.uuid4().hex, practice, total)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def _run(self, job: BatchJob, fn, args) -> None:
+        job.status, job.started = RUNNING, time.time()
+        try:
+            job.result = fn(job, *args)
+            job.status = DONE
+        except Exception as e:
+            print(f"Batch {job.id} ({job.practice}) failed: {e}")
+            job.error, job.status = str(e), FAILED
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id: str | None) -> BatchJob | None:
+        return self._jobs.get(job_id) if job_id else None
+
+    def ahead_of(self, job: BatchJob) -> int:
+        """Batches submitted earlier that are still waiting for a worker."""
+        return sum(
+            1
+            for other in list(self._jobs.values())
+            if other.status == QUEUED and other.submitted < job.submitted
+        )
+
+    def _prune(self) -> None:
+        cutoff = time.time() - KEEP_SECONDS
+        for job_id in [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished is not None and job.finished < cutoff
+        ]:
+            del self._jobs[job_id]
+
+
+def get_job_queue() -> JobQueue:
+    return get_resource("job_queue", JobQueue)
@@ -0,0 +1,205 @@
+"""
+Append-only, crash-safe record of the files in a batch.
+
+Every change to a file's job (running, done, failed) is appended to a JSONL
+log and fsynced, so a crash loses at most the line being written and a
+checkpoint costs one short write per file instead of rewriting the batch.
+Replaying the log gives each job's latest state; rerunning the same batch
+only reprocesses files that are not done.
+
+Each batch (set of file keys) has its own log, <root>/<namespace>/<batch_id>.jsonl,
+so batches running at the same time never share or move each other's logs.
+A run that gets to the end closes its log; a log that is not closed belongs
+to an interrupted run.
+
+    with open_batch("pcol", keys) as store:
+        for key in store.pending(keys):
+            store.start(key, name)
+            ...
+            store.finish(key, row)  # or store.fail(key, error)
+        store.complete()
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, fields
+from pathlib import Path
+
+DEFAULT_ROOT = Path(os.getenv("JOB_STORE_DIR", ".cache/jobs"))
+# Closed logs hold result rows (PHI), so they are not kept forever
+MAX_AGE_DAYS = 30
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+@dataclass
+class Job:
+    key: str
+    name: str = ""
+    status: str = RUNNING
+    attempts: int = 0
+    started: float | None = None
+    finished: float | None = None
+    seconds: float | None = None
+    row: dict | None = None
+    error: str | None = None
+
+
+_JOB_FIELDS = {f.name for f in fields(Job)}
+
+
+def read_jobs(path: Path) -> tuple[dict | None, dict[str, Job]]:
+    """
+    Replay a log: (header, {key: Job}) in the order files first appeared. The
+    header has "closed" if the last run of the batch got to the end.
+    """
+    header, jobs = None, {}
+    try:
+        f = open(path, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return None, jobs
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn line from a crash; that file simply isn't done
+                continue
+            if "key" not in entry:
+                # The header, or a run closing the batch
+                header = {**(header or {}), **entry}
+                continue
+            if header is not None:
+                # A later run reopened the batch
+                header.pop("closed", None)
+            job = jobs.setdefault(entry["key"], Job(entry["key"]))
+            for name, value in entry.items():
+                if name in _JOB_FIELDS:
+                    setattr(job, name, value)
+    return header, jobs
+
+
+def batch_id(keys) -> str:
+    return hashlib.sha256("\n".join(sorted(set(keys))).encode("utf-8")).hexdigest()
+
+
+class JobStore:
+    def __init__(self, path: Path, batch: str = ""):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        header, self.jobs = read_jobs(self.path)
+        self.batch = header["batch"] if header else batch
+        self._lock = threading.Lock()
+        self._clocks = {}
+        self._file = open(self.path, "a+", encoding="utf-8")
+        if self._file.tell() and not self._ends_with_newline():
+            # Don't glue the next entry onto a torn line
+            self._file.write("\n")
+        if header is None:
+            self._append({"batch": batch, "created": time.time()})
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _append(self, entry: dict) -> None:
+        with self._lock:
+            self._file.write(json.dumps(entry, default=str) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _update(self, key: str, **changes) -> Job:
+        with self._lock:
+            job = self.jobs.setdefault(key, Job(key))
+            for name, value in changes.items():
+                setattr(job, name, value)
+        self._append({"key": key, **changes})
+        return job
+
+    def start(self, key: str, name: str = "") -> Job:
+        self._clocks[key] = time.perf_counter()
+        attempts = self.jobs[key].attempts + 1 if key in self.jobs else 1
+        return self._update(
+            key, name=name, status=RUNNING, attempts=attempts, started=time.time()
+        )
+
+    def _elapsed(self, key: str) -> float | None:
+        started = self._clocks.pop(key, None)
+        return None if started is None else round(time.perf_counter() - started, 3)
+
+    def finish(self, key: str, row: dict) -> Job:
+        return self._update(
+            key, status=DONE, finished=time.time(), seconds=self._elapsed(key), row=row, error=None
+        )
+
+    def fail(self, key: str, error) -> Job:
+        return self._update(
+            key, status=FAILED, finished=time.time(), seconds=self._elapsed(key), error=str(error)
+        )
+
+    def is_done(self, key: str) -> bool:
+        job = self.jobs.get(key)
+        return job is not None and job.status == DONE
+
+    def pending(self, keys) -> list[str]:
+        """Keys that are missing, failed or were cut off while running."""
+        return [key for key in keys if not self.is_done(key)]
+
+    def rows(self) -> dict[str, dict]:
+        return {key: job.row for key, job in self.jobs.items() if job.status == DONE}
+
+    def counts(self) -> dict[str, int]:
+        counts = {}
+        for job in self.jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def complete(self) -> None:
+        """Mark the run as finished, failed files included (see interrupted_jobs)."""
+        self._append({"closed": time.time()})
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def log_path(namespace: str, batch: str, root: Path = DEFAULT_ROOT) -> Path:
+    return Path(root) / namespace / f"{batch}.jsonl"
+
+
+def prune_logs(namespace: str, root: Path = DEFAULT_ROOT, max_age_days: float = MAX_AGE_DAYS) -> None:
+    """Delete logs that have not been written to in `max_age_days`."""
+    cutoff = time.time() - max_age_days * 86400
+    for path in (Path(root) / namespace).glob("*.jsonl"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            continue
+
+
+def open_batch(namespace: str, keys, root: Path = DEFAULT_ROOT) -> JobStore:
+    """The store for this set of files; the same files resume the same log."""
+    prune_logs(namespace, root)
+    batch = batch_id(keys)
+    return JobStore(log_path(namespace, batch, root), batch)
+
+
+def interrupted_jobs(namespace: str, batch: str | None, root: Path = DEFAULT_ROOT) -> dict[str, Job]:
+    """Jobs of `batch` if its last run never completed, else {}."""
+    if not batch:
+        return {}
+    header, jobs = read_jobs(log_path(namespace, batch, root))
+    if header is None or "closed" in header:
+        return {}
+    return jobs
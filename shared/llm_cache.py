@@ -0,0 +1,198 @@
+"""
+Persistent cache of structured LLM responses.
+
+Keyed by model, temperature, output schema and a hash of the prompt with
+whitespace normalized, and stored as the validated pydantic JSON in a local
+SQLite file. Entries expire after a TTL; past `max_entries` the least
+recently used are evicted. A hit replays the earlier answer, which is what
+the coding pipelines want: the same note always gets the same codes.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from shared.registry import get_resource
+
+DEFAULT_PATH = Path(".cache/llm_responses.sqlite3")
+DEFAULT_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", 30))
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 50_000))
+# Set LLM_CACHE=0 to always call the model
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+# Eviction runs every this many puts
+EVICT_EVERY = 100
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_usage = contextvars.ContextVar("llm_cache_usage", default=None)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return _WHITESPACE_RE.sub(" ", str(prompt)).strip()
+
+
+def _schema_name(schema) -> str:
+    return getattr(schema, "__qualname__", None) or str(schema)
+
+
+def _dump(result) -> str:
+    if hasattr(result, "model_dump_json"):
+        return result.model_dump_json()
+    return json.dumps(result)
+
+
+def _load(schema, value: str):
+    if hasattr(schema, "model_validate_json"):
+        return schema.model_validate_json(value)
+    return json.loads(value)
+
+
+def _with_rates(counts: dict) -> dict:
+    stats = dict(counts)
+    stats["misses"] = stats["lookups"] - stats["hits"]
+    stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+    return stats
+
+
+class CacheUsage:
+    """Lookups and hits of the calls made inside one cache_usage() block."""
+
+    def __init__(self):
+        self.counts = {"lookups": 0, "hits": 0, "saved_seconds": 0.0}
+
+    def stats(self) -> dict:
+        return _with_rates(self.counts)
+
+
+@contextmanager
+def cache_usage():
+    """
+    Count cache use for one batch. Tasks started inside the block (threads
+    via copy_context, asyncio tasks) count toward it; batches running at the
+    same time do not.
+    """
+    usage = CacheUsage()
+    token = _usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _usage.reset(token)
+
+
+class LLMCache:
+    def __init__(
+        self,
+        path: Path = DEFAULT_PATH,
+        ttl_days: float = DEFAULT_TTL_DAYS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats = {"lookups": 0, "hits": 0, "saved_seconds": 0.0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, value TEXT,"
+                " seconds REAL, created REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; WAL lets readers and a writer overlap
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, model: str, temperature, schema, prompt: str) -> str:
+        h = hashlib.sha256()
+        for part in (model, repr(temperature), _schema_name(schema), normalize_prompt(prompt)):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _count(self, **deltas) -> None:
+        usage = _usage.get()
+        with self._lock:
+            for name, delta in deltas.items():
+                self._stats[name] += delta
+                if usage is not None:
+                    usage.counts[name] += delta
+
+    def get(self, key: str, schema):
+        """The cached, re-validated response, or None."""
+        self._count(lookups=1)
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, seconds, created FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, seconds, created = row
+        if now - created > self.ttl_seconds:
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        try:
+            result = _load(schema, value)
+        except Exception:
+            # Schema changed since the entry was written
+            with conn:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._count(hits=1, saved_seconds=seconds or 0.0)
+        return result
+
+    def put(self, key: str, model: str, result, seconds: float) -> None:
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, _dump(result), seconds, now, now),
+            )
+        with self._lock:
+            self._puts += 1
+            due = self._puts % EVICT_EVERY == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_entries."""
+        conn = self._connect()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,)
+            ).rowcount
+            removed += conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            ).rowcount
+        return removed
+
+    def stats(self) -> dict:
+        """Totals for the whole process; see cache_usage for one batch."""
+        with self._lock:
+            return _with_rates(self._stats)
+
+
+def get_llm_cache() -> LLMCache:
+    return get_resource("llm_cache", LLMCache)
+
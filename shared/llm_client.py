@@ -0,0 +1,316 @@
+"""
+Rate-limit aware wrapper around the chat models.
+
+Every call goes through one LLMClient per model name, shared by the whole
+process: a token bucket keeps requests and tokens per minute under the
+provider quota, 429/5xx and transport errors are retried with jittered
+exponential backoff, and a circuit breaker fails calls fast (CircuitOpenError)
+while the provider keeps failing. Counters for retries and throttle time are kept
+per model (see llm_metrics). Calls made under a task deadline (see
+shared.adaptive) stop retrying once it passes.
+"""
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field, fields
+
+from shared.adaptive import check_deadline, deadline_remaining
+from shared.registry import get_resource, loaded_resources
+
+# Gemini 2.5 Flash, paid tier 1
+DEFAULT_RPM = int(os.getenv("GEMINI_RPM", 1000))
+DEFAULT_TPM = int(os.getenv("GEMINI_TPM", 1_000_000))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+BASE_DELAY = 1.0
+MAX_DELAY = 30.0
+# Output tokens also count against TPM; budget this much per call
+EXPECTED_OUTPUT_TOKENS = 200
+
+_RETRYABLE_NAMES = {
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "InternalServerError",
+    "DeadlineExceeded",
+    "GatewayTimeout",
+    "BadGateway",
+    "ServerError",
+    "APIConnectionError",
+    "APITimeoutError",
+}
+_RETRY_AFTER_RE = re.compile(r"retry(?:[ _-]?after|Delay)\D{0,5}(\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+def status_code(exc: Exception) -> int | None:
+    for value in (
+        getattr(exc, "status_code", None),
+        getattr(exc, "code", None),
+        getattr(getattr(exc, "response", None), "status_code", None),
+    ):
+        if callable(value):
+            try:
+                value = value()
+            except Exception:
+                continue
+        if isinstance(value, int):
+            return value
+    return None
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling the provider while the circuit is open."""
+
+
+def is_retryable(exc: Exception) -> bool:
+    # Status codes and exception types only; numbers in the message text are
+    # as likely to be a note's content as an HTTP status
+    code = status_code(exc)
+    if code is not None:
+        return code == 429 or code >= 500
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    return any(cls.__name__ in _RETRYABLE_NAMES for cls in type(exc).__mro__)
+
+
+def retry_after(exc: Exception) -> float | None:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        match = _RETRY_AFTER_RE.search(str(exc))
+        value = match.group(1) if match else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def capped_delay(delay: float) -> float:
+    """A sleep shortened so it never runs past the current task deadline."""
+    remaining = deadline_remaining()
+    return delay if remaining is None else max(0.0, min(delay, remaining))
+
+
+def estimate_tokens(text) -> int:
+    """Rough token count of a prompt or text, ~4 characters per token."""
+    return len(str(text)) // 4 + 1
+
+
+class TokenBucket:
+    """
+    `per_minute` units refilled continuously, up to a burst of `capacity`.
+    reserve() takes the units right away (the balance may go negative) and
+    returns how long the caller must wait before using them, so sync and
+    async callers share one bucket and are served in arrival order.
+    """
+
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.balance = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self.balance = min(self.capacity, self.balance + (now - self.updated) * self.rate)
+            self.updated = now
+            self.balance -= amount
+            return 0.0 if self.balance >= 0 else -self.balance / self.rate
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive retryable failures and stays
+    open for `reset_seconds`, during which check() raises CircuitOpenError so
+    callers can fail the file instead of waiting. The next call after that is
+    a trial, and one more failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def check(self) -> None:
+        remaining = self.remaining()
+        if remaining > 0:
+            raise CircuitOpenError(
+                f"LLM provider failing repeatedly; circuit open for another {remaining:.0f}s"
+            )
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> bool:
+        """Returns True if this failure opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold:
+                return False
+            now = time.monotonic()
+            was_open = self.opened_at is not None and now < self.opened_at + self.reset_seconds
+            self.opened_at = now
+            return not was_open
+
+
+@dataclass
+class LLMMetrics:
+    calls: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    retries: int = 0
+    circuit_opens: int = 0
+    throttle_seconds: float = 0.0
+    backoff_seconds: float = 0.0
+    call_seconds: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **deltas) -> None:
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "_lock"}
+
+
+class LLMClient:
+    """Runs calls against one model under its rate limits, retries and breaker."""
+
+    def __init__(
+        self,
+        rpm: int = DEFAULT_RPM,
+        tpm: int = DEFAULT_TPM,
+        max_retries: int = MAX_RETRIES,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+        breaker: CircuitBreaker | None = None,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = LLMMetrics()
+
+    def _throttle_delay(self, prompt) -> float:
+        return max(self.requests.reserve(1), self.tokens.reserve(estimate_tokens(prompt) + EXPECTED_OUTPUT_TOKENS))
+
+    def _backoff_delay(self, attempt: int, exc: Exception) -> float:
+        # Full jitter, but never sooner than the server asked for
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        return max(delay, retry_after(exc) or 0.0)
+
+    def _on_error(self, exc: Exception, attempt: int) -> float | None:
+        """Record a failed attempt; returns the backoff delay, or None to give up."""
+        retryable = is_retryable(exc)
+        if retryable and self.breaker.record_failure():
+            self.metrics.add(circuit_opens=1)
+        if not retryable or attempt >= self.max_retries:
+            self.metrics.add(failed=1)
+            return None
+        delay = self._backoff_delay(attempt, exc)
+        self.metrics.add(retries=1, backoff_seconds=delay)
+        return delay
+
+    def _check_breaker(self) -> None:
+        try:
+            self.breaker.check()
+        except CircuitOpenError:
+            self.metrics.add(failed=1)
+            raise
+
+    def _on_success(self, started: float) -> None:
+        self.breaker.record_success()
+        self.metrics.add(succeeded=1, call_seconds=time.perf_counter() - started)
+
+    def invoke(self, runnable, prompt):
+        self.metrics.add(calls=1)
+        for attempt in range(self.max_retries + 1):
+            check_deadline()
+            self._check_breaker()
+            wait = self._throttle_delay(prompt)
+            if wait:
+                self.metrics.add(throttle_seconds=wait)
+                time.sleep(capped_delay(wait))
+                check_deadline()
+            started = time.perf_counter()
+            try:
+                result = runnable.invoke(prompt)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(capped_delay(delay))
+                continue
+            self._on_success(started)
+            return result
+
+    async def ainvoke(self, runnable, prompt):
+        self.metrics.add(calls=1)
+        for attempt in range(self.max_retries + 1):
+            check_deadline()
+            self._check_breaker()
+            wait = self._throttle_delay(prompt)
+            if wait:
+                self.metrics.add(throttle_seconds=wait)
+                await asyncio.sleep(capped_delay(wait))
+                check_deadline()
+            started = time.perf_counter()
+            try:
+                result = await runnable.ainvoke(prompt)
+            except Exception as e:
+                delay = self._on_error(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(capped_delay(delay))
+                continue
+            self._on_success(started)
+            return result
+
+
+class ResilientModel:
+    """A runnable whose invoke/ainvoke go through the model's LLMClient."""
+
+    def __init__(self, runnable, client: LLMClient):
+        self.runnable = runnable
+        self.client = client
+
+    def invoke(self, prompt):
+        return self.client.invoke(self.runnable, prompt)
+
+    async def ainvoke(self, prompt):
+        return await self.client.ainvoke(self.runnable, prompt)
+
+
+def get_llm_client(model: str) -> LLMClient:
+    return get_resource(("llm_client", model), LLMClient)
+
+
+def resilient(runnable, model: str) -> ResilientModel:
+    return ResilientModel(runnable, get_llm_client(model))
+
+
+def llm_metrics() -> dict:
+    """{model: metrics} for every model called so far in this process."""
+    return {
+        key[1]: get_llm_client(key[1]).metrics.snapshot()
+        for key in loaded_resources()
+        if isinstance(key, tuple) and key[0] == "llm_client"
+    }
@@ -0,0 +1,229 @@
+import atexit
+import io
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import PyPDF2
+import pypdfium2 as pdfium
+import pytesseract
+
+from shared.tracing import record, span
+
+DEFAULT_DPI = 300
+DEFAULT_WORKERS = int(os.getenv("OCR_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+# Pages whose text layer has fewer characters than this are treated as scanned
+MIN_TEXT_CHARS = 25
+
+
+@dataclass
+class PageText:
+    page: int
+    text: str
+    seconds: float = 0.0
+    ocr: bool = False
+
+
+@dataclass
+class DocumentText:
+    pages: list[PageText] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(p.text for p in self.pages)
+
+    @property
+    def seconds(self) -> float:
+        return sum(p.seconds for p in self.pages)
+
+
+def read_pdf_bytes(pdf) -> bytes:
+    """Accept a path, raw bytes or a file-like object and return the PDF bytes."""
+    if isinstance(pdf, (bytes, bytearray, memoryview)):
+        return bytes(pdf)
+    if isinstance(pdf, (str, Path)):
+        with open(pdf, "rb") as f:
+            return f.read()
+    if hasattr(pdf, "getvalue"):
+        return pdf.getvalue()
+    pdf.seek(0)
+    return pdf.read()
+
+
+def count_pages(pdf_bytes: bytes) -> int:
+    doc = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return len(doc)
+    finally:
+        doc.close()
+
+
+def _ocr_pages(pdf_bytes: bytes, page_indices: list[int], dpi: int, tesseract_cmd: str | None):
+    # Runs in a worker process; everything it needs is passed in. The PDF is
+    # sent and opened once for the whole range, not once per page
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    outputs = []
+    doc = pdfium.PdfDocument(pdf_bytes)
+    try:
+        for page_index in page_indices:
+            start = time.perf_counter()
+            bitmap = doc[page_index].render(scale=dpi / 72)
+            img = bitmap.to_pil()
+            text = pytesseract.image_to_string(img, config="--psm 6")
+            outputs.append((text, time.perf_counter() - start))
+    finally:
+        doc.close()
+    return outputs
+
+
+def _page_ranges(pages: list[list[int]], max_workers: int) -> list[tuple[int, list[int]]]:
+    """
+    (document index, page indices) jobs: one per document, split into
+    contiguous ranges only when there are fewer documents than workers.
+    """
+    docs = [d for d, page_indices in enumerate(pages) if page_indices]
+    per_doc = max(1, max_workers // max(1, len(docs)))
+    jobs = []
+    for d in docs:
+        page_indices = pages[d]
+        size = -(-len(page_indices) // min(per_doc, len(page_indices)))
+        jobs.extend((d, page_indices[i : i + size]) for i in range(0, len(page_indices), size))
+    return jobs
+
+
+_pools: dict[int, ProcessPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def _get_pool(max_workers: int) -> ProcessPoolExecutor:
+    # Pools are kept for the life of the process; worker startup is not free
+    with _pools_lock:
+        pool = _pools.get(max_workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=max_workers)
+            _pools[max_workers] = pool
+        return pool
+
+
+def shutdown_pools() -> None:
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.shutdown(cancel_futures=True)
+        _pools.clear()
+
+
+atexit.register(shutdown_pools)
+
+
+def ocr_documents(
+    documents: list,
+    dpi: int = DEFAULT_DPI,
+    max_workers: int = DEFAULT_WORKERS,
+    tesseract_cmd: str | None = None,
+    pages: list[list[int]] | None = None,
+) -> list[DocumentText]:
+    """
+    OCR the pages of many PDFs in parallel across worker processes.
+
+    `pages` optionally restricts OCR to the given page indices per document.
+    Results come back in document order with pages in page order, each page
+    carrying its own OCR time.
+    """
+    blobs = [read_pdf_bytes(d) for d in documents]
+    if pages is None:
+        pages = [list(range(count_pages(b))) for b in blobs]
+
+    jobs = _page_ranges(pages, max_workers)
+    results = [DocumentText() for _ in blobs]
+
+    if max_workers <= 1 or len(jobs) <= 1:
+        outputs = [_ocr_pages(blobs[d], p, dpi, tesseract_cmd) for d, p in jobs]
+    else:
+        pool = _get_pool(max_workers)
+        futures = [
+            pool.submit(_ocr_pages, blobs[d], p, dpi, tesseract_cmd) for d, p in jobs
+        ]
+        outputs = [f.result() for f in futures]
+
+    for (doc_idx, page_indices), texts in zip(jobs, outputs):
+        for page_idx, (text, seconds) in zip(page_indices, texts):
+            results[doc_idx].pages.append(PageText(page_idx, text, seconds, ocr=True))
+    return results
+
+
+def ocr_pdf(
+    pdf,
+    dpi: int = DEFAULT_DPI,
+    max_workers: int = DEFAULT_WORKERS,
+    tesseract_cmd: str | None = None,
+) -> str:
+    return ocr_documents([pdf], dpi, max_workers, tesseract_cmd)[0].text
+
+
+def _text_layer(pdf_bytes: bytes) -> list[PageText]:
+    try:
+        reader = PyPDF2.PdfReader(io.BytesIO(pdf_bytes))
+        pages = reader.pages
+    except Exception:
+        return [PageText(i, "") for i in range(count_pages(pdf_bytes))]
+
+    layer = []
+    for i, page in enumerate(pages):
+        start = time.perf_counter()
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        layer.append(PageText(i, text, time.perf_counter() - start))
+    return layer
+
+
+def extract_documents(
+    documents: list,
+    min_chars: int = MIN_TEXT_CHARS,
+    dpi: int = DEFAULT_DPI,
+    max_workers: int = DEFAULT_WORKERS,
+    tesseract_cmd: str | None = None,
+) -> list[DocumentText]:
+    """
+    Extract text page by page: use the text layer where it has at least
+    `min_chars` characters and OCR only the remaining pages, across all
+    documents in one pass through the process pool.
+    """
+    blobs = [read_pdf_bytes(d) for d in documents]
+    with span("text_layer"):
+        layers = [_text_layer(b) for b in blobs]
+    scanned = [
+        [p.page for p in layer if len(p.text.strip()) < min_chars] for layer in layers
+    ]
+
+    ocr_results = [DocumentText() for _ in blobs]
+    if any(scanned):
+        with span("ocr"):
+            ocr_results = ocr_documents(blobs, dpi, max_workers, tesseract_cmd, pages=scanned)
+        # Worker-side time per page, so slow scans show up in the p95
+        for doc in ocr_results:
+            for page in doc.pages:
+                record("ocr_page", page.seconds)
+
+    results = []
+    for layer, skip, ocr in zip(layers, scanned, ocr_results):
+        skip = set(skip)
+        pages = [p for p in layer if p.page not in skip] + ocr.pages
+        results.append(DocumentText(sorted(pages, key=lambda p: p.page)))
+    return results
+
+
+def extract_text(
+    pdf,
+    min_chars: int = MIN_TEXT_CHARS,
+    dpi: int = DEFAULT_DPI,
+    max_workers: int = DEFAULT_WORKERS,
+    tesseract_cmd: str | None = None,
+) -> str:
+    return extract_documents([pdf], min_chars, dpi, max_workers, tesseract_cmd)[0].text
@@ -0,0 +1,235 @@
+"""
+Prompts with a static, cacheable prefix and a per-note suffix.
+
+Templates keep all fixed instructions ahead of the first per-note field, so
+the text before that field is identical for every note. When the prefix is
+large enough, it is stored once as a Gemini explicit context cache and each
+call only sends the suffix; otherwise the prompt is sent whole, which still
+lets the provider's implicit prefix caching apply.
+"""
+import hashlib
+import os
+import string
+import threading
+import time
+from concurrent.futures import Future
+
+from shared import llm_cache
+from shared.llm_client import estimate_tokens, resilient
+from shared.tracing import span
+from shared.registry import (
+    DEFAULT_CHAT_MODEL,
+    get_resource,
+    get_structured_model,
+    new_chat_model,
+    set_resource,
+)
+
+DEFAULT_TTL_SECONDS = 3600
+# Gemini rejects explicit caches smaller than this (2.5 Flash minimum)
+MIN_CACHE_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", 1024))
+# Set PROMPT_CACHE=0 to always send whole prompts
+CACHE_ENABLED = os.getenv("PROMPT_CACHE", "1") != "0"
+
+
+class CacheablePrompt(str):
+    """A prompt string that also remembers its static prefix and per-note suffix."""
+
+    def __new__(cls, prefix: str, suffix: str):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+
+def compile_template(template: str, **fixed) -> tuple:
+    """
+    Parse a str.format-style prompt template once into (literal, field)
+    pairs, filling the `fixed` fields in right away.
+    """
+    parts, literal = [], ""
+    for text, field, _, _ in string.Formatter().parse(template):
+        literal += text
+        if field is None:
+            continue
+        if field in fixed:
+            literal += str(fixed[field])
+        else:
+            parts.append((literal, field))
+            literal = ""
+    parts.append((literal, None))
+    return tuple(parts)
+
+
+def render_template(parts: tuple, **values) -> CacheablePrompt:
+    """
+    Same text as template.format(**values), by plain concatenation. Everything
+    before the first unfilled field is the prompt's cacheable prefix.
+    """
+    prefix, first_field = parts[0]
+    pieces = [values[first_field]] if first_field else []
+    pieces += [literal + values[field] if field else literal for literal, field in parts[1:]]
+    return CacheablePrompt(prefix, "".join(pieces))
+
+
+class ContextCache:
+    """
+    Provider-side caches for prompt prefixes, created once per (model, prefix)
+    and renewed shortly before they expire.
+
+    `client` is anything with google-genai's `caches.create(model=, config=)`
+    returning an object with a `.name`; a local stub works for tests. A
+    prefix that is too small, or whose cache could not be created, is sent
+    inline.
+    """
+
+    def __init__(
+        self,
+        client=None,
+        ttl_seconds: int = DEFAULT_TTL_SECONDS,
+        min_tokens: int = MIN_CACHE_TOKENS,
+    ):
+        self._client = client
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        # (model, digest) -> (name or None, expires_at), or a Future while created
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            from dotenv import load_dotenv
+            from google import genai
+
+            load_dotenv()
+            self._client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+        return self._client
+
+    def name_for(self, model: str, prefix: str) -> str | None:
+        if estimate_tokens(prefix) < self.min_tokens:
+            return None
+
+        key = (model, hashlib.sha256(prefix.encode("utf-8")).hexdigest())
+        # The lock only guards the table; the API call runs outside it, so a
+        # slow create holds up other calls for the same prefix and no others
+        with self._lock:
+            entry = self._entries.get(key)
+            if isinstance(entry, Future):
+                pending, creating = entry, False
+            elif entry is not None and entry[1] > time.time():
+                return entry[0]
+            else:
+                pending, creating = Future(), True
+                self._entries[key] = pending
+        if not creating:
+            return pending.result()
+
+        try:
+            cache = self.client().caches.create(
+                model=model,
+                config={
+                    "contents": [prefix],
+                    "ttl": f"{self.ttl_seconds}s",
+                    "display_name": f"prompt-prefix-{key[1][:16]}",
+                },
+            )
+            # Renew a little early so a request never races the expiry
+            entry = (cache.name, time.time() + self.ttl_seconds * 0.9)
+        except Exception as e:
+            print(f"Context cache unavailable for {model}, sending prompts inline: {e}")
+            # Try again after a TTL rather than on every call
+            entry = (None, time.time() + self.ttl_seconds)
+        with self._lock:
+            self._entries[key] = entry
+        pending.set_result(entry[0])
+        return entry[0]
+
+
+def get_context_cache() -> ContextCache:
+    return get_resource("context_cache", ContextCache)
+
+
+def set_context_cache(cache: ContextCache) -> None:
+    """Swap the process-wide cache, e.g. for one built on a stub client."""
+    set_resource("context_cache", cache)
+
+
+class PromptModel:
+    """
+    Structured-output model that sends only the suffix of a CacheablePrompt
+    when its prefix is held in a context cache, and the whole prompt otherwise.
+    Responses are answered from, and saved to, the local LLM response cache.
+    """
+
+    def __init__(self, schema, model: str = DEFAULT_CHAT_MODEL, temperature: float | None = None):
+        self.schema = schema
+        self.model = model
+        self.temperature = temperature
+        # Span name for this model's calls, e.g. llm:CPTSelection
+        self.stage = getattr(schema, "__name__", None) or str(schema)
+        self._cached = (None, None)  # (cache name, model bound to it)
+
+    def _bound_to(self, name: str):
+        cached_name, llm = self._cached
+        if cached_name != name:
+            # Tools can't be sent alongside cached content, so structured
+            # output goes through the response schema instead
+            llm = resilient(
+                new_chat_model(
+                    self.model, self.temperature, cached_content=name
+                ).with_structured_output(self.schema, method="json_schema"),
+                self.model,
+            )
+            self._cached = (name, llm)
+        return llm
+
+    def _route(self, prompt):
+        name = None
+        if CACHE_ENABLED and isinstance(prompt, CacheablePrompt):
+            name = get_context_cache().name_for(self.model, prompt.prefix)
+        if name is None:
+            return get_structured_model(self.schema, self.model, self.temperature), str(prompt)
+        return self._bound_to(name), prompt.suffix
+
+    def _cache_key(self, prompt):
+        if not llm_cache.CACHE_ENABLED:
+            return None
+        return llm_cache.get_llm_cache().key(self.model, self.temperature, self.schema, prompt)
+
+    def _lookup(self, key):
+        return llm_cache.get_llm_cache().get(key, self.schema) if key else None
+
+    def _store(self, key, result, started: float) -> None:
+        if key and result is not None:
+            llm_cache.get_llm_cache().put(key, self.model, result, time.perf_counter() - started)
+
+    def invoke(self, prompt):
+        key = self._cache_key(prompt)
+        result = self._lookup(key)
+        if result is None:
+            with span(f"llm:{self.stage}"):
+                started = time.perf_counter()
+                llm, text = self._route(prompt)
+                result = llm.invoke(text)
+            self._store(key, result, started)
+        return result
+
+    async def ainvoke(self, prompt):
+        key = self._cache_key(prompt)
+        result = self._lookup(key)
+        if result is None:
+            with span(f"llm:{self.stage}"):
+                started = time.perf_counter()
+                llm, text = self._route(prompt)
+                result = await llm.ainvoke(text)
+            self._store(key, result, started)
+        return result
+
+
+def get_prompt_model(
+    schema, model: str = DEFAULT_CHAT_MODEL, temperature: float | None = None
+) -> PromptModel:
+    return get_resource(
+        ("prompt_model", model, temperature, schema),
+        lambda: PromptModel(schema, model, temperature),
+    )
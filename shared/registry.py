@@ -0,0 +1,90 @@
+"""
+Process-wide registry of heavy models and clients.
+
+Nothing is built at import time: each resource is created on first use and
+then shared by every caller (and every Streamlit session) in the process.
+"""
+import os
+import threading
+
+DEFAULT_CHAT_MODEL = "gemini-2.5-flash"
+DEFAULT_EMBEDDING_MODEL = "abhinand/MedEmbed-large-v0.1"
+# Seconds one model request may take before it is abandoned (and retried)
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 120))
+
+_lock = threading.RLock()
+_resources = {}
+
+
+def get_resource(key, factory):
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            resource = _resources.get(key)
+            if resource is None:
+                resource = factory()
+                _resources[key] = resource
+    return resource
+
+
+def set_resource(key, resource) -> None:
+    with _lock:
+        _resources[key] = resource
+
+
+def loaded_resources() -> list:
+    return list(_resources)
+
+
+def new_chat_model(
+    model: str = DEFAULT_CHAT_MODEL, temperature: float | None = None, **kwargs
+):
+    """Build an unshared chat client; most callers want get_chat_model."""
+    from dotenv import load_dotenv
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    load_dotenv()
+    kwargs = {
+        "model": model,
+        "google_api_key": os.getenv("GOOGLE_API_KEY"),
+        # Retries and backoff are done by shared.llm_client
+        "max_retries": 0,
+        "timeout": LLM_REQUEST_TIMEOUT,
+        **kwargs,
+    }
+    endpoint = os.getenv("GEMINI_API_ENDPOINT")
+    if endpoint:
+        # e.g. a local fake server for load tests
+        kwargs.setdefault("transport", "rest")
+        kwargs.setdefault("client_options", {"api_endpoint": endpoint})
+    if temperature is not None:
+        kwargs["temperature"] = temperature
+    return ChatGoogleGenerativeAI(**kwargs)
+
+
+def get_chat_model(model: str = DEFAULT_CHAT_MODEL, temperature: float | None = None):
+    return get_resource(("chat", model, temperature), lambda: new_chat_model(model, temperature))
+
+
+def get_structured_model(
+    schema, model: str = DEFAULT_CHAT_MODEL, temperature: float | None = None
+):
+    """Structured-output model whose calls are rate limited and retried."""
+
+    def build():
+        from shared.llm_client import resilient
+
+        return resilient(
+            get_chat_model(model, temperature).with_structured_output(schema), model
+        )
+
+    return get_resource(("structured", model, temperature, schema), build)
+
+
+def get_embedder(name: str = DEFAULT_EMBEDDING_MODEL):
+    def build():
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(name)
+
+    return get_resource(("embedder", name), build)
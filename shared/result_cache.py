@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_ROOT = Path(os.getenv("PORTAL_CACHE_DIR", ".cache/results"))
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+def content_hash(pdf_bytes: bytes, version: str = "") -> str:
+    """SHA-256 of the PDF bytes, salted with the pipeline version."""
+    h = hashlib.sha256()
+    h.update(version.encode("utf-8"))
+    h.update(b"\0")
+    h.update(pdf_bytes)
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of finished result rows, keyed by PDF content.
+
+    Entries live under <root>/<namespace>/<key[:2]>/<key>.json. Bumping the
+    pipeline version changes every key, so stale rows are never returned and
+    simply age out through eviction. A file's mtime is when it was written
+    (checked against max_age_days) and its atime when it was last read
+    (the order in which eviction drops entries).
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        version: str,
+        root: Path = DEFAULT_CACHE_ROOT,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+    ):
+        self.namespace = namespace
+        self.version = version
+        self.dir = Path(root) / namespace
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        self._puts_since_evict = 0
+
+    def key(self, pdf_bytes: bytes) -> str:
+        return content_hash(pdf_bytes, self.version)
+
+    def _path(self, key: str) -> Path:
+        return self.dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                row = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        try:
+            written = path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if time.time() - written > self.max_age:
+            path.unlink(missing_ok=True)
+            return None
+
+        # Record the read in atime only, so a row used daily still expires
+        os.utime(path, (time.time(), written))
+        return row
+
+    def put(self, key: str, row: dict) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write atomically so concurrent readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(row, f, default=str)
+            os.replace(tmp_path, path)
+        except Exception:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._puts_since_evict += 1
+            due = self._puts_since_evict >= 50
+            if due:
+                self._puts_since_evict = 0
+        if due:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop expired entries, then the least recently read until under max_bytes."""
+        if not self.dir.exists():
+            return
+
+        now = time.time()
+        entries = []
+        for path in self.dir.glob("*/*.json"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def get_or_compute(self, pdf_bytes: bytes, compute) -> dict:
+        key = self.key(pdf_bytes)
+        row = self.get(key)
+        if row is None:
+            row = compute()
+            self.put(key, row)
+        return row
@@ -0,0 +1,248 @@
+"""
+Lightweight stage timing for the coding pipelines.
+
+    with trace_batch("robertson") as trace:
+        with file_context(name):
+            with span("load"):
+                ...
+
+Spans are attributed to the batch and file active in the current context
+(contextvars), so asyncio tasks and asyncio.to_thread inherit them; use
+submit() to carry them into a ThreadPoolExecutor. Outside a batch, span()
+costs a context lookup and nothing else.
+
+At the end of a batch the spans are appended to a local JSONL file, and
+summary()/per_file() give the aggregates the apps show. TRACE_PROFILE=cprofile
+or TRACE_PROFILE=pyinstrument also profiles the batch's calling thread.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+TRACE_DIR = Path(os.getenv("TRACE_DIR", ".cache/traces"))
+SPANS_FILE = "spans.jsonl"
+PROFILE = os.getenv("TRACE_PROFILE", "").lower()
+
+_trace = contextvars.ContextVar("trace", default=None)
+_file = contextvars.ContextVar("trace_file", default=None)
+# Nesting level of the innermost open span; only top-level spans add up to file totals
+_depth = contextvars.ContextVar("trace_depth", default=0)
+
+
+@dataclass
+class Span:
+    batch: str
+    file: str | None
+    stage: str
+    start: float
+    seconds: float
+    depth: int = 0
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.name = name
+        self.batch_id = f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.started = time.time()
+        self.seconds = 0.0
+        self.spans: list[Span] = []
+        self.profile_path: Path | None = None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, file: str | None = None, start: float | None = None):
+        span = Span(
+            self.batch_id,
+            file if file is not None else _file.get(),
+            stage,
+            start if start is not None else time.time() - seconds,
+            seconds,
+            _depth.get(),
+        )
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> list[dict]:
+        """Per-stage count, total, mean, p95 and max seconds, slowest total first."""
+        by_stage: dict[str, list[float]] = {}
+        with self._lock:
+            for s in self.spans:
+                by_stage.setdefault(s.stage, []).append(s.seconds)
+
+        rows = []
+        for stage, values in by_stage.items():
+            values.sort()
+            total = sum(values)
+            rows.append(
+                {
+                    "stage": stage,
+                    "count": len(values),
+                    "total_s": round(total, 3),
+                    "mean_s": round(total / len(values), 3),
+                    "p95_s": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                    "max_s": round(values[-1], 3),
+                    "share": round(total / self.seconds, 3) if self.seconds else None,
+                }
+            )
+        return sorted(rows, key=lambda r: -r["total_s"])
+
+    def per_file(self) -> list[dict]:
+        """
+        Seconds per stage for each file; spans shared by a batch are left out.
+        total_s counts top-level spans only, so nested stages aren't counted twice.
+        """
+        files: dict[str, dict] = {}
+        with self._lock:
+            for s in self.spans:
+                if s.file is None:
+                    continue
+                row = files.setdefault(s.file, {"file": s.file, "total_s": 0.0})
+                row[s.stage] = round(row.get(s.stage, 0.0) + s.seconds, 3)
+                if s.depth == 0:
+                    row["total_s"] = round(row["total_s"] + s.seconds, 3)
+        return sorted(files.values(), key=lambda r: -r["total_s"])
+
+    def report(self) -> dict:
+        """Plain-data view of the batch for session state and the UI."""
+        return {
+            "batch": self.batch_id,
+            "seconds": round(self.seconds, 3),
+            "stages": self.summary(),
+            "files": self.per_file(),
+            "profile": str(self.profile_path) if self.profile_path else None,
+        }
+
+    def export(self, directory: Path = TRACE_DIR) -> Path:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / SPANS_FILE
+        with self._lock:
+            lines = [json.dumps(asdict(s)) for s in self.spans]
+        lines.append(
+            json.dumps(
+                {
+                    "batch": self.batch_id,
+                    "stage": "batch",
+                    "start": self.started,
+                    "seconds": self.seconds,
+                    "summary": self.summary(),
+                }
+            )
+        )
+        with open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
+
+
+def current_trace() -> Trace | None:
+    return _trace.get()
+
+
+@contextmanager
+def span(stage: str):
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    start_wall, start = time.time(), time.perf_counter()
+    token = _depth.set(_depth.get() + 1)
+    try:
+        yield
+    finally:
+        _depth.reset(token)
+        trace.add(stage, time.perf_counter() - start, start=start_wall)
+
+
+def record(stage: str, seconds: float, file: str | None = None) -> None:
+    """Add a span measured elsewhere, e.g. OCR time reported by a worker process."""
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, seconds, file)
+
+
+def traced(stage: str):
+    """Decorator form of span()."""
+
+    def decorator(fn):
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+
+        wrapper.__name__ = fn.__name__
+        wrapper.__doc__ = fn.__doc__
+        wrapper.__wrapped__ = fn
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def file_context(name: str | None):
+    token = _file.set(name)
+    try:
+        yield
+    finally:
+        _file.reset(token)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that carries the current trace and file into the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+@contextmanager
+def _profiler(trace: Trace, kind: str):
+    if kind == "cprofile":
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            TRACE_DIR.mkdir(parents=True, exist_ok=True)
+            trace.profile_path = TRACE_DIR / f"{trace.batch_id}.prof"
+            profiler.dump_stats(trace.profile_path)
+    elif kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is not installed; profiling skipped")
+            yield
+            return
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            TRACE_DIR.mkdir(parents=True, exist_ok=True)
+            trace.profile_path = TRACE_DIR / f"{trace.batch_id}.html"
+            trace.profile_path.write_text(profiler.output_html(), encoding="utf-8")
+    else:
+        yield
+
+
+@contextmanager
+def trace_batch(name: str, profile: str | None = None, export: bool = True):
+    """Collect spans for one batch; exported to TRACE_DIR when it ends."""
+    trace = Trace(name)
+    token = _trace.set(trace)
+    start = time.perf_counter()
+    try:
+        with _profiler(trace, (profile if profile is not None else PROFILE).lower()):
+            yield trace
+    finally:
+        trace.seconds = time.perf_counter() - start
+        _trace.reset(token)
+        if export:
+            try:
+                trace.export()
+            except OSError as e:
+                print(f"Could not write trace for {trace.batch_id}: {e}")
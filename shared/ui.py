@@ -0,0 +1,72 @@
+import pandas as pd
+import streamlit as st
+
+
+def batch_progress(job, columns=None, interval: float = 1.0) -> None:
+    """
+    Progress and rows so far of a background batch (see shared.job_queue),
+    redrawn every `interval` seconds. Reruns the app once the batch ends.
+    """
+    from shared.job_queue import QUEUED, get_job_queue
+
+    @st.fragment(run_every=interval)
+    def poll():
+        if not job.active:
+            st.rerun()
+        if job.status == QUEUED:
+            ahead = get_job_queue().ahead_of(job)
+            st.info(f"Waiting for a free worker ({ahead} other batch(es) queued ahead)...")
+        st.progress(job.progress)
+        st.text(job.message or f"Processed {job.completed} of {job.total} files.")
+        if job.rows:
+            st.dataframe(pd.DataFrame(list(job.rows), columns=columns), width="stretch")
+
+    poll()
+
+
+def llm_cache_caption(delta: dict | None) -> None:
+    """One line on how many LLM calls the response cache answered in a batch."""
+    if not delta or not delta["lookups"]:
+        return
+    st.caption(
+        f"LLM response cache: {delta['hits']} of {delta['lookups']} calls "
+        f"({delta['hit_rate']:.0%}) answered locally, ~{delta['saved_seconds']:.1f}s "
+        "of model latency saved."
+    )
+
+
+def icd_code_set_warning() -> None:
+    """Warn next to results when ICD codes could not be validated (see shared.icd)."""
+    from shared.icd import code_set_warning
+
+    message = code_set_warning()
+    if message:
+        st.warning(message)
+
+
+def job_status_notice(counts: dict | None, key: str) -> bool:
+    """
+    Failed files in a batch's job log (see shared.job_store). Returns True
+    when the coder asks to retry them; finished files are not reprocessed.
+    """
+    failed = (counts or {}).get("failed", 0)
+    if not failed:
+        return False
+    st.caption(f"{failed} file(s) failed.")
+    return st.button("Retry failed files", key=key)
+
+
+def performance_expander(report: dict | None) -> None:
+    """Per-stage and per-file timings for the last batch (see shared.tracing)."""
+    if not report or not report["stages"]:
+        return
+    with st.expander("Performance"):
+        st.caption(
+            f"Batch {report['batch']} took {report['seconds']:.1f}s. Stage times are summed "
+            "across parallel workers, so they can add up to more than the batch."
+        )
+        st.dataframe(pd.DataFrame(report["stages"]), width="stretch", hide_index=True)
+        if report["files"]:
+            st.dataframe(pd.DataFrame(report["files"]).fillna(0), width="stretch", hide_index=True)
+        if report["profile"]:
+            st.caption(f"Profile saved to {report['profile']}")
@@ -0,0 +1,136 @@
+import json
+import re
+from pathlib import Path
+
+import numpy as np
+
+from shared.registry import DEFAULT_EMBEDDING_MODEL, get_embedder, get_resource
+
+VECTORS_FILE = "vectors.npy"
+ITEMS_FILE = "items.json"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def embed_texts(texts: list[str], model: str = DEFAULT_EMBEDDING_MODEL) -> np.ndarray:
+    """Return L2-normalized float32 embeddings, one row per text."""
+    embs = get_embedder(model).encode(
+        texts,
+        convert_to_numpy=True,
+        batch_size=32,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return embs.astype(np.float32, copy=False)
+
+
+def chunk_text(text: str, max_chars: int = 1200) -> list[str]:
+    """Split a note into line-aligned chunks that fit the embedder's window."""
+    chunks, current = [], ""
+    for line in text.splitlines():
+        if current and len(current) + len(line) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current.strip():
+        chunks.append(current)
+    return chunks or [text]
+
+
+class VectorIndex:
+    """
+    Top-k cosine search over prebuilt, L2-normalized embeddings.
+
+    Saved as a .npy matrix plus a JSON list of items. load() memory-maps the
+    matrix, so opening an index is close to free and pages are only read as
+    searches touch them.
+    """
+
+    def __init__(self, vectors: np.ndarray, items: list[dict]):
+        if len(vectors) != len(items):
+            raise ValueError("vectors and items must have the same length")
+        self.vectors = vectors
+        self.items = items
+
+    @classmethod
+    def build(
+        cls, items: list[dict], text_key: str = "text", model: str = DEFAULT_EMBEDDING_MODEL
+    ):
+        return cls(embed_texts([item[text_key] for item in items], model), items)
+
+    def save(self, directory: Path) -> None:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        np.save(
+            directory / VECTORS_FILE,
+            np.ascontiguousarray(self.vectors, dtype=np.float32),
+        )
+        with open(directory / ITEMS_FILE, "w", encoding="utf-8") as f:
+            json.dump(self.items, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, directory: Path):
+        directory = Path(directory)
+        vectors = np.load(directory / VECTORS_FILE, mmap_mode="r")
+        with open(directory / ITEMS_FILE, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        return cls(vectors, items)
+
+    def search(
+        self, query_vectors: np.ndarray, k: int = 10, mask: np.ndarray | None = None
+    ):
+        """
+        Return [(score, item)] for the k best items. Several query vectors
+        (e.g. chunks of one note) score each item by their best match.
+        `mask` restricts the search to the rows where it is True.
+        """
+        query_vectors = np.atleast_2d(query_vectors)
+        scores = (self.vectors @ query_vectors.T).max(axis=1)
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+
+        k = min(k, int(np.isfinite(scores).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.items[i]) for i in top]
+
+    def search_text(
+        self,
+        text: str,
+        k: int = 10,
+        mask: np.ndarray | None = None,
+        model: str = DEFAULT_EMBEDDING_MODEL,
+    ):
+        return self.search(embed_texts(chunk_text(text), model), k, mask)
+
+
+def load_index(directory: Path) -> VectorIndex | None:
+    """Load a prebuilt index once per process; None if it hasn't been built."""
+    directory = Path(directory)
+    if not (directory / VECTORS_FILE).exists():
+        return None
+    return get_resource(
+        ("vector_index", str(directory.resolve())), lambda: VectorIndex.load(directory)
+    )
+
+
+def rerank(
+    query: str, hits: list, text_key: str = "text", lexical_weight: float = 0.3
+) -> list:
+    """
+    Re-order [(score, item)] hits by blending the cosine score with how many
+    of the item's words actually appear in the query text.
+    """
+    query_tokens = set(_TOKEN_RE.findall(query.lower()))
+
+    def blended(hit):
+        score, item = hit
+        item_tokens = set(_TOKEN_RE.findall(item[text_key].lower()))
+        if not item_tokens:
+            return (1 - lexical_weight) * score
+        overlap = len(item_tokens & query_tokens) / len(item_tokens)
+        return (1 - lexical_weight) * score + lexical_weight * overlap
+
+    return sorted(((blended(hit), hit[1]) for hit in hits), key=lambda h: -h[0])
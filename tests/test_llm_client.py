@@ -0,0 +1,181 @@
+import asyncio
+import contextvars
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from shared import adaptive, llm_client
+from shared.llm_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LLMClient,
+    capped_delay,
+    retry_after,
+)
+
+
+class APIError(Exception):
+    """What the provider SDK raises: an HTTP status and optional headers."""
+
+    def __init__(self, status: int, headers: dict | None = None):
+        super().__init__(f"HTTP {status}")
+        self.status_code = status
+        self.response = SimpleNamespace(status_code=status, headers=headers or {})
+
+
+class FakeModel:
+    """Runnable that plays back a script of exceptions and results."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    def _next(self):
+        self.calls += 1
+        outcome = self.script.pop(0) if self.script else "ok"
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+    def invoke(self, prompt):
+        return self._next()
+
+    async def ainvoke(self, prompt):
+        return self._next()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock that only moves when something sleeps."""
+    now = [1000.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    async def async_sleep(seconds):
+        sleep(seconds)
+
+    monkeypatch.setattr(llm_client.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(llm_client.time, "sleep", sleep)
+    monkeypatch.setattr(llm_client.asyncio, "sleep", async_sleep)
+    # Worst-case jitter, so the caps are what is tested
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: high)
+    return SimpleNamespace(now=now, sleeps=sleeps)
+
+
+def make_client(**kwargs):
+    kwargs.setdefault("rpm", 1_000_000)
+    kwargs.setdefault("tpm", 1_000_000_000)
+    kwargs.setdefault("base_delay", 1.0)
+    kwargs.setdefault("max_delay", 4.0)
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=100))
+    return LLMClient(**kwargs)
+
+
+def test_retries_429_503_and_timeouts(clock):
+    model = FakeModel(APIError(429), APIError(503), TimeoutError(), "done")
+    client = make_client()
+    assert client.invoke(model, "prompt") == "done"
+    assert model.calls == 4
+    metrics = client.metrics.snapshot()
+    assert metrics["retries"] == 3 and metrics["succeeded"] == 1
+
+
+def test_backoff_is_capped(clock):
+    model = FakeModel(*[APIError(503)] * 5, "done")
+    client = make_client(max_retries=5)
+    client.invoke(model, "prompt")
+    assert clock.sleeps == [1.0, 2.0, 4.0, 4.0, 4.0]
+
+
+def test_gives_up_after_max_retries(clock):
+    model = FakeModel(*[APIError(503)] * 3)
+    client = make_client(max_retries=2)
+    with pytest.raises(APIError):
+        client.invoke(model, "prompt")
+    assert model.calls == 3
+    assert client.metrics.snapshot()["failed"] == 1
+
+
+def test_client_errors_are_not_retried(clock):
+    model = FakeModel(APIError(400), ValueError("HTTP 500 mentioned in a note"))
+    client = make_client()
+    with pytest.raises(APIError):
+        client.invoke(model, "prompt")
+    with pytest.raises(ValueError):
+        client.invoke(model, "prompt")
+    assert model.calls == 2
+    assert clock.sleeps == []
+
+
+def test_retry_after_is_honored(clock):
+    error = APIError(429, headers={"retry-after": "12"})
+    assert retry_after(error) == 12.0
+    assert retry_after(RuntimeError("retryDelay: 3.5s")) == 3.5
+    assert retry_after(APIError(429)) is None
+
+    model = FakeModel(error, "done")
+    make_client().invoke(model, "prompt")
+    # Longer than the 4s backoff cap, because the server asked for it
+    assert clock.sleeps == [12.0]
+
+
+def test_circuit_opens_fails_fast_and_lets_a_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    client = make_client(max_retries=1, breaker=breaker)
+    model = FakeModel(APIError(503), APIError(503))
+    with pytest.raises(APIError):
+        client.invoke(model, "prompt")
+    assert breaker.remaining() > 0
+    assert client.metrics.snapshot()["circuit_opens"] == 1
+
+    # Open: fails without calling the provider
+    with pytest.raises(CircuitOpenError):
+        client.invoke(model, "prompt")
+    assert model.calls == 2
+
+    # After the reset period one trial goes through; a failure reopens at once
+    clock.now[0] += 30
+    model.script = [APIError(503)]
+    with pytest.raises(CircuitOpenError):
+        client.invoke(model, "prompt")
+    assert model.calls == 3
+
+    # A successful trial closes it
+    clock.now[0] += 30
+    assert client.invoke(model, "prompt") == "ok"
+    assert breaker.remaining() == 0 and breaker.failures == 0
+
+
+def test_async_calls_share_the_retry_logic(clock):
+    model = FakeModel(APIError(429), "done")
+    assert asyncio.run(make_client().ainvoke(model, "prompt")) == "done"
+    assert clock.sleeps == [1.0]
+
+
+def _under_deadline(seconds, fn):
+    def run():
+        adaptive._deadline.set(time.monotonic() + seconds)
+        return fn()
+
+    return contextvars.copy_context().run(run)
+
+
+def test_capped_delay_under_a_deadline():
+    assert capped_delay(10.0) == 10.0
+    assert _under_deadline(60, lambda: capped_delay(5.0)) == 5.0
+    assert 0 < _under_deadline(2, lambda: capped_delay(10.0)) <= 2
+    assert _under_deadline(-1, lambda: capped_delay(10.0)) == 0.0
+
+
+def test_retries_stop_at_the_deadline(clock):
+    model = FakeModel(*[APIError(503)] * 5)
+    client = make_client()
+    with pytest.raises(TimeoutError):
+        _under_deadline(5, lambda: client.invoke(model, "prompt"))
+    # Slept 1s and 2s, then only the 2s left before the deadline
+    assert clock.sleeps == [1.0, 2.0, 2.0]
+    assert model.calls == 3
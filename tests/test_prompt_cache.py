@@ -0,0 +1,110 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from shared import prompt_cache
+from shared.prompt_cache import ContextCache
+
+PREFIX = "x" * 400  # ~100 tokens
+MODEL = "gemini-2.5-flash"
+
+
+class StubCaches:
+    """caches.create() of a genai client, recorded and optionally held open."""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.calls = []
+        self.release = {}  # display name prefix -> Event the create waits on
+        self._lock = threading.Lock()
+
+    def create(self, model, config):
+        with self._lock:
+            self.calls.append((model, config))
+            number = len(self.calls)
+        for text, event in self.release.items():
+            if config["contents"][0].startswith(text):
+                event.wait(5)
+        if self.fail:
+            raise RuntimeError("503 Service Unavailable")
+        return SimpleNamespace(name=f"cachedContents/{number}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: now[0])
+    return now
+
+
+def make_cache(caches, **kwargs):
+    kwargs.setdefault("min_tokens", 50)
+    kwargs.setdefault("ttl_seconds", 100)
+    return ContextCache(client=SimpleNamespace(caches=caches), **kwargs)
+
+
+def test_small_prefix_is_sent_inline():
+    caches = StubCaches()
+    assert make_cache(caches, min_tokens=1000).name_for(MODEL, PREFIX) is None
+    assert caches.calls == []
+
+
+def test_create_then_reuse(clock):
+    caches = StubCaches()
+    cache = make_cache(caches)
+    name = cache.name_for(MODEL, PREFIX)
+    assert name == "cachedContents/1"
+    assert cache.name_for(MODEL, PREFIX) == name
+    assert len(caches.calls) == 1
+    model, config = caches.calls[0]
+    assert model == MODEL
+    assert config["contents"] == [PREFIX]
+    assert config["ttl"] == "100s"
+
+
+def test_renewed_before_expiry(clock):
+    caches = StubCaches()
+    cache = make_cache(caches)
+    cache.name_for(MODEL, PREFIX)
+    clock[0] += 89
+    assert cache.name_for(MODEL, PREFIX) == "cachedContents/1"
+    clock[0] += 2  # past 90% of the TTL
+    assert cache.name_for(MODEL, PREFIX) == "cachedContents/2"
+
+
+def test_failed_create_is_not_retried_until_ttl(clock):
+    caches = StubCaches(fail=True)
+    cache = make_cache(caches)
+    assert cache.name_for(MODEL, PREFIX) is None
+    assert cache.name_for(MODEL, PREFIX) is None
+    assert len(caches.calls) == 1
+    clock[0] += 101
+    cache.name_for(MODEL, PREFIX)
+    assert len(caches.calls) == 2
+
+
+def test_slow_create_blocks_only_its_own_prefix():
+    caches = StubCaches()
+    cache = make_cache(caches)
+    slow_prefix = "s" + PREFIX
+    caches.release["s"] = threading.Event()
+
+    names = []
+    callers = [
+        threading.Thread(target=lambda: names.append(cache.name_for(MODEL, slow_prefix)))
+        for _ in range(3)
+    ]
+    for caller in callers:
+        caller.start()
+
+    # Another prefix is created while the slow one is still in flight
+    assert cache.name_for(MODEL, PREFIX) is not None
+    assert not names
+
+    caches.release["s"].set()
+    for caller in callers:
+        caller.join(5)
+    # The three callers shared one create
+    assert len(set(names)) == 1 and len(names) == 3
+    assert len(caches.calls) == 2